@@ -0,0 +1,13 @@
+"""Benchmarks for jsonrpcserver.
+
+Run offline from the root of the repository:
+
+    python -m benchmarks              # Every case, compared to baseline.json
+    python -m benchmarks -k batch     # Cases with "batch" in the name
+    python -m benchmarks --save benchmarks/baseline.json
+
+The baseline is from one machine, so compare runs on the same machine; to compare a
+change, save a baseline before it and run again after.
+
+    python -m benchmarks.allocations  # Allocations per result and response
+"""
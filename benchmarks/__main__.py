@@ -0,0 +1,87 @@
+"""Run the benchmarks. See the package docstring."""
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import json
+import platform
+import sys
+
+from .cases import get_cases
+from .harness import HEADER, format_row, measure
+
+BASELINE = Path(__file__).parent / "baseline.json"
+
+
+def load_baseline(path: Path) -> Dict[str, Dict[str, float]]:
+    """The stats of each case in a saved baseline, if there is one."""
+    if not path.exists():
+        return {}
+    cases: Dict[str, Dict[str, float]] = json.loads(path.read_text())["cases"]
+    return cases
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the cases, print the results, and compare them to the baseline."""
+    parser = ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument(
+        "-k", dest="keyword", help="Only run cases with this in the name"
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=1.0,
+        help="Seconds to spend timing each case (default 1)",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=BASELINE,
+        help="Baseline to compare to (default benchmarks/baseline.json)",
+    )
+    parser.add_argument("--save", type=Path, help="Save the results as a baseline")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        help="Exit with 1 if a case's requests/s drops by more than this percentage",
+    )
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    results: Dict[str, Dict[str, Any]] = {}
+    slower = []
+    print(HEADER + (f" {'change':>8}" if baseline else ""))
+    for case in get_cases():
+        if args.keyword and args.keyword not in case.name:
+            continue
+        stats = measure(case, args.min_time)
+        results[case.name] = stats._asdict()
+        previous = baseline.get(case.name)
+        print(format_row(case.name, stats, previous), flush=True)
+        if (
+            previous
+            and args.max_slowdown is not None
+            and stats.requests_per_second
+            < previous["requests_per_second"] * (1 - args.max_slowdown / 100)
+        ):
+            slower.append(case.name)
+
+    if args.save:
+        args.save.write_text(
+            json.dumps(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "cases": results,
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+    if slower:
+        print(f"Slower than the baseline: {', '.join(slower)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
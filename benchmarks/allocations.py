@@ -0,0 +1,90 @@
+"""Allocations per request, for the result and response of a request.
+
+Compares the two-object Eithers (a Right holding a SuccessResult, then a Right holding
+a SuccessResponse built from the result's _asdict) with the compact ones given by
+Success and to_response. Also gives the allocations of a whole dispatch.
+
+Counts the memory blocks still allocated after building many results, so only objects
+that are kept are counted.
+
+    python -m benchmarks.allocations
+"""
+from timeit import timeit
+from typing import Any, Callable, List
+import gc
+import sys
+
+from oslash.either import Right  # type: ignore
+
+from jsonrpcserver import Success, method
+from jsonrpcserver.dispatcher import to_response
+from jsonrpcserver.main import default_dispatcher
+from jsonrpcserver.request import Request
+from jsonrpcserver.response import SuccessResponse
+from jsonrpcserver.result import SuccessResult
+
+# pylint: disable=missing-function-docstring,protected-access
+
+COUNT = 100_000
+
+REQUEST = Request("ping", [], 1)
+
+
+@method
+def ping() -> Any:
+    return Success("pong")
+
+
+def blocks_per_call(func: Callable[[int], Any]) -> float:
+    """Blocks allocated by each call of func, kept by holding on to what it returns."""
+    kept: List[Any] = [None] * COUNT
+    gc.collect()
+    before = sys.getallocatedblocks()
+    for i in range(COUNT):
+        kept[i] = func(i)
+    gc.collect()
+    return (sys.getallocatedblocks() - before) / COUNT
+
+
+def old_result(i: int) -> Any:
+    return Right(SuccessResult(i))
+
+
+def new_result(i: int) -> Any:
+    return Success(i)
+
+
+def old_response(i: int) -> Any:
+    result = Right(SuccessResult(i))
+    return Right(SuccessResponse(**result._value._asdict(), id=REQUEST.id))
+
+
+def new_response(i: int) -> Any:
+    return to_response(REQUEST, Success(i))
+
+
+def dispatch(_: int) -> Any:
+    return default_dispatcher.dispatch_deserialized(
+        {"jsonrpc": "2.0", "method": "ping", "id": 1}
+    )
+
+
+CASES = [
+    ("result, before", old_result),
+    ("result, after", new_result),
+    ("result and response, before", old_response),
+    ("result and response, after", new_response),
+    ("dispatch", dispatch),
+]
+
+
+def main() -> None:
+    print(f"{'case':<30} {'blocks':>8} {'ns/call':>9}")
+    for name, func in CASES:
+        blocks = blocks_per_call(func)
+        seconds = timeit(lambda func=func: func(1_000), number=COUNT)  # type: ignore
+        print(f"{name:<30} {blocks:>8.2f} {seconds / COUNT * 1e9:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""The benchmark cases: each dispatch path, with the same methods and requests."""
+from typing import Any, Callable, Dict, List
+import json
+
+from jsonrpcserver import AsyncDispatcher, Dispatcher, Success, dispatch
+from jsonrpcserver.main import strict_validator
+from jsonrpcserver.result import Result
+from jsonrpcserver.utils import identity
+
+from .harness import Case
+
+# pylint: disable=missing-function-docstring,invalid-name
+
+
+def add(a: int, b: int) -> Result:
+    return Success(a + b)
+
+
+async def async_add(a: int, b: int) -> Result:
+    return Success(a + b)
+
+
+METHODS: Dict[str, Callable[..., Any]] = {"add": add}
+ASYNC_METHODS: Dict[str, Callable[..., Any]] = {"add": async_add}
+
+
+def request(id_: Any = 1, method: str = "add", params: Any = (1, 2)) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "method": method, "params": list(params), "id": id_}
+
+
+def notification() -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "method": "add", "params": [1, 2]}
+
+
+def batch(size: int) -> str:
+    return json.dumps([request(id_) for id_ in range(size)])
+
+
+SINGLE = json.dumps(request())
+NOTIFICATIONS = json.dumps([notification()] * 1000)
+ERRORS = {
+    "parse error": '{"jsonrpc": "2.0", "method"',
+    "invalid request": json.dumps({"jsonrpc": "2.0", "method": 1, "id": 1}),
+    "method not found": json.dumps(request(method="subtract")),
+    "invalid params": json.dumps(request(params=[1])),
+}
+SIZES = {"10": 10, "1k": 1000, "100k": 100_000}
+
+
+def sync_case(name: str, dispatcher: Dispatcher, body: str, requests: int) -> Case:
+    return Case(name, requests, lambda: dispatcher.dispatch(body))
+
+
+def async_case(
+    name: str, dispatcher: AsyncDispatcher, body: str, requests: int
+) -> Case:
+    return Case(name, requests, lambda: dispatcher.dispatch(body), is_async=True)
+
+
+def get_cases() -> List[Case]:
+    """The cases, with their request bodies. Built when run, as some are large."""
+    fast = Dispatcher(METHODS)
+    strict = Dispatcher(METHODS, validator=strict_validator)
+    unvalidated = Dispatcher(METHODS, validator=identity)
+    asynchronous = AsyncDispatcher(ASYNC_METHODS)
+    batches = {label: (batch(size), size) for label, size in SIZES.items()}
+    return [
+        sync_case("single", fast, SINGLE, 1),
+        Case("single, dispatch()", 1, lambda: dispatch(SINGLE, methods=METHODS)),
+        *[
+            sync_case(f"batch {label}", fast, body, size)
+            for label, (body, size) in batches.items()
+        ],
+        sync_case("notifications 1k", fast, NOTIFICATIONS, 1000),
+        *[sync_case(name, fast, body, 1) for name, body in ERRORS.items()],
+        sync_case("single, jsonschema", strict, SINGLE, 1),
+        sync_case("single, no validation", unvalidated, SINGLE, 1),
+        sync_case("batch 1k, jsonschema", strict, *batches["1k"]),
+        sync_case("batch 1k, no validation", unvalidated, *batches["1k"]),
+        async_case("async single", asynchronous, SINGLE, 1),
+        *[
+            async_case(f"async batch {label}", asynchronous, body, size)
+            for label, (body, size) in batches.items()
+        ],
+        async_case("async notifications 1k", asynchronous, NOTIFICATIONS, 1000),
+    ]
@@ -0,0 +1,98 @@
+"""Times benchmark cases with the timeit module, one call at a time, so as to give the
+latency percentiles as well as the throughput.
+"""
+from timeit import Timer, default_timer
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+import asyncio
+import gc
+
+
+class Case(NamedTuple):
+    """A benchmark case. run does one call, dispatching `requests` requests."""
+
+    name: str
+    requests: int
+    run: Callable[[], Any]
+    is_async: bool = False
+
+
+class Stats(NamedTuple):
+    """The results of timing a case. Latencies are per call, in seconds."""
+
+    calls: int
+    requests_per_second: float
+    p50: float
+    p99: float
+
+
+def percentile(times: List[float], percent: float) -> float:
+    """The nearest-rank percentile of sorted times."""
+    return times[min(len(times) - 1, int(len(times) * percent / 100))]
+
+
+def time_sync(run: Callable[[], Any], calls: int) -> List[float]:
+    """The time taken by each of a number of calls."""
+    # number=1 to time each call; timeit disables gc while timing, as with async below
+    return Timer(run).repeat(repeat=calls, number=1)
+
+
+def time_async(run: Callable[[], Awaitable[Any]], calls: int) -> List[float]:
+    """Async version of time_sync, timed in a new event loop."""
+
+    async def time_calls() -> List[float]:
+        times = []
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for _ in range(calls):
+                start = default_timer()
+                await run()
+                times.append(default_timer() - start)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return times
+
+    return asyncio.run(time_calls())
+
+
+def measure(case: Case, min_time: float, max_calls: int = 100_000) -> Stats:
+    """Call the case repeatedly for about min_time seconds, after a warm-up call, and
+    a few more to work out how many calls to time. At least five calls are timed.
+    """
+    time_calls = time_async if case.is_async else time_sync
+    time_calls(case.run, 1)
+    estimate = max(min(time_calls(case.run, 3)), 1e-9)
+    calls = max(5, min(max_calls, int(min_time / estimate)))
+    times = sorted(time_calls(case.run, calls))
+    return Stats(
+        calls=calls,
+        requests_per_second=case.requests * calls / sum(times),
+        p50=percentile(times, 50),
+        p99=percentile(times, 99),
+    )
+
+
+def format_time(seconds: float) -> str:
+    """A time in the largest unit it's at least one of."""
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.1f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def format_row(
+    name: str, stats: Stats, baseline: Optional[Dict[str, float]] = None
+) -> str:
+    """A row of the results table, with the change from the baseline if given."""
+    row = (
+        f"{name:<36} {stats.requests_per_second:>12,.0f}"
+        f" {format_time(stats.p50):>9} {format_time(stats.p99):>9}"
+    )
+    if baseline:
+        change = stats.requests_per_second / baseline["requests_per_second"] - 1
+        row += f" {change:>+8.1%}"
+    return row
+
+
+HEADER = f"{'case':<36} {'requests/s':>12} {'p50':>9} {'p99':>9}"
@@ -12,7 +12,7 @@ async def ping() -> Result:
 async def handle(request: web.Request) -> web.Response:
     """Handle aiohttp request"""
     return web.Response(
-        text=await async_dispatch(await request.text()), content_type="application/json"
+        text=await async_dispatch(await request.read()), content_type="application/json"
     )
 
 
@@ -16,7 +16,7 @@ async def main() -> None:
     """Handle AioZMQ request"""
     rep = await aiozmq.create_zmq_stream(zmq.REP, bind="tcp://*:5000")
     while True:
-        request = (await rep.read())[0].decode()
+        request = (await rep.read())[0]
         if response := (await async_dispatch(request)).encode():
             rep.write((response,))
 
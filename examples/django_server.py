@@ -13,6 +13,4 @@ def ping() -> Result:
 @csrf_exempt  # type: ignore
 def jsonrpc(request: HttpRequest) -> HttpResponse:
     """Handle Django request"""
-    return HttpResponse(
-        dispatch(request.body.decode()), content_type="application/json"
-    )
+    return HttpResponse(dispatch(request.body), content_type="application/json")
@@ -14,9 +14,7 @@ def ping() -> Result:
 @app.route("/", methods=["POST"])
 def index() -> Response:
     """Handle Flask request"""
-    return Response(
-        dispatch(request.get_data().decode()), content_type="application/json"
-    )
+    return Response(dispatch(request.get_data()), content_type="application/json")
 
 
 if __name__ == "__main__":
@@ -19,7 +19,7 @@ class TestHttpServer(BaseHTTPRequestHandler):
     def do_POST(self) -> None:  # pylint: disable=invalid-name
         """POST handler"""
         # Process request
-        request = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        request = self.rfile.read(int(self.headers["Content-Length"]))
         response = dispatch(request)
         # Return response
         self.send_response(200)
@@ -16,7 +16,7 @@ class MainHandler(web.RequestHandler):
 
     async def post(self) -> None:
         """Post"""
-        request = self.request.body.decode()
+        request = self.request.body
         response = await async_dispatch(request)
         if response:
             self.write(response)
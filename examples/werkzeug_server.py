@@ -13,7 +13,7 @@ def ping() -> Result:
 @Request.application
 def application(request: Request) -> Response:
     """Handle Werkzeug request"""
-    return Response(dispatch(request.data.decode()), 200, mimetype="application/json")
+    return Response(dispatch(request.data), 200, mimetype="application/json")
 
 
 if __name__ == "__main__":
@@ -14,5 +14,5 @@ def ping() -> Result:
 if __name__ == "__main__":
     socket.bind("tcp://*:5000")
     while True:
-        request = socket.recv().decode()
+        request = socket.recv()
         socket.send_string(dispatch(request))
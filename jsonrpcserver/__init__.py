@@ -1,28 +1,57 @@
 """Use __all__ so mypy considers these re-exported."""
 __all__ = [
+    "AsyncDispatcher",
+    "Dispatcher",
     "Error",
     "InvalidParams",
     "JsonRpcError",
     "Result",
     "Success",
     "async_dispatch",
+    "async_dispatch_as_completed",
+    "async_dispatch_iter",
+    "async_dispatch_stream",
+    "async_dispatch_to_bytes",
     "async_dispatch_to_response",
     "async_dispatch_to_serializable",
     "dispatch",
+    "dispatch_iter",
+    "dispatch_stream",
+    "dispatch_to_bytes",
     "dispatch_to_response",
     "dispatch_to_serializable",
+    "lazy_method",
+    "lazy_namespace",
+    "load_methods",
     "method",
     "serve",
+    "serve_async",
+    "set_timing_hook",
 ]
 
 
+from .async_server import serve_async
 from .async_main import (
+    AsyncDispatcher,
     dispatch as async_dispatch,
+    dispatch_as_completed as async_dispatch_as_completed,
+    dispatch_iter as async_dispatch_iter,
+    dispatch_stream as async_dispatch_stream,
+    dispatch_to_bytes as async_dispatch_to_bytes,
     dispatch_to_response as async_dispatch_to_response,
     dispatch_to_serializable as async_dispatch_to_serializable,
 )
 from .exceptions import JsonRpcError
-from .main import dispatch, dispatch_to_response, dispatch_to_serializable
-from .methods import method
+from .main import (
+    Dispatcher,
+    dispatch,
+    dispatch_iter,
+    dispatch_stream,
+    dispatch_to_bytes,
+    dispatch_to_response,
+    dispatch_to_serializable,
+)
+from .methods import lazy_method, lazy_namespace, load_methods, method
 from .result import Error, InvalidParams, Result, Success
 from .server import serve
+from .timing import set_timing_hook
@@ -1,14 +1,38 @@
 """Async version of dispatcher.py"""
+from collections import deque
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import copy_context
 from functools import partial
-from itertools import starmap
-from typing import Any, Callable, Iterable, Tuple, Union
+from inspect import isawaitable
+from itertools import islice, starmap
+from time import perf_counter
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
 import asyncio
 import logging
 
-from oslash.either import Left  # type: ignore
+from oslash.either import Left, Right  # type: ignore
 
 from .dispatcher import (
     Deserialized,
+    Deserializer,
+    Serialized,
+    call_in_worker,
     create_request,
     deserialize_request,
     extract_args,
@@ -21,23 +45,103 @@ from .dispatcher import (
     validate_request,
     validate_result,
 )
+from .cache import make_key
 from .exceptions import JsonRpcError
-from .methods import Method, Methods
+from .executors import discard_process_pool, get_process_pool, run_in_context
+from .metrics import Metrics
+from .methods import (
+    DEFAULT_OPTIONS,
+    EXECUTOR_PROCESS,
+    Method,
+    Methods,
+    get_args_check,
+    get_options,
+    get_plan,
+)
 from .request import Request
-from .result import Result, InternalErrorResult, ErrorResult
-from .response import Response, ServerErrorResponse
-from .utils import make_list
+from .result import (
+    ErrorResult,
+    InternalErrorResult,
+    InvalidParamsResult,
+    Result,
+    from_dict,
+)
+from .response import (
+    InvalidRequestResponse,
+    ParseErrorResponse,
+    Response,
+    ServerErrorResponse,
+    to_dict,
+)
+from .sentinels import NOCONTEXT, NOID
+from .streaming import AsyncReadable, StreamParser, async_parse_stream
+from .timing import (
+    STAGE_CALL,
+    STAGE_GET_METHOD,
+    STAGE_VALIDATE_ARGS,
+    TimingHook,
+    error_code,
+    timed,
+)
+from .utils import async_iter, async_json_array, identity, make_list
 
 logger = logging.getLogger(__name__)
 
+# A method's call path, built by compile_call
+AsyncCallPath = Callable[[Request], Awaitable[Result]]
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+# Calls to methods registered with coalesce=True that are in progress, keyed by event
+# loop, method and params
+in_flight: Dict[
+    Tuple[asyncio.AbstractEventLoop, Method, str], "asyncio.Task[Result]"
+] = {}
+
 # pylint: disable=missing-function-docstring,duplicate-code
+# The aiter and anext builtins are not available before Python 3.10.
+# pylint: disable=unnecessary-dunder-call
 
 
-async def call(request: Request, context: Any, method: Method) -> Result:
+async def call_in_process(
+    method: Method, args: List[Any], kwargs: Dict[str, Any]
+) -> Result:
+    pool = get_process_pool()
     try:
-        result = await method(
-            *extract_args(request, context), **extract_kwargs(request)
+        return from_dict(
+            await asyncio.wrap_future(pool.submit(call_in_worker, method, args, kwargs))
         )
+    except Exception as exc:  # pylint: disable=broad-except
+        if isinstance(exc, BrokenProcessPool):
+            discard_process_pool(pool)
+        logger.exception(exc)
+        return Left(InternalErrorResult(str(exc)))
+
+
+async def call_method(
+    method: Method,
+    args: List[Any],
+    kwargs: Dict[str, Any],
+    executor: Optional[Executor],
+) -> Result:
+    try:
+        if get_plan(method).coroutine:
+            result = await method(*args, **kwargs)
+        elif get_options(method).inline:
+            result = method(*args, **kwargs)
+        else:
+            # A regular function, call it in a thread so it doesn't block the loop. None
+            # is the loop's default executor.
+            result = await asyncio.get_running_loop().run_in_executor(
+                executor,
+                run_in_context,
+                copy_context(),
+                partial(method, *args, **kwargs),
+            )
+        # A regular function can return an awaitable, e.g. a wrapped async function
+        if isawaitable(result):
+            result = await result
         validate_result(result)
     except JsonRpcError as exc:
         return Left(ErrorResult(code=exc.code, message=exc.message, data=exc.data))
@@ -48,33 +152,350 @@ async def call(request: Request, context: Any, method: Method) -> Result:
     return result
 
 
+async def call(
+    request: Request,
+    context: Any,
+    method: Method,
+    executor: Optional[Executor] = None,
+) -> Result:
+    args, kwargs = extract_args(request, context), extract_kwargs(request)
+    if get_options(method).executor == EXECUTOR_PROCESS:
+        return await call_in_process(method, args, kwargs)
+    return await call_method(method, args, kwargs, executor)
+
+
+async def validate_and_call(
+    request: Request,
+    context: Any,
+    method: Method,
+    executor: Optional[Executor] = None,
+) -> Result:
+    valid = validate_args(request, context, method)
+    return (
+        valid
+        if isinstance(valid, Left)
+        else await call(
+            request,
+            context,
+            valid._value,  # pylint: disable=protected-access
+            executor,
+        )
+    )
+
+
+async def call_coalesced(
+    request: Request,
+    context: Any,
+    method: Method,
+    executor: Optional[Executor] = None,
+) -> Result:
+    # The call runs in its own task, so cancelling one of the requests waiting for it
+    # doesn't cancel it for the others
+    params_key = make_key(request.params)
+    if params_key is None:
+        return await validate_and_call(request, context, method, executor)
+    key = (asyncio.get_running_loop(), method, params_key)
+    try:
+        task = in_flight[key]
+    except KeyError:
+        task = in_flight[key] = asyncio.ensure_future(
+            validate_and_call(request, context, method, executor)
+        )
+        task.add_done_callback(lambda _: in_flight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def call_cached(
+    request: Request,
+    context: Any,
+    method: Method,
+    executor: Optional[Executor] = None,
+) -> Result:
+    options = get_options(method)
+    call_method_ = call_coalesced if options.coalesce else validate_and_call
+    if options.cache is None:
+        return await call_method_(request, context, method, executor)
+    key = make_key(request.params)
+    if key is None:
+        return await call_method_(request, context, method, executor)
+    result = options.cache.get(key)
+    if result is None:
+        result = await call_method_(request, context, method, executor)
+        if isinstance(result, Right):
+            options.cache.put(key, result)
+    return result
+
+
+def compile_call(
+    method: Method, context: Any, executor: Optional[Executor]
+) -> AsyncCallPath:
+    """Async version of dispatcher.compile_call."""
+    if get_options(method) != DEFAULT_OPTIONS:
+        return lambda request: call_cached(request, context, method, executor)
+    check = get_args_check(method)
+    prefix = [] if context is NOCONTEXT else [context]
+
+    async def call_direct(request: Request) -> Result:
+        params = request.params
+        args = (
+            (prefix + params if prefix else params)
+            if isinstance(params, list)
+            else prefix
+        )
+        kwargs = params if isinstance(params, dict) else {}
+        try:
+            check(args, kwargs)
+        except TypeError as exc:
+            return Left(InvalidParamsResult(str(exc)))
+        return await call_method(method, args, kwargs, executor)
+
+    return call_direct
+
+
+async def call_timed(
+    hook: TimingHook,
+    methods: Methods,
+    context: Any,
+    request: Request,
+    executor: Optional[Executor] = None,
+    metrics: Optional[Metrics] = None,
+) -> Result:
+    """Async version of dispatcher.call_timed."""
+    # pylint: disable=too-many-arguments
+    name = request.method
+    method = timed(hook, STAGE_GET_METHOD, name, get_method, methods, name)
+    if isinstance(method, Left):
+        return method
+    call_path = partial(
+        validate_and_call_timed,
+        hook,
+        context,
+        method._value,  # pylint: disable=protected-access
+        executor,
+    )
+    return await (
+        call_path(request)
+        if metrics is None
+        else metrics.observe_async(name, call_path, request)
+    )
+
+
+async def validate_and_call_timed(
+    hook: TimingHook,
+    context: Any,
+    method: Method,
+    executor: Optional[Executor],
+    request: Request,
+) -> Result:
+    name = request.method
+    options = get_options(method)
+    if options.cache is None and not options.coalesce:
+        valid = timed(
+            hook, STAGE_VALIDATE_ARGS, name, validate_args, request, context, method
+        )
+        if isinstance(valid, Left):
+            return valid
+        start = perf_counter()
+        result = await call(request, context, method, executor)
+    else:
+        start = perf_counter()
+        result = await call_cached(request, context, method, executor)
+    hook(STAGE_CALL, perf_counter() - start, name, error_code(result))
+    return result
+
+
 async def dispatch_request(
-    methods: Methods, context: Any, request: Request
+    methods: Methods,
+    context: Any,
+    request: Request,
+    executor: Optional[Executor] = None,
 ) -> Tuple[Request, Result]:
-    method = get_method(methods, request.method).bind(
-        partial(validate_args, request, context)
-    )
+    method = get_method(methods, request.method)
     return (
         request,
         method
         if isinstance(method, Left)
-        else await call(
-            request, context, method._value  # pylint: disable=protected-access
+        else await call_cached(
+            request,
+            context,
+            method._value,  # pylint: disable=protected-access
+            executor,
         ),
     )
 
 
+def request_dispatcher(
+    methods: Methods,
+    context: Any,
+    executor: Optional[Executor],
+    semaphore: Optional[asyncio.Semaphore],
+) -> Callable[[Request], Awaitable[Tuple[Request, Result]]]:
+    """The function to dispatch each request in a batch with."""
+
+    async def dispatch(request: Request) -> Tuple[Request, Result]:
+        if semaphore is None:
+            return await dispatch_request(methods, context, request, executor)
+        async with semaphore:
+            return await dispatch_request(methods, context, request, executor)
+
+    return dispatch
+
+
+def check_max_concurrency(max_concurrency: Optional[int]) -> None:
+    """Raise ValueError for a concurrency limit that allows nothing to run."""
+    if max_concurrency is not None and max_concurrency < 1:
+        raise ValueError("The concurrency limit must be at least 1")
+
+
+def unlimited(items: List[Any]) -> int:
+    """A concurrency limit that runs all the items at once. At least 1, even for no
+    items (an empty batch, with validation off).
+    """
+    return max(len(items), 1)
+
+
+async def gather_limited(
+    limit: int, func: Callable[[T], Awaitable[U]], items: List[T]
+) -> List[U]:
+    """Like asyncio.gather(*map(func, items)), but with at most limit calls running at
+    once. Only that many tasks are created, however many items there are. Results are in
+    the same order as the items.
+    """
+    if limit < 1:
+        raise ValueError("The concurrency limit must be at least 1")
+    results: List[Any] = [None] * len(items)
+    remaining = iter(enumerate(items))
+
+    async def worker() -> None:
+        for i, item in remaining:
+            results[i] = await func(item)
+
+    await asyncio.gather(*(worker() for _ in range(min(limit, len(items)))))
+    return results
+
+
+async def map_limited(
+    limit: int,
+    func: Callable[[T], Awaitable[U]],
+    items: Union[Iterable[T], AsyncIterable[T]],
+) -> AsyncIterator[U]:
+    """Like gather_limited, but gives each result as soon as it, and those before it, are
+    ready. Calls are started in order, keeping at most limit running. The items can be
+    an async iterable, which is only read as calls are started.
+    """
+    if limit < 1:
+        raise ValueError("The concurrency limit must be at least 1")
+    remaining = (
+        items if isinstance(items, AsyncIterable) else async_iter(items)
+    ).__aiter__()
+    running: Deque["asyncio.Future[U]"] = deque()
+
+    async def start(count: int) -> None:
+        for _ in range(count):
+            try:
+                item = await remaining.__anext__()
+            except StopAsyncIteration:
+                return
+            running.append(asyncio.ensure_future(func(item)))
+
+    try:
+        await start(limit)
+        while running:
+            result = await running.popleft()
+            await start(1)
+            yield result
+    finally:
+        # If the consumer stops early, don't leave calls running
+        for task in running:
+            task.cancel()
+
+
+async def as_completed_limited(
+    limit: int,
+    func: Callable[[T], Awaitable[U]],
+    items: Iterable[T],
+) -> AsyncIterator[U]:
+    """Like map_limited, but gives each result as soon as it's ready, regardless of
+    the order of the items. Calls are started in order, keeping at most limit running.
+    """
+    if limit < 1:
+        raise ValueError("The concurrency limit must be at least 1")
+    remaining = iter(items)
+    running: Set["asyncio.Future[U]"] = set()
+
+    def start(count: int) -> None:
+        for item in islice(remaining, count):
+            running.add(asyncio.ensure_future(func(item)))
+
+    try:
+        start(limit)
+        while running:
+            done, running = await asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED
+            )
+            start(len(done))
+            for task in done:
+                yield task.result()
+    finally:
+        # If the consumer stops early, don't leave calls running
+        for task in running:
+            task.cancel()
+
+
+async def dispatch_deserialized_iter(
+    methods: Methods,
+    context: Any,
+    deserialized: Deserialized,
+    executor: Optional[Executor] = None,
+    max_concurrency: Optional[int] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[Response]:
+    # pylint: disable=too-many-arguments
+    requests = list(map(create_request, make_list(deserialized)))
+    async for request, result in map_limited(
+        unlimited(requests) if max_concurrency is None else max_concurrency,
+        request_dispatcher(methods, context, executor, semaphore),
+        requests,
+    ):
+        if not_notification((request, result)):
+            yield to_response(request, result)
+
+
+async def dispatch_deserialized_as_completed(
+    methods: Methods,
+    context: Any,
+    deserialized: Deserialized,
+    executor: Optional[Executor] = None,
+    max_concurrency: Optional[int] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[Response]:
+    # pylint: disable=too-many-arguments
+    requests = list(map(create_request, make_list(deserialized)))
+    async for request, result in as_completed_limited(
+        unlimited(requests) if max_concurrency is None else max_concurrency,
+        request_dispatcher(methods, context, executor, semaphore),
+        requests,
+    ):
+        if not_notification((request, result)):
+            yield to_response(request, result)
+
+
 async def dispatch_deserialized(
     methods: Methods,
     context: Any,
     post_process: Callable[[Response], Iterable[Any]],
     deserialized: Deserialized,
+    executor: Optional[Executor] = None,
+    max_concurrency: Optional[int] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
 ) -> Union[Response, Iterable[Response], None]:
-    results = await asyncio.gather(
-        *(
-            dispatch_request(methods, context, r)
-            for r in map(create_request, make_list(deserialized))
-        )
+    # pylint: disable=too-many-arguments
+    dispatch = request_dispatcher(methods, context, executor, semaphore)
+    requests = list(map(create_request, make_list(deserialized)))
+    results = await (
+        asyncio.gather(*map(dispatch, requests))
+        if max_concurrency is None
+        else gather_limited(max_concurrency, dispatch, requests)
     )
     return extract_list(
         isinstance(deserialized, list),
@@ -87,12 +508,15 @@ async def dispatch_deserialized(
 
 async def dispatch_to_response_pure(
     *,
-    deserializer: Callable[[str], Deserialized],
+    deserializer: Deserializer,
     validator: Callable[[Deserialized], Deserialized],
     methods: Methods,
     context: Any,
     post_process: Callable[[Response], Iterable[Any]],
-    request: str,
+    request: Serialized,
+    executor: Optional[Executor] = None,
+    max_concurrency: Optional[int] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
 ) -> Union[Response, Iterable[Response], None]:
     try:
         result = deserialize_request(deserializer, request).bind(
@@ -106,8 +530,186 @@ async def dispatch_to_response_pure(
                 context,
                 post_process,
                 result._value,  # pylint: disable=protected-access
+                executor,
+                max_concurrency,
+                semaphore,
             )
         )
     except Exception as exc:  # pylint: disable=broad-except
         logger.exception(exc)
         return post_process(Left(ServerErrorResponse(str(exc), None)))
+
+
+async def catch_server_error(
+    responses: AsyncIterator[Response],
+) -> AsyncIterator[Response]:
+    try:
+        async for response in responses:
+            yield response
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.exception(exc)
+        yield Left(ServerErrorResponse(str(exc), None))
+
+
+async def encode_responses(
+    encoder: Callable[[Any], bytes], responses: AsyncIterator[Response]
+) -> AsyncIterator[bytes]:
+    """Async version of dispatcher.encode_responses."""
+    try:
+        async for response in responses:
+            yield encoder(to_dict(response))
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.exception(exc)
+        yield encoder(to_dict(Left(ServerErrorResponse(str(exc), None))))
+
+
+async def dispatch_to_iter_pure(
+    *,
+    deserializer: Deserializer,
+    validator: Callable[[Deserialized], Deserialized],
+    methods: Methods,
+    context: Any,
+    encoder: Callable[[Any], bytes],
+    request: Serialized,
+    executor: Optional[Executor] = None,
+    max_concurrency: Optional[int] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[bytes]:
+    try:
+        result = deserialize_request(deserializer, request).bind(
+            partial(validate_request, validator)
+        )
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.exception(exc)
+        result = Left(ServerErrorResponse(str(exc), None))
+    if isinstance(result, Left):
+        yield encoder(to_dict(result))
+        return
+    deserialized = result._value  # pylint: disable=protected-access
+    encoded = encode_responses(
+        encoder,
+        dispatch_deserialized_iter(
+            methods, context, deserialized, executor, max_concurrency, semaphore
+        ),
+    )
+    async for chunk in (
+        async_json_array(encoded) if isinstance(deserialized, list) else encoded
+    ):
+        yield chunk
+
+
+async def dispatch_as_completed_pure(
+    *,
+    deserializer: Deserializer,
+    validator: Callable[[Deserialized], Deserialized],
+    methods: Methods,
+    context: Any,
+    request: Serialized,
+    executor: Optional[Executor] = None,
+    max_concurrency: Optional[int] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[Response]:
+    try:
+        result = deserialize_request(deserializer, request).bind(
+            partial(validate_request, validator)
+        )
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.exception(exc)
+        result = Left(ServerErrorResponse(str(exc), None))
+    if isinstance(result, Left):
+        yield result
+        return
+    async for response in catch_server_error(
+        dispatch_deserialized_as_completed(
+            methods,
+            context,
+            result._value,  # pylint: disable=protected-access
+            executor,
+            max_concurrency,
+            semaphore,
+        )
+    ):
+        yield response
+
+
+async def catch_parse_error(
+    first: Any, values: AsyncIterator[Any]
+) -> AsyncIterator[Any]:
+    yield first
+    try:
+        async for value in values:
+            yield value
+    # JSONDecodeError and UnicodeDecodeError
+    except ValueError as exc:
+        yield Left(ParseErrorResponse(str(exc)))
+
+
+async def dispatch_streamed(
+    validator: Callable[[Deserialized], Deserialized],
+    dispatch: Callable[[Request], Awaitable[Tuple[Request, Result]]],
+    value: Any,
+) -> Optional[Response]:
+    if isinstance(value, Left):
+        return value  # A parse error, from catch_parse_error
+    if not isinstance(value, dict) or isinstance(
+        validate_request(validator, value), Left
+    ):
+        return Left(InvalidRequestResponse("The request failed schema validation"))
+    request, result = await dispatch(create_request(value))
+    return None if request.id is NOID else to_response(request, result)
+
+
+async def dispatch_stream_pure(
+    *,
+    validator: Callable[[Deserialized], Deserialized],
+    methods: Methods,
+    context: Any,
+    encoder: Callable[[Any], bytes],
+    stream: Union[AsyncReadable, AsyncIterable[bytes]],
+    chunk_size: int,
+    max_concurrency: int,
+    executor: Optional[Executor] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[bytes]:
+    # pylint: disable=too-many-arguments,too-many-locals
+    parser = StreamParser()
+    values = async_parse_stream(parser, stream, chunk_size)
+    try:
+        first = await values.__anext__()
+    except StopAsyncIteration:  # An empty batch
+        yield encoder(
+            to_dict(
+                Left(InvalidRequestResponse("The request failed schema validation"))
+            )
+        )
+        return
+    except ValueError as exc:
+        yield encoder(to_dict(Left(ParseErrorResponse(str(exc)))))
+        return
+    if not parser.is_batch:
+        async for chunk in dispatch_to_iter_pure(
+            deserializer=identity,
+            validator=validator,
+            methods=methods,
+            context=context,
+            encoder=encoder,
+            request=first,
+            executor=executor,
+            semaphore=semaphore,
+        ):
+            yield chunk
+        return
+    # Requests are read from the stream only as calls finish, so at most max_concurrency
+    # of them are held at once
+    responses = map_limited(
+        max_concurrency,
+        partial(
+            dispatch_streamed,
+            validator,
+            request_dispatcher(methods, context, executor, semaphore),
+        ),
+        catch_parse_error(first, values),
+    )
+    encoded = encode_responses(encoder, (r async for r in responses if r is not None))
+    async for chunk in async_json_array(encoded):
+        yield chunk
@@ -1,36 +1,376 @@
-"""Async version of main.py. The public async functions."""
+"""Async version of main.py. The public async functions.
+
+Regular (non-async) methods are called in a thread pool, so they don't block the event
+loop, unless registered with @method(inline=True). The executor and max_workers
+options choose the thread pool; the default is the event loop's default executor.
+
+The requests in a batch are dispatched concurrently. To limit how many methods run at
+once, pass max_concurrency (a limit for each batch) and/or semaphore (an
+asyncio.Semaphore shared between calls, for a limit across all requests).
+
+The dispatch functions use an AsyncDispatcher, which can also be used directly.
+"""
+from concurrent.futures import Executor
+from functools import partial
+from operator import is_
+import asyncio
 import json
-from typing import Any, Callable, Dict, Iterable, List, Optional, Union, cast
-
-from .async_dispatcher import dispatch_to_response_pure
-from .dispatcher import Deserialized
-from .main import default_validator, default_deserializer
-from .methods import Methods, global_methods
-from .response import Response, to_serializable
-from .sentinels import NOCONTEXT
+import logging
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
+
+from oslash.either import Left, Right  # type: ignore
+
+from .async_dispatcher import (
+    AsyncCallPath,
+    call_timed,
+    check_max_concurrency,
+    compile_call,
+    dispatch_as_completed_pure,
+    dispatch_stream_pure,
+    dispatch_to_iter_pure,
+    gather_limited,
+)
+from .dispatcher import (
+    Deserialized,
+    Deserializer,
+    Serialized,
+    create_request,
+    deserialize_request,
+    deserialize_timed,
+    to_response,
+    validate_request,
+)
+from .executors import get_thread_pool
+from .main import default_deserializer, default_encoder, default_validator
+from .methods import Method, Methods, global_methods
+from .metrics import Metrics
+from .request import Request
+from .response import Response, ServerErrorResponse, to_dict, to_serializable
+from .result import MethodNotFoundResult, Result
+from .sentinels import NOCONTEXT, NOID
+from .streaming import AsyncReadable
+from .timing import STAGE_SERIALIZE, TimingHook, get_timing_hook, timed
+from .tracing import (
+    Span,
+    Tracer,
+    extract_context,
+    set_result,
+    start_batch_span,
+    start_call_span,
+)
+from . import timing
 from .utils import identity
 
+logger = logging.getLogger(__name__)
 
 # pylint: disable=missing-function-docstring,duplicate-code
 
 
+class AsyncDispatcher:
+    """Async version of main.Dispatcher.
+
+    Args:
+        max_concurrency: The most methods to run at once for each batch.
+        semaphore: Shared by all requests through this dispatcher, to limit how many
+            methods run at once across them.
+        The rest: The same as main.Dispatcher.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        methods: Optional[Methods] = None,
+        *,
+        context: Any = NOCONTEXT,
+        deserializer: Deserializer = default_deserializer,
+        validator: Callable[[Deserialized], Deserialized] = default_validator,
+        serializer: Callable[[Any], str] = json.dumps,
+        executor: Optional[Executor] = None,
+        max_workers: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        timing_hook: Optional[TimingHook] = None,
+        metrics: Optional[Metrics] = None,
+        tracer: Optional[Tracer] = None,
+        trace_context_field: Optional[str] = None,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        check_max_concurrency(max_concurrency)
+        self.methods = global_methods if methods is None else methods
+        self.context = context
+        self.deserializer = deserializer
+        self.validator = validator
+        self.serializer = serializer
+        self.executor = (
+            get_thread_pool(max_workers)
+            if executor is None and max_workers is not None
+            else executor
+        )
+        self.max_concurrency = max_concurrency
+        self.semaphore = semaphore
+        self.timing_hook = timing_hook
+        self.metrics = metrics
+        self.tracer = tracer
+        self.trace_context_field = trace_context_field
+        self.table: Dict[str, Tuple[Method, AsyncCallPath]] = {}
+
+    async def call(self, request: Request) -> Result:
+        try:
+            method = self.methods[request.method]
+        except KeyError:
+            return Left(MethodNotFoundResult(request.method))
+        entry = self.table.get(request.method)
+        if entry is None or entry[0] is not method:
+            entry = self.table[request.method] = (
+                method,
+                compile_call(method, self.context, self.executor),
+            )
+        call_path = entry[1]
+        if self.metrics is not None:
+            call_path = partial(self.metrics.observe_async, request.method, call_path)
+        if self.semaphore is None:
+            return await call_path(request)
+        async with self.semaphore:
+            return await call_path(request)
+
+    async def call_timed(self, hook: TimingHook, request: Request) -> Result:
+        args = (hook, self.methods, self.context, request, self.executor, self.metrics)
+        if self.semaphore is None:
+            return await call_timed(*args)
+        async with self.semaphore:
+            return await call_timed(*args)
+
+    async def dispatch_deserialized(
+        self, request: Dict[str, Any], hook: Optional[TimingHook] = None
+    ) -> Optional[Response]:
+        request_ = create_request(request)
+        result = await (
+            self.call(request_) if hook is None else self.call_timed(hook, request_)
+        )
+        return None if request_.id is NOID else to_response(request_, result)
+
+    async def dispatch_deserialized_traced(
+        self,
+        tracer: Tracer,
+        hook: Optional[TimingHook],
+        batch: Optional[Span],
+        item: Tuple[Optional[int], Dict[str, Any]],
+    ) -> Optional[Response]:
+        index, request = item
+        request_, parent = extract_context(
+            tracer, self.trace_context_field, create_request(request)
+        )
+        span = start_call_span(
+            tracer, request_, batch if parent is None else parent, index
+        )
+        try:
+            result = await (
+                self.call(request_) if hook is None else self.call_timed(hook, request_)
+            )
+            set_result(span, result)
+        finally:
+            span.end()
+        return None if request_.id is NOID else to_response(request_, result)
+
+    async def dispatch_traced(
+        self,
+        tracer: Tracer,
+        hook: Optional[TimingHook],
+        deserialized: Deserialized,
+        post_process: Callable[[Response], Any],
+    ) -> Union[Response, List[Response], None]:
+        if not isinstance(deserialized, list):
+            response = await self.dispatch_deserialized_traced(
+                tracer, hook, None, (None, deserialized)
+            )
+            return None if response is None else post_process(response)
+        batch = start_batch_span(tracer, len(deserialized))
+        try:
+            dispatch_one = partial(
+                self.dispatch_deserialized_traced, tracer, hook, batch
+            )
+            responses = await (
+                asyncio.gather(*map(dispatch_one, enumerate(deserialized)))
+                if self.max_concurrency is None
+                else gather_limited(
+                    self.max_concurrency, dispatch_one, list(enumerate(deserialized))
+                )
+            )
+            return [post_process(r) for r in responses if r is not None] or None
+        finally:
+            batch.end()
+
+    async def dispatch_to_response(
+        self, request: Serialized, post_process: Callable[[Response], Any] = identity
+    ) -> Union[Response, List[Response], None]:
+        # pylint: disable=protected-access
+        hook = timing.timing_hook if self.timing_hook is None else self.timing_hook
+        try:
+            if hook is None:
+                result = deserialize_request(self.deserializer, request)
+                if isinstance(result, Right):
+                    result = validate_request(self.validator, result._value)
+            else:
+                result = deserialize_timed(
+                    hook, self.deserializer, self.validator, request
+                )
+            if isinstance(result, Left):
+                return post_process(result)
+            deserialized = result._value
+            if self.tracer is not None:
+                return await self.dispatch_traced(
+                    self.tracer, hook, deserialized, post_process
+                )
+            dispatch_one: Callable[
+                [Dict[str, Any]], Awaitable[Optional[Response]]
+            ] = self.dispatch_deserialized
+            if hook is not None:
+                dispatch_one = partial(self.dispatch_deserialized, hook=hook)
+            if isinstance(deserialized, list):
+                responses = await (
+                    asyncio.gather(*map(dispatch_one, deserialized))
+                    if self.max_concurrency is None
+                    else gather_limited(
+                        self.max_concurrency, dispatch_one, deserialized
+                    )
+                )
+                return [post_process(r) for r in responses if r is not None] or None
+            response = await dispatch_one(deserialized)
+            return None if response is None else post_process(response)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception(exc)
+            return post_process(Left(ServerErrorResponse(str(exc), None)))
+
+    async def dispatch_to_serializable(
+        self, request: Serialized
+    ) -> Union[Dict[str, Any], List[Dict[str, Any]], None]:
+        return cast(
+            Union[Dict[str, Any], List[Dict[str, Any]], None],
+            await self.dispatch_to_response(request, to_dict),
+        )
+
+    async def dispatch(self, request: Serialized) -> str:
+        response = await self.dispatch_to_serializable(request)
+        if response is None:
+            return ""
+        hook = get_timing_hook(self.timing_hook)
+        return (
+            self.serializer(response)
+            if hook is None
+            else timed(hook, STAGE_SERIALIZE, None, self.serializer, response)
+        )
+
+
+default_dispatcher = AsyncDispatcher()
+DEFAULT_SETTINGS = (
+    None,
+    NOCONTEXT,
+    default_deserializer,
+    default_validator,
+    None,
+    None,
+    None,
+    None,
+    None,
+    None,
+    None,
+    None,
+)
+
+
+def get_dispatcher(
+    methods: Optional[Methods],
+    *,
+    context: Any,
+    deserializer: Deserializer,
+    validator: Callable[[Deserialized], Deserialized],
+    executor: Optional[Executor],
+    max_workers: Optional[int],
+    max_concurrency: Optional[int],
+    semaphore: Optional[asyncio.Semaphore],
+    timing_hook: Optional[TimingHook],
+    metrics: Optional[Metrics],
+    tracer: Optional[Tracer],
+    trace_context_field: Optional[str],
+) -> AsyncDispatcher:
+    # pylint: disable=too-many-arguments
+    settings = (
+        methods,
+        context,
+        deserializer,
+        validator,
+        executor,
+        max_workers,
+        max_concurrency,
+        semaphore,
+        timing_hook,
+        metrics,
+        tracer,
+        trace_context_field,
+    )
+    if all(map(is_, settings, DEFAULT_SETTINGS)):
+        return default_dispatcher
+    return AsyncDispatcher(
+        methods,
+        context=context,
+        deserializer=deserializer,
+        validator=validator,
+        executor=executor,
+        max_workers=max_workers,
+        max_concurrency=max_concurrency,
+        semaphore=semaphore,
+        timing_hook=timing_hook,
+        metrics=metrics,
+        tracer=tracer,
+        trace_context_field=trace_context_field,
+    )
+
+
 async def dispatch_to_response(
-    request: str,
+    request: Serialized,
     methods: Optional[Methods] = None,
     *,
     context: Any = NOCONTEXT,
-    deserializer: Callable[[str], Deserialized] = default_deserializer,
+    deserializer: Deserializer = default_deserializer,
     validator: Callable[[Deserialized], Deserialized] = default_validator,
     post_process: Callable[[Response], Any] = identity,
+    executor: Optional[Executor] = None,
+    max_workers: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    timing_hook: Optional[TimingHook] = None,
+    metrics: Optional[Metrics] = None,
+    tracer: Optional[Tracer] = None,
+    trace_context_field: Optional[str] = None,
 ) -> Union[Response, Iterable[Response], None]:
-    return await dispatch_to_response_pure(
+    return await get_dispatcher(
+        methods,
+        context=context,
         deserializer=deserializer,
         validator=validator,
-        post_process=post_process,
-        context=context,
-        methods=global_methods if methods is None else methods,
-        request=request,
-    )
+        executor=executor,
+        max_workers=max_workers,
+        max_concurrency=max_concurrency,
+        semaphore=semaphore,
+        timing_hook=timing_hook,
+        metrics=metrics,
+        tracer=tracer,
+        trace_context_field=trace_context_field,
+    ).dispatch_to_response(request, post_process)
 
 
 async def dispatch_to_serializable(
@@ -50,7 +390,140 @@ async def dispatch_to_json(
     **kwargs: Any,
 ) -> str:
     response = await dispatch_to_serializable(*args, **kwargs)
-    return "" if response is None else serializer(response)
+    if response is None:
+        return ""
+    hook = get_timing_hook(kwargs.get("timing_hook"))
+    return (
+        serializer(response)
+        if hook is None
+        else timed(hook, STAGE_SERIALIZE, None, serializer, response)
+    )
+
+
+async def dispatch_to_bytes(
+    *args: Any,
+    encoder: Callable[[Any], bytes] = default_encoder,
+    **kwargs: Any,
+) -> bytes:
+    response = await dispatch_to_serializable(*args, **kwargs)
+    if response is None:
+        return b""
+    hook = get_timing_hook(kwargs.get("timing_hook"))
+    return (
+        encoder(response)
+        if hook is None
+        else timed(hook, STAGE_SERIALIZE, None, encoder, response)
+    )
+
+
+def dispatch_iter(
+    request: Serialized,
+    methods: Optional[Methods] = None,
+    *,
+    context: Any = NOCONTEXT,
+    deserializer: Deserializer = default_deserializer,
+    validator: Callable[[Deserialized], Deserialized] = default_validator,
+    encoder: Callable[[Any], bytes] = default_encoder,
+    executor: Optional[Executor] = None,
+    max_workers: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[bytes]:
+    check_max_concurrency(max_concurrency)
+    return dispatch_to_iter_pure(
+        deserializer=deserializer,
+        validator=validator,
+        encoder=encoder,
+        context=context,
+        methods=global_methods if methods is None else methods,
+        request=request,
+        executor=(
+            get_thread_pool(max_workers)
+            if executor is None and max_workers is not None
+            else executor
+        ),
+        max_concurrency=max_concurrency,
+        semaphore=semaphore,
+    )
+
+
+def dispatch_as_completed(
+    request: Serialized,
+    methods: Optional[Methods] = None,
+    *,
+    context: Any = NOCONTEXT,
+    deserializer: Deserializer = default_deserializer,
+    validator: Callable[[Deserialized], Deserialized] = default_validator,
+    executor: Optional[Executor] = None,
+    max_workers: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[Response]:
+    """Takes a JSON-RPC request and dispatches it to method(s), yielding each Response
+    as soon as its method finishes.
+
+    The responses in a batch are yielded in the order they finish, not the order of
+    the requests - the spec allows either, and the client matches them up by id. So a
+    streaming transport can send fast responses without waiting for slow ones. Nothing
+    is yielded for notifications, and a request that can't be parsed or is invalid
+    yields one error response.
+
+    Args: The same as dispatch_to_response.
+    """
+    check_max_concurrency(max_concurrency)
+    return dispatch_as_completed_pure(
+        deserializer=deserializer,
+        validator=validator,
+        context=context,
+        methods=global_methods if methods is None else methods,
+        request=request,
+        executor=(
+            get_thread_pool(max_workers)
+            if executor is None and max_workers is not None
+            else executor
+        ),
+        max_concurrency=max_concurrency,
+        semaphore=semaphore,
+    )
+
+
+def dispatch_stream(
+    stream: Union[AsyncReadable, AsyncIterable[bytes]],
+    methods: Optional[Methods] = None,
+    *,
+    context: Any = NOCONTEXT,
+    validator: Callable[[Deserialized], Deserialized] = default_validator,
+    encoder: Callable[[Any], bytes] = default_encoder,
+    chunk_size: int = 65536,
+    executor: Optional[Executor] = None,
+    max_workers: Optional[int] = None,
+    max_concurrency: int = 100,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[bytes]:
+    """Reads the request from an async stream - an object with an async read method
+    such as asyncio.StreamReader, or an async iterable of bytes. See
+    main.dispatch_stream.
+
+    The requests in a batch are dispatched concurrently as they're read, with at most
+    max_concurrency running at once. Requests are only read from the stream as earlier
+    ones finish, which bounds memory use.
+    """
+    check_max_concurrency(max_concurrency)
+    return dispatch_stream_pure(
+        validator=validator,
+        encoder=encoder,
+        context=context,
+        methods=global_methods if methods is None else methods,
+        stream=stream,
+        chunk_size=chunk_size,
+        executor=(
+            get_thread_pool(max_workers)
+            if executor is None and max_workers is not None
+            else executor
+        ),
+        max_concurrency=max_concurrency,
+        semaphore=semaphore,
+    )
 
 
 dispatch = dispatch_to_json
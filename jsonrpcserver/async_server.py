@@ -0,0 +1,413 @@
+"""An asyncio JSON-RPC server, with a minimal HTTP/1.1 implementation.
+
+Each connection is handled by a coroutine, so an idle connection costs little more
+than its socket. Connections are kept alive between requests, and pipelined requests
+are dispatched concurrently but answered in the order they were received.
+
+The memory used by each connection is bounded: the request head by max_header_size,
+the body by max_request_size, and the requests in progress by max_pipeline - once
+that many are waiting to be answered, no more are read until a response has been
+written. A client that's slow to send a request, or to read its response, is
+disconnected after the timeout.
+"""
+from http import HTTPStatus
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Union
+import asyncio
+import logging
+
+from .async_main import dispatch_to_bytes
+from .metrics import PROMETHEUS_CONTENT_TYPE, Metrics
+from .server import DEFAULT_KEEP_ALIVE_TIMEOUT, DEFAULT_MAX_REQUEST_SIZE
+
+DEFAULT_MAX_HEADER_SIZE = 64 * 1024  # Bytes
+DEFAULT_MAX_PIPELINE = 16  # Requests read ahead of their responses
+DEFAULT_TIMEOUT = 30.0  # Seconds
+
+logger = logging.getLogger(__name__)
+
+
+class HttpError(Exception):
+    """A request that can't be handled. It's answered with the status, and the
+    connection is closed.
+    """
+
+    def __init__(self, status: HTTPStatus) -> None:
+        super().__init__(status)
+        self.status = status
+
+
+class HttpRequest(NamedTuple):
+    """A request read from a connection."""
+
+    method: str
+    path: str
+    version: str
+    headers: Dict[str, str]  # The names are lowercase
+    body: bytes
+    keep_alive: bool
+
+
+def status_line(status: HTTPStatus) -> bytes:
+    """The first line of a response."""
+    return f"HTTP/1.1 {status.value} {status.phrase}\r\n".encode()
+
+
+def connection_header(request: HttpRequest) -> bytes:
+    """The Connection header of the response to a request, saying whether the
+    connection is kept open. HTTP/1.1 keeps it open unless told otherwise, and
+    HTTP/1.0 closes it.
+    """
+    if not request.keep_alive:
+        return b"Connection: close\r\n"
+    return b"Connection: keep-alive\r\n" if request.version == "HTTP/1.0" else b""
+
+
+def response_bytes(
+    status: HTTPStatus, body: bytes, content_type: str, request: HttpRequest
+) -> bytes:
+    """A complete response to the request."""
+    return b"".join(
+        (
+            status_line(status),
+            f"Content-Type: {content_type}\r\n".encode(),
+            f"Content-Length: {len(body)}\r\n".encode(),
+            connection_header(request),
+            b"\r\n",
+            body,
+        )
+    )
+
+
+def error_response(status: HTTPStatus) -> bytes:
+    """A response with no body, closing the connection."""
+    return status_line(status) + b"Content-Length: 0\r\nConnection: close\r\n\r\n"
+
+
+def no_content(request: HttpRequest) -> bytes:
+    """The response to a notification."""
+    return status_line(HTTPStatus.NO_CONTENT) + connection_header(request) + b"\r\n"
+
+
+def empty_response(status: HTTPStatus, request: HttpRequest) -> bytes:
+    """A response with no body, keeping the connection open if the request asked to."""
+    return (
+        status_line(status)
+        + b"Content-Length: 0\r\n"
+        + connection_header(request)
+        + b"\r\n"
+    )
+
+
+def parse_head(head: bytes) -> HttpRequest:
+    """Parse the request line and headers. The body is read later.
+
+    Raises: HttpError if the head is malformed.
+    """
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, path, version = lines[0].split(" ")
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST) from None
+    if version not in ("HTTP/1.0", "HTTP/1.1"):
+        raise HttpError(HTTPStatus.HTTP_VERSION_NOT_SUPPORTED)
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, colon, value = line.partition(":")
+        if not colon or not name or name != name.strip():
+            raise HttpError(HTTPStatus.BAD_REQUEST)
+        headers[name.lower()] = value.strip()
+    connection = headers.get("connection", "").lower()
+    return HttpRequest(
+        method,
+        path,
+        version,
+        headers,
+        b"",
+        connection != "close" if version == "HTTP/1.1" else connection == "keep-alive",
+    )
+
+
+def content_length(request: HttpRequest, max_request_size: int) -> int:
+    """The length of the body.
+
+    Raises: HttpError if the length is missing, invalid or too large.
+    """
+    if "transfer-encoding" in request.headers:
+        raise HttpError(HTTPStatus.LENGTH_REQUIRED)
+    value = request.headers.get("content-length")
+    if value is None:
+        if request.method == "POST":
+            raise HttpError(HTTPStatus.LENGTH_REQUIRED)
+        return 0
+    # The head is decoded as latin-1, which has digits that aren't ASCII, such as "²"
+    if not (value.isascii() and value.isdigit()):
+        raise HttpError(HTTPStatus.BAD_REQUEST)
+    length = int(value)
+    if length > max_request_size:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    return length
+
+
+async def settled(task: Optional["asyncio.Future[None]"]) -> None:
+    """Wait for a task writing a response to finish, however it finishes."""
+    if task is not None:
+        await asyncio.wait({task})
+
+
+def deadline(writer: asyncio.StreamWriter, timeout: float) -> asyncio.TimerHandle:
+    """Abort the connection unless the returned handle is cancelled within the
+    timeout. Cheaper than asyncio.wait_for, which starts a task each time.
+    """
+    return asyncio.get_running_loop().call_later(timeout, writer.transport.abort)
+
+
+class ConnectionHandler:
+    """Handles the connections to a server. See start_server for the arguments."""
+
+    def __init__(
+        self,
+        metrics: Optional[Metrics],
+        metrics_path: str,
+        max_request_size: int,
+        max_pipeline: int,
+        keep_alive_timeout: float,
+        timeout: float,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        self.metrics = metrics
+        self.metrics_path = metrics_path
+        self.max_request_size = max_request_size
+        self.max_pipeline = max_pipeline
+        self.keep_alive_timeout = keep_alive_timeout
+        self.timeout = timeout
+
+    async def __call__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        pipeline = asyncio.Semaphore(self.max_pipeline)
+        # The task writing the latest response. Each waits for the one before.
+        last: Optional["asyncio.Future[None]"] = None
+        try:
+            # A failed write aborts the connection
+            while not writer.transport.is_closing():
+                await pipeline.acquire()
+                try:
+                    request = await self.read_request(reader, writer, last)
+                except HttpError as exc:
+                    last = self.respond(
+                        writer, pipeline, last, error_response(exc.status)
+                    )
+                    break
+                except ConnectionError:
+                    break
+                if request is None:
+                    break
+                last = self.respond(writer, pipeline, last, self.handle(request))
+                if not request.keep_alive:
+                    break
+            await settled(last)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        last: Optional["asyncio.Future[None]"],
+    ) -> Optional[HttpRequest]:
+        """Read the next request, or None at the end of the connection - including
+        when it's aborted because it was idle for too long, or the request took too
+        long to receive.
+
+        Raises: HttpError
+        """
+        cancel_idle = self.idle_deadline(writer, last)
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE) from None
+        finally:
+            cancel_idle()
+        request = parse_head(head)
+        length = content_length(request, self.max_request_size)
+        if request.headers.get("expect", "").lower() == "100-continue":
+            await settled(last)  # Keep the responses in order
+            writer.write(status_line(HTTPStatus.CONTINUE) + b"\r\n")
+        timer = deadline(writer, self.timeout)
+        try:
+            body = await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            return None
+        finally:
+            timer.cancel()
+        return request._replace(body=body)
+
+    def idle_deadline(
+        self, writer: asyncio.StreamWriter, last: Optional["asyncio.Future[None]"]
+    ) -> Callable[[], None]:
+        """Abort the connection if it's idle for the keep-alive timeout. The time is
+        counted from when the last response was written, so waiting for a slow method
+        doesn't count as idle.
+
+        Returns: A function cancelling the deadline.
+        """
+        timer: Optional[asyncio.TimerHandle] = None
+
+        def start(_: object = None) -> None:
+            nonlocal timer
+            timer = deadline(writer, self.keep_alive_timeout)
+
+        if last is None or last.done():
+            start()
+        else:
+            last.add_done_callback(start)
+
+        def cancel() -> None:
+            if last is not None:
+                last.remove_done_callback(start)
+            if timer is not None:
+                timer.cancel()
+
+        return cancel
+
+    def respond(
+        self,
+        writer: asyncio.StreamWriter,
+        pipeline: asyncio.Semaphore,
+        last: Optional["asyncio.Future[None]"],
+        response: Union[bytes, Awaitable[bytes]],
+    ) -> "asyncio.Future[None]":
+        """Start a task writing the response once the ones before it are written."""
+        return asyncio.ensure_future(self.write(writer, pipeline, last, response))
+
+    async def write(
+        self,
+        writer: asyncio.StreamWriter,
+        pipeline: asyncio.Semaphore,
+        last: Optional["asyncio.Future[None]"],
+        response: Union[bytes, Awaitable[bytes]],
+    ) -> None:
+        """Write the response, after the one before it. If that fails, the connection
+        is aborted.
+        """
+        try:
+            if not isinstance(response, bytes):
+                response = await response
+            await settled(last)
+            if writer.transport.is_closing():
+                return  # An earlier response failed
+            writer.write(response)
+            # Usually the response was sent straight away, with nothing to drain
+            if writer.transport.get_write_buffer_size():
+                timer = deadline(writer, self.timeout)
+                try:
+                    await writer.drain()
+                finally:
+                    timer.cancel()
+        except ConnectionError:
+            writer.transport.abort()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Error writing a response")
+            writer.transport.abort()
+        finally:
+            pipeline.release()
+
+    async def handle(self, request: HttpRequest) -> bytes:
+        """The response to a request."""
+        if request.method == "POST":
+            response = await dispatch_to_bytes(request.body, metrics=self.metrics)
+            if not response:
+                return no_content(request)
+            return response_bytes(HTTPStatus.OK, response, "application/json", request)
+        if request.method == "GET":
+            if self.metrics is None or request.path != self.metrics_path:
+                return empty_response(HTTPStatus.NOT_FOUND, request)
+            return response_bytes(
+                HTTPStatus.OK,
+                self.metrics.to_prometheus().encode(),
+                PROMETHEUS_CONTENT_TYPE,
+                request,
+            )
+        return empty_response(HTTPStatus.NOT_IMPLEMENTED, request)
+
+
+async def start_server(
+    name: str = "",
+    port: int = 5000,
+    metrics: Optional[Metrics] = None,
+    metrics_path: str = "/metrics",
+    max_request_size: int = DEFAULT_MAX_REQUEST_SIZE,
+    max_header_size: int = DEFAULT_MAX_HEADER_SIZE,
+    max_pipeline: int = DEFAULT_MAX_PIPELINE,
+    keep_alive_timeout: float = DEFAULT_KEEP_ALIVE_TIMEOUT,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> asyncio.AbstractServer:
+    """Start serving HTTP requests in the running event loop.
+
+    Args:
+        name: The host to listen on. All interfaces by default.
+        port: The port to listen on.
+        metrics: Records the calls, and serves the metrics at the metrics path.
+        metrics_path: The path to serve the metrics at.
+        max_request_size: The largest request body accepted, in bytes.
+        max_header_size: The largest request line and headers accepted, in bytes.
+        max_pipeline: The most requests read from a connection ahead of their
+            responses being written.
+        keep_alive_timeout: How long to keep an idle connection open, in seconds.
+        timeout: How long to wait for a request's body to be received, or a response
+            to be sent, in seconds.
+
+    Returns: The server, already serving.
+    """
+    # pylint: disable=too-many-arguments
+    return await asyncio.start_server(
+        ConnectionHandler(
+            metrics,
+            metrics_path,
+            max_request_size,
+            max_pipeline,
+            keep_alive_timeout,
+            timeout,
+        ),
+        name,
+        port,
+        limit=max_header_size,
+    )
+
+
+async def serve_async(
+    name: str = "",
+    port: int = 5000,
+    metrics: Optional[Metrics] = None,
+    metrics_path: str = "/metrics",
+    max_request_size: int = DEFAULT_MAX_REQUEST_SIZE,
+    max_header_size: int = DEFAULT_MAX_HEADER_SIZE,
+    max_pipeline: int = DEFAULT_MAX_PIPELINE,
+    keep_alive_timeout: float = DEFAULT_KEEP_ALIVE_TIMEOUT,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> None:
+    """Serve HTTP requests until cancelled. See start_server for the arguments.
+
+    >>> asyncio.run(serve_async(port=5000))
+    """
+    # pylint: disable=too-many-arguments
+    server = await start_server(
+        name,
+        port,
+        metrics=metrics,
+        metrics_path=metrics_path,
+        max_request_size=max_request_size,
+        max_header_size=max_header_size,
+        max_pipeline=max_pipeline,
+        keep_alive_timeout=keep_alive_timeout,
+        timeout=timeout,
+    )
+    logging.info(" * Listening on port %s", port)
+    async with server:
+        await server.serve_forever()
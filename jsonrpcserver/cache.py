@@ -0,0 +1,115 @@
+"""Caching the results of methods.
+
+A method registered with @method(cache=ResultCache(...)) has its successful results
+cached, keyed by the request params. A request with params seen before is answered from
+the cache, without validating the arguments or calling the method again. Only for
+methods whose result depends on nothing but the params. Params that can't be serialized
+to json (given by a custom deserializer) have no key, and aren't cached.
+
+The cache's lock is only held while the cache itself is read or updated, never while a
+method is called, so the same cache can be used by threads (e.g. dispatch with
+max_workers) and by async dispatch in the event loop.
+"""
+from collections import OrderedDict
+from math import inf
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, NamedTuple, Optional, Tuple
+import json
+
+from .result import Result
+
+
+class CacheStats(NamedTuple):
+    """A snapshot of a cache's counters."""
+
+    hits: int
+    misses: int
+    evictions: int  # Removed to make room for a newer result
+    expirations: int  # Found to have outlived the ttl
+    size: int
+
+
+def make_key(params: Any) -> Optional[str]:
+    """A canonical form of the params, so the same params give the same key, whatever
+    order the named params were given in. Positional and named params give different
+    keys. None if the params can't be serialized to json.
+    """
+    try:
+        return json.dumps(params, sort_keys=True, separators=(",", ":"))
+    except (TypeError, ValueError):  # Not json types, or a circular reference
+        return None
+
+
+class ResultCache:  # pylint: disable=too-many-instance-attributes
+    """A least-recently-used cache of successful results, with an optional time to
+    live.
+
+    Args:
+        maxsize: The most results to keep. When full, the least recently used result is
+            evicted.
+        ttl: If given, results are used for this many seconds after the method returned
+            them, then the method is called again.
+        clock: Gives the current time in seconds, for the ttl.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 128,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError("The cache size must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: "OrderedDict[str, Tuple[float, Result]]" = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Result]:
+        """Get the cached result for these params, or None."""
+        with self.lock:
+            try:
+                expires, result = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires <= self.clock():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: str, result: Result) -> None:
+        """Cache a result, evicting the least recently used if the cache is full."""
+        expires = inf if self.ttl is None else self.clock() + self.ttl
+        with self.lock:
+            self.entries[key] = (expires, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove all cached results. The counters are kept."""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> CacheStats:
+        """The counters and current number of cached results."""
+        with self.lock:
+            return CacheStats(
+                self.hits,
+                self.misses,
+                self.evictions,
+                self.expirations,
+                len(self.entries),
+            )
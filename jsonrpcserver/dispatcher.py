@@ -2,24 +2,48 @@
 requests, providing responses.
 """
 # pylint: disable=protected-access
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
 from functools import partial
-from inspect import signature
 from itertools import starmap
-from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from threading import Lock
 import logging
 
 from oslash.either import Either, Left, Right  # type: ignore
 
+from .cache import make_key
 from .exceptions import JsonRpcError
-from .methods import Method, Methods
+from .executors import discard_process_pool, get_process_pool, map_in_executor
+from .metrics import Metrics
+from .methods import (
+    DEFAULT_OPTIONS,
+    EXECUTOR_PROCESS,
+    Method,
+    Methods,
+    get_args_check,
+    get_options,
+)
 from .request import Request
 from .response import (
     ErrorResponse,
+    ErrorResponseLeft,
     InvalidRequestResponse,
     ParseErrorResponse,
     Response,
     ServerErrorResponse,
-    SuccessResponse,
+    SuccessResponseRight,
+    to_dict,
 )
 from .result import (
     ErrorResult,
@@ -28,14 +52,39 @@ from .result import (
     MethodNotFoundResult,
     Result,
     SuccessResult,
+    from_dict as result_from_dict,
+    to_dict as result_to_dict,
 )
 from .sentinels import NOCONTEXT, NOID
-from .utils import compose, make_list
+from .streaming import Readable, StreamParser, parse_stream
+from .timing import (
+    STAGE_CALL,
+    STAGE_DESERIALIZE,
+    STAGE_GET_METHOD,
+    STAGE_VALIDATE,
+    STAGE_VALIDATE_ARGS,
+    TimingHook,
+    timed,
+)
+from .utils import compose, identity, json_array, make_list
 
 Deserialized = Union[Dict[str, Any], List[Dict[str, Any]]]
+# A request as received from the transport. Bytes-like requests are given to the
+# deserializer as they are, without being decoded to a string first.
+Serialized = Union[str, bytes, bytearray, memoryview]
+# Deserializers are given the request exactly as it was passed to dispatch.
+Deserializer = Callable[[Any], Deserialized]
+
+# A method's call path, built by compile_call
+CallPath = Callable[[Request], Result]
 
 logger = logging.getLogger(__name__)
 
+# Calls to methods registered with coalesce=True that are in progress, keyed by method
+# and params
+in_flight: Dict[Tuple[Method, str], "Future[Result]"] = {}
+in_flight_lock = Lock()
+
 
 def extract_list(
     is_batch: bool, responses: Iterable[Response]
@@ -79,9 +128,9 @@ def to_response(request: Request, result: Result) -> Response:
     """
     assert request.id is not NOID
     return (
-        Left(ErrorResponse(**result._error._asdict(), id=request.id))
+        ErrorResponseLeft(*result._error, request.id)
         if isinstance(result, Left)
-        else Right(SuccessResponse(**result._value._asdict(), id=request.id))
+        else SuccessResponseRight(result._value.result, request.id)
     )
 
 
@@ -116,15 +165,15 @@ def validate_result(result: Result) -> None:
     ), f"The method did not return a valid Result (returned {result!r})"
 
 
-def call(request: Request, context: Any, method: Method) -> Result:
-    """Call the method.
+def call_method(method: Method, args: List[Any], kwargs: Dict[str, Any]) -> Result:
+    """Call the method with the given arguments.
 
     Handles any exceptions raised in the method, being sure to return an Error response.
 
     Returns: A Result.
     """
     try:
-        result = method(*extract_args(request, context), **extract_kwargs(request))
+        result = method(*args, **kwargs)
         # validate_result raises AssertionError if the return value is not a valid
         # Result, which should respond with Internal Error because its a problem in the
         # method.
@@ -140,15 +189,60 @@ def call(request: Request, context: Any, method: Method) -> Result:
     return result
 
 
+def call_in_worker(
+    method: Method, args: List[Any], kwargs: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Runs inside a worker process. The result is validated here and serialized to a
+    dict, so only JSON-ready data is sent back to the dispatching process.
+    """
+    return result_to_dict(call_method(method, args, kwargs))
+
+
+def call_in_process(method: Method, args: List[Any], kwargs: Dict[str, Any]) -> Result:
+    """Call the method in the shared process pool, waiting for the result.
+
+    Errors in the method give the same Results as call_method. Failing to send the call
+    to a worker, or a worker crashing, gives an Internal Error.
+
+    Returns: A Result.
+    """
+    pool = get_process_pool()
+    try:
+        return result_from_dict(
+            pool.submit(call_in_worker, method, args, kwargs).result()
+        )
+    except Exception as exc:  # pylint: disable=broad-except
+        if isinstance(exc, BrokenProcessPool):
+            discard_process_pool(pool)
+        logger.exception(exc)
+        return Left(InternalErrorResult(str(exc)))
+
+
+def call(request: Request, context: Any, method: Method) -> Result:
+    """Call the method, in the shared process pool if it was registered with
+    executor="process".
+
+    Returns: A Result.
+    """
+    return (
+        call_in_process
+        if get_options(method).executor == EXECUTOR_PROCESS
+        else call_method
+    )(method, extract_args(request, context), extract_kwargs(request))
+
+
 def validate_args(
     request: Request, context: Any, func: Method
 ) -> Either[ErrorResult, Method]:
     """Ensure the method can be called with the arguments given.
 
+    The method's signature is inspected once and the resulting check is reused for later
+    requests.
+
     Returns: Either the function to be called, or an Invalid Params error result.
     """
     try:
-        signature(func).bind(*extract_args(request, context), **extract_kwargs(request))
+        get_args_check(func)(extract_args(request, context), extract_kwargs(request))
     except TypeError as exc:
         return Left(InvalidParamsResult(str(exc)))
     return Right(func)
@@ -165,6 +259,102 @@ def get_method(methods: Methods, method_name: str) -> Either[ErrorResult, Method
         return Left(MethodNotFoundResult(method_name))
 
 
+def validate_and_call(request: Request, context: Any, method: Method) -> Result:
+    """Validate the arguments, then call the method.
+
+    Returns: A Result.
+    """
+    return validate_args(request, context, method).bind(partial(call, request, context))
+
+
+def call_coalesced(request: Request, context: Any, method: Method) -> Result:
+    """Like validate_and_call, but if the same method is already being called with the
+    same params (in another thread), wait for that call and share its Result, rather
+    than calling the method again. Params with no key (see cache.make_key) aren't
+    coalesced.
+
+    Returns: A Result.
+    """
+    params_key = make_key(request.params)
+    if params_key is None:
+        return validate_and_call(request, context, method)
+    key = (method, params_key)
+    with in_flight_lock:
+        future = in_flight.get(key)
+        leader = future is None
+        if future is None:
+            future = in_flight[key] = Future()
+    if not leader:
+        return future.result()
+    try:
+        result = validate_and_call(request, context, method)
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    else:
+        future.set_result(result)
+    finally:
+        with in_flight_lock:
+            del in_flight[key]
+    return result
+
+
+def call_cached(request: Request, context: Any, method: Method) -> Result:
+    """Validate the arguments and call the method, using the method's cache and/or
+    coalescing identical calls, if it was registered with those options.
+
+    If the method has a cache, a result cached for the same params is given instead,
+    and a successful result is cached.
+
+    Returns: A Result.
+    """
+    options = get_options(method)
+    call_method_ = call_coalesced if options.coalesce else validate_and_call
+    if options.cache is None:
+        return call_method_(request, context, method)
+    key = make_key(request.params)
+    if key is None:
+        return call_method_(request, context, method)
+    result = options.cache.get(key)
+    if result is None:
+        result = call_method_(request, context, method)
+        if isinstance(result, Right):
+            options.cache.put(key, result)
+    return result
+
+
+def compile_call(method: Method, context: Any) -> CallPath:
+    """Build the function to validate the arguments of a request and call a method,
+    with the given context. Built once per method, then reused for each request.
+
+    Methods registered with options (executor, cache or coalesce) go through
+    call_cached. For other methods, the argument check and the call are bound directly
+    with nothing else in between.
+
+    Returns: A function from Request to Result.
+    """
+    if get_options(method) != DEFAULT_OPTIONS:
+        return lambda request: call_cached(request, context, method)
+    check = get_args_check(method)
+    prefix = [] if context is NOCONTEXT else [context]
+
+    def call_direct(request: Request) -> Result:
+        params = request.params
+        args = (
+            (prefix + params if prefix else params)
+            if isinstance(params, list)
+            else prefix
+        )
+        kwargs = params if isinstance(params, dict) else {}
+        try:
+            check(args, kwargs)
+        except TypeError as exc:
+            return Left(InvalidParamsResult(str(exc)))
+        return call_method(method, args, kwargs)
+
+    return call_direct
+
+
 def dispatch_request(
     methods: Methods, context: Any, request: Request
 ) -> Tuple[Request, Result]:
@@ -176,12 +366,58 @@ def dispatch_request(
     """
     return (
         request,
-        get_method(methods, request.method)
-        .bind(partial(validate_args, request, context))
-        .bind(partial(call, request, context)),
+        get_method(methods, request.method).bind(
+            partial(call_cached, request, context)
+        ),
+    )
+
+
+def call_timed(
+    hook: TimingHook,
+    methods: Methods,
+    context: Any,
+    request: Request,
+    metrics: Optional[Metrics] = None,
+) -> Result:
+    """Like dispatch_request, but gives the time taken by each stage - getting the
+    method, validating the arguments and calling the method - to the timing hook.
+
+    If metrics are given, the call is recorded.
+
+    Returns: A Result.
+    """
+    name = request.method
+    method = timed(hook, STAGE_GET_METHOD, name, get_method, methods, name)
+    if isinstance(method, Left):
+        return method
+    call_path = partial(validate_and_call_timed, hook, context, method._value)
+    return (
+        call_path(request)
+        if metrics is None
+        else metrics.observe(name, call_path, request)
     )
 
 
+def validate_and_call_timed(
+    hook: TimingHook, context: Any, method: Method, request: Request
+) -> Result:
+    """Validate the arguments and call the method, giving the time taken by each to the
+    timing hook.
+
+    Returns: A Result.
+    """
+    name = request.method
+    options = get_options(method)
+    if options.cache is not None or options.coalesce:
+        return timed(hook, STAGE_CALL, name, call_cached, request, context, method)
+    valid = timed(
+        hook, STAGE_VALIDATE_ARGS, name, validate_args, request, context, method
+    )
+    if isinstance(valid, Left):
+        return valid
+    return timed(hook, STAGE_CALL, name, call, request, context, method)
+
+
 def create_request(request: Dict[str, Any]) -> Request:
     """Create a Request namedtuple from a dict."""
     return Request(
@@ -197,24 +433,45 @@ def not_notification(request_result: Any) -> bool:
     return request_result[0].id is not NOID
 
 
+def dispatch_deserialized_iter(
+    methods: Methods,
+    context: Any,
+    deserialized: Deserialized,
+    executor: Optional[Executor] = None,
+) -> Iterator[Response]:
+    """Dispatch the parsed and validated request(s), giving the responses lazily - each
+    one as soon as its request has been dispatched. Notifications are removed.
+
+    If an executor is given, the requests in a batch are dispatched concurrently on it.
+    The responses are still in the same order as the requests.
+    """
+    dispatch = compose(partial(dispatch_request, methods, context), create_request)
+    results = (
+        map_in_executor(executor, dispatch, deserialized)
+        if executor is not None and isinstance(deserialized, list)
+        else map(dispatch, make_list(deserialized))
+    )
+    yield from starmap(to_response, filter(not_notification, results))
+
+
 def dispatch_deserialized(
     methods: Methods,
     context: Any,
     post_process: Callable[[Response], Iterable[Any]],
     deserialized: Deserialized,
+    executor: Optional[Executor] = None,
 ) -> Union[Response, List[Response], None]:
     """This is simply continuing the pipeline from dispatch_to_response_pure. It exists
     only to be an abstraction, otherwise that function is doing too much. It continues
     on from the request string having been parsed and validated.
 
+    If an executor is given, the requests in a batch are dispatched concurrently on it.
+    The responses are still in the same order as the requests.
+
     Returns: A Response, a list of Responses, or None. If post_process is passed, it's
         applied to the Response(s).
     """
-    results = map(
-        compose(partial(dispatch_request, methods, context), create_request),
-        make_list(deserialized),
-    )
-    responses = starmap(to_response, filter(not_notification, results))
+    responses = dispatch_deserialized_iter(methods, context, deserialized, executor)
     return extract_list(isinstance(deserialized, list), map(post_process, responses))
 
 
@@ -238,9 +495,9 @@ def validate_request(
 
 
 def deserialize_request(
-    deserializer: Callable[[str], Deserialized], request: str
+    deserializer: Deserializer, request: Serialized
 ) -> Either[ErrorResponse, Deserialized]:
-    """Parse the JSON request string.
+    """Parse the JSON request string (or bytes).
 
     Returns: Either the deserialized request or a "Parse Error" response.
     """
@@ -253,17 +510,39 @@ def deserialize_request(
         return Left(ParseErrorResponse(str(exc)))
 
 
+def deserialize_timed(
+    hook: TimingHook,
+    deserializer: Deserializer,
+    validator: Callable[[Deserialized], Deserialized],
+    request: Serialized,
+) -> Either[ErrorResponse, Deserialized]:
+    """Deserialize and validate the request, giving the time taken by each to the
+    timing hook.
+
+    Returns: Either the deserialized request or an error response.
+    """
+    result = timed(
+        hook, STAGE_DESERIALIZE, None, deserialize_request, deserializer, request
+    )
+    if isinstance(result, Left):
+        return result
+    return timed(hook, STAGE_VALIDATE, None, validate_request, validator, result._value)
+
+
 def dispatch_to_response_pure(
     *,
-    deserializer: Callable[[str], Deserialized],
+    deserializer: Deserializer,
     validator: Callable[[Deserialized], Deserialized],
     methods: Methods,
     context: Any,
     post_process: Callable[[Response], Iterable[Any]],
-    request: str,
+    request: Serialized,
+    executor: Optional[Executor] = None,
 ) -> Union[Response, List[Response], None]:
-    """A function from JSON-RPC request string to Response namedtuple(s), (yet to be
-    serialized to json).
+    """A function from JSON-RPC request string (or bytes) to Response namedtuple(s), (yet
+    to be serialized to json).
+
+    If an executor is given, batch requests are dispatched concurrently on it.
 
     Returns: A single Response, a list of Responses, or None. None is given for
         notifications or batches of notifications, to indicate that we should not
@@ -276,9 +555,149 @@ def dispatch_to_response_pure(
         return (
             post_process(result)
             if isinstance(result, Left)
-            else dispatch_deserialized(methods, context, post_process, result._value)
+            else dispatch_deserialized(
+                methods, context, post_process, result._value, executor
+            )
         )
     except Exception as exc:  # pylint: disable=broad-except
         # There was an error with the jsonrpcserver library.
         logger.exception(exc)
         return post_process(Left(ServerErrorResponse(str(exc), None)))
+
+
+def encode_responses(
+    encoder: Callable[[Any], bytes], responses: Iterable[Response]
+) -> Iterator[bytes]:
+    """Encode the responses. If there's an error with the jsonrpcserver library along
+    the way, or with the encoder, finish with a Server Error response.
+    """
+    try:
+        for response in responses:
+            yield encoder(to_dict(response))
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.exception(exc)
+        yield encoder(to_dict(Left(ServerErrorResponse(str(exc), None))))
+
+
+def dispatch_to_iter_pure(
+    *,
+    deserializer: Deserializer,
+    validator: Callable[[Deserialized], Deserialized],
+    methods: Methods,
+    context: Any,
+    encoder: Callable[[Any], bytes],
+    request: Serialized,
+    executor: Optional[Executor] = None,
+) -> Iterator[bytes]:
+    """A function from JSON-RPC request to serialized JSON-RPC response, given in chunks
+    as each response becomes available.
+
+    A single response is given as one chunk. A batch response is given as "[", then
+    each response with "," between them, then "]". Nothing is given for notifications,
+    or batches of notifications.
+
+    If there's an error with the library after part of a batch response has been
+    given, the batch finishes with a Server Error response.
+    """
+    try:
+        result = deserialize_request(deserializer, request).bind(
+            partial(validate_request, validator)
+        )
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.exception(exc)
+        result = Left(ServerErrorResponse(str(exc), None))
+    if isinstance(result, Left):
+        yield encoder(to_dict(result))
+        return
+    deserialized = result._value
+    encoded = encode_responses(
+        encoder, dispatch_deserialized_iter(methods, context, deserialized, executor)
+    )
+    yield from json_array(encoded) if isinstance(deserialized, list) else encoded
+
+
+def catch_parse_error(first: Any, values: Iterator[Any]) -> Iterator[Any]:
+    """Pass through the values parsed from a streamed body (the first of which has been
+    taken already). If the body turns out to be malformed along the way, finish with a
+    Parse error response in place of a value.
+    """
+    yield first
+    try:
+        yield from values
+    # JSONDecodeError and UnicodeDecodeError
+    except ValueError as exc:
+        yield Left(ParseErrorResponse(str(exc)))
+
+
+def dispatch_streamed(
+    validator: Callable[[Deserialized], Deserialized],
+    methods: Methods,
+    context: Any,
+    value: Any,
+) -> Optional[Response]:
+    """Validate and dispatch one request from a streamed batch.
+
+    Each request is validated on its own, so an invalid request gets an Invalid request
+    response in its place, rather than failing the whole batch.
+
+    Returns: The Response, or None for a notification.
+    """
+    if isinstance(value, Left):
+        return value  # A parse error, from catch_parse_error
+    if not isinstance(value, dict) or isinstance(
+        validate_request(validator, value), Left
+    ):
+        return Left(InvalidRequestResponse("The request failed schema validation"))
+    request, result = dispatch_request(methods, context, create_request(value))
+    return None if request.id is NOID else to_response(request, result)
+
+
+def dispatch_stream_pure(
+    *,
+    validator: Callable[[Deserialized], Deserialized],
+    methods: Methods,
+    context: Any,
+    encoder: Callable[[Any], bytes],
+    stream: Readable,
+    chunk_size: int,
+) -> Iterator[bytes]:
+    """Like dispatch_to_iter_pure, but reads the request body from a stream. The
+    requests in a batch are dispatched one at a time as they're read, so the body is
+    never held in memory.
+
+    A body that's malformed before the first request in a batch has been read gives a
+    single Parse error response, as does a body that's not a batch. If a batch becomes
+    malformed after that, the requests before that point have been dispatched already;
+    their responses are given, followed by a Parse error response to end the batch.
+    """
+    parser = StreamParser()
+    values = parse_stream(parser, stream, chunk_size)
+    try:
+        first = next(values)
+    except StopIteration:  # An empty batch
+        yield encoder(
+            to_dict(
+                Left(InvalidRequestResponse("The request failed schema validation"))
+            )
+        )
+        return
+    except ValueError as exc:
+        yield encoder(to_dict(Left(ParseErrorResponse(str(exc)))))
+        return
+    if not parser.is_batch:
+        yield from dispatch_to_iter_pure(
+            deserializer=identity,
+            validator=validator,
+            methods=methods,
+            context=context,
+            encoder=encoder,
+            request=first,
+        )
+        return
+    responses = map(
+        partial(dispatch_streamed, validator, methods, context),
+        catch_parse_error(first, values),
+    )
+    yield from json_array(
+        encode_responses(encoder, (r for r in responses if r is not None))
+    )
@@ -0,0 +1,85 @@
+"""Executors for running methods concurrently.
+
+Pools are created on first use and reused for the life of the process, rather than
+being created for every request.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import Context, copy_context
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+# pylint: disable=global-statement
+
+thread_pools: Dict[int, ThreadPoolExecutor] = {}
+thread_pools_lock = Lock()
+
+process_pool: Optional[ProcessPoolExecutor] = None
+process_pool_lock = Lock()
+
+
+def get_thread_pool(max_workers: int) -> ThreadPoolExecutor:
+    """Get the shared thread pool with this number of workers, creating it if needed."""
+    with thread_pools_lock:
+        try:
+            return thread_pools[max_workers]
+        except KeyError:
+            pool = thread_pools[max_workers] = ThreadPoolExecutor(
+                max_workers, thread_name_prefix="jsonrpcserver"
+            )
+            return pool
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Get the shared process pool, for methods registered with executor="process".
+
+    It's created on first use, with a worker for each CPU, unless one has been given
+    with set_process_pool.
+    """
+    global process_pool
+    with process_pool_lock:
+        if process_pool is None:
+            process_pool = ProcessPoolExecutor()
+        return process_pool
+
+
+def set_process_pool(pool: Optional[ProcessPoolExecutor]) -> None:
+    """Replace the shared process pool. Pass None to have a new one created on next
+    use. The old pool is shut down.
+    """
+    global process_pool
+    with process_pool_lock:
+        old, process_pool = process_pool, pool
+    if old is not None and old is not pool:
+        old.shutdown(wait=False)
+
+
+def discard_process_pool(pool: ProcessPoolExecutor) -> None:
+    """Stop using a pool, e.g. because a worker crashed and the pool is broken. A new
+    one is created on next use. Does nothing if the pool was already replaced.
+    """
+    global process_pool
+    with process_pool_lock:
+        if process_pool is not pool:
+            return
+        process_pool = None
+    pool.shutdown(wait=False)
+
+
+def run_in_context(context: Context, func: Callable[..., Any], *args: Any) -> Any:
+    """Call a function inside a context. Used to carry contextvars into a worker."""
+    return context.run(func, *args)
+
+
+def map_in_executor(
+    executor: Executor, func: Callable[[Any], Any], iterable: Iterable[Any]
+) -> Iterator[Any]:
+    """Like Executor.map, but each call runs in a copy of the caller's context, so
+    contextvars set by the caller are visible in the workers.
+
+    Everything is submitted before the first result is waited on. Results are given in
+    the same order as the iterable.
+    """
+    futures = [
+        executor.submit(run_in_context, copy_context(), func, x) for x in iterable
+    ]
+    return (future.result() for future in futures)
@@ -8,56 +8,442 @@ request, but they each give a different return value.
   notifications).
 - dispatch_to_json/dispatch: Returns a JSON-RPC response string (or an empty string for
   notifications).
+- dispatch_to_bytes: Returns a JSON-RPC response as UTF-8 bytes (or empty bytes for
+  notifications), ready to be written to a transport.
+- dispatch_iter: Yields a JSON-RPC response as UTF-8 bytes in chunks, as each response
+  in a batch becomes available.
+- dispatch_stream: Like dispatch_iter, but reads the request from a file-like object,
+  dispatching each request in a batch as soon as it's been read.
+
+The first four use a Dispatcher, which can also be used directly, built once with the
+methods and settings.
 """
+from concurrent.futures import Executor
+from functools import partial
 from importlib.resources import read_text
-from typing import Any, Callable, Dict, List, Optional, Union, cast
+from operator import is_
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union, cast
 import json
+import logging
 
 from jsonschema.validators import validator_for  # type: ignore
+from oslash.either import Left, Right  # type: ignore
 
-from .dispatcher import dispatch_to_response_pure, Deserialized
-from .methods import Methods, global_methods
-from .response import Response, to_dict
-from .sentinels import NOCONTEXT
+from .dispatcher import (
+    CallPath,
+    Deserialized,
+    Deserializer,
+    Serialized,
+    call_timed,
+    compile_call,
+    create_request,
+    deserialize_request,
+    deserialize_timed,
+    dispatch_stream_pure,
+    dispatch_to_iter_pure,
+    to_response,
+    validate_request,
+)
+from .executors import get_thread_pool, map_in_executor
+from .methods import Method, Methods, global_methods
+from .metrics import Metrics
+from .request import Request
+from .response import Response, ServerErrorResponse, to_dict
+from .result import MethodNotFoundResult, Result
+from .sentinels import NOCONTEXT, NOID
+from .streaming import Readable
+from .timing import STAGE_SERIALIZE, TimingHook, get_timing_hook, timed
+from .tracing import (
+    Span,
+    Tracer,
+    extract_context,
+    set_result,
+    start_batch_span,
+    start_call_span,
+)
+from . import timing
 from .utils import identity
+from .validator import validate
+
+
+def default_deserializer(request: Serialized) -> Deserialized:
+    """json.loads, which takes str, bytes and bytearray. It doesn't take memoryview, so
+    those are copied to bytes first. (For no copy, use a deserializer that takes
+    memoryview, such as orjson.loads.)
+    """
+    return cast(
+        Deserialized,
+        json.loads(bytes(request) if isinstance(request, memoryview) else request),
+    )
 
 
-default_deserializer = json.loads
+logger = logging.getLogger(__name__)
+
+
+def stdlib_encoder(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 encoded json, using the json module."""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def orjson_encoder(obj: Any) -> bytes:
+    """Serialize with orjson, which gives bytes directly. What orjson can't serialize but
+    the json module can, such as ints over 64 bits, falls back to the json module, so
+    the output is the same whether orjson is installed or not.
+    """
+    # pylint: disable=no-member
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:  # Including orjson.JSONEncodeError
+        return stdlib_encoder(obj)
+
+
+# The encoder used by dispatch_to_bytes. orjson, if installed.
+default_encoder: Callable[[Any], bytes]
+try:
+    import orjson
+
+    default_encoder = orjson_encoder
+except ImportError:
+    default_encoder = stdlib_encoder
 
 # Prepare the jsonschema validator. This is global so it loads only once, not every
-# time dispatch is called.
+# time dispatch is called. It's available for strict validation against the schema, but
+# the default is the faster validator which checks the same rules by hand.
 schema = json.loads(read_text(__package__, "request-schema.json"))
 klass = validator_for(schema)
 klass.check_schema(schema)
-default_validator = klass(schema).validate
+strict_validator = klass(schema).validate
+default_validator = validate
+
+
+class Dispatcher:
+    """Dispatches JSON-RPC requests to a collection of methods.
+
+    The settings are given once, and the way to call each method is worked out on its
+    first request, then reused. The dispatch functions use a Dispatcher; build your own
+    to reuse one with settings other than the defaults:
+
+        >>> dispatcher = Dispatcher({"ping": ping}, context=app)
+        >>> dispatcher.dispatch('{"jsonrpc": "2.0", "method": "ping", "id": 1}')
+        '{"jsonrpc": "2.0", "result": "pong", "id": 1}'
+
+    Methods added to the methods dict later are picked up, as are methods that are
+    replaced.
+
+    Args:
+        methods: Dictionary of methods that can be called. If not passed, uses the
+            internal global_methods dict which is populated with the @method decorator.
+        serializer: Function to serialize a response to json, for dispatch.
+        The rest: The same as dispatch_to_response.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        methods: Optional[Methods] = None,
+        *,
+        context: Any = NOCONTEXT,
+        deserializer: Deserializer = default_deserializer,
+        validator: Callable[[Deserialized], Deserialized] = default_validator,
+        serializer: Callable[[Any], str] = json.dumps,
+        executor: Optional[Executor] = None,
+        max_workers: Optional[int] = None,
+        timing_hook: Optional[TimingHook] = None,
+        metrics: Optional[Metrics] = None,
+        tracer: Optional[Tracer] = None,
+        trace_context_field: Optional[str] = None,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        self.methods = global_methods if methods is None else methods
+        self.context = context
+        self.deserializer = deserializer
+        self.validator = validator
+        self.serializer = serializer
+        self.executor = (
+            get_thread_pool(max_workers)
+            if executor is None and max_workers is not None
+            else executor
+        )
+        self.timing_hook = timing_hook
+        self.metrics = metrics
+        self.tracer = tracer
+        self.trace_context_field = trace_context_field
+        # Method name to the method, and the way to call it
+        self.table: Dict[str, Tuple[Method, CallPath]] = {}
+
+    def call(self, request: Request) -> Result:
+        """Look up the method and call it."""
+        try:
+            method = self.methods[request.method]
+        except KeyError:
+            return Left(MethodNotFoundResult(request.method))
+        entry = self.table.get(request.method)
+        if entry is None or entry[0] is not method:
+            entry = self.table[request.method] = (
+                method,
+                compile_call(method, self.context),
+            )
+        if self.metrics is None:
+            return entry[1](request)
+        return self.metrics.observe(request.method, entry[1], request)
+
+    def dispatch_deserialized(
+        self, request: Dict[str, Any], hook: Optional[TimingHook] = None
+    ) -> Optional[Response]:
+        """Dispatch one parsed and validated request. If a timing hook is given, it's
+        given the time of each stage.
+
+        Returns: The Response, or None for a notification.
+        """
+        request_ = create_request(request)
+        result = (
+            self.call(request_)
+            if hook is None
+            else call_timed(hook, self.methods, self.context, request_, self.metrics)
+        )
+        return None if request_.id is NOID else to_response(request_, result)
+
+    def dispatch_deserialized_traced(
+        self,
+        tracer: Tracer,
+        hook: Optional[TimingHook],
+        batch: Optional[Span],
+        item: Tuple[Optional[int], Dict[str, Any]],
+    ) -> Optional[Response]:
+        """Dispatch one parsed and validated request, with its position in the batch
+        (None if it's not in a batch), in a span. The span's parent is the trace context
+        from the params if there is one, otherwise the batch's span.
+
+        Returns: The Response, or None for a notification.
+        """
+        index, request = item
+        request_, parent = extract_context(
+            tracer, self.trace_context_field, create_request(request)
+        )
+        span = start_call_span(
+            tracer, request_, batch if parent is None else parent, index
+        )
+        try:
+            result = (
+                self.call(request_)
+                if hook is None
+                else call_timed(
+                    hook, self.methods, self.context, request_, self.metrics
+                )
+            )
+            set_result(span, result)
+        finally:
+            span.end()
+        return None if request_.id is NOID else to_response(request_, result)
+
+    def dispatch_traced(
+        self,
+        tracer: Tracer,
+        hook: Optional[TimingHook],
+        deserialized: Deserialized,
+        post_process: Callable[[Response], Any],
+    ) -> Union[Response, List[Response], None]:
+        """Dispatch the parsed and validated request(s), with a span for each call, and
+        a parent span for a batch.
+        """
+        if not isinstance(deserialized, list):
+            response = self.dispatch_deserialized_traced(
+                tracer, hook, None, (None, deserialized)
+            )
+            return None if response is None else post_process(response)
+        batch = start_batch_span(tracer, len(deserialized))
+        try:
+            dispatch_one = partial(
+                self.dispatch_deserialized_traced, tracer, hook, batch
+            )
+            responses = (
+                map(dispatch_one, enumerate(deserialized))
+                if self.executor is None
+                else map_in_executor(
+                    self.executor, dispatch_one, enumerate(deserialized)
+                )
+            )
+            return [post_process(r) for r in responses if r is not None] or None
+        finally:
+            batch.end()
+
+    def dispatch_to_response(
+        self, request: Serialized, post_process: Callable[[Response], Any] = identity
+    ) -> Union[Response, List[Response], None]:
+        """Dispatch a request, giving Response namedtuple(s), or None. See
+        dispatch_to_response.
+        """
+        # pylint: disable=protected-access
+        hook = timing.timing_hook if self.timing_hook is None else self.timing_hook
+        try:
+            if hook is None:
+                result = deserialize_request(self.deserializer, request)
+                if isinstance(result, Right):
+                    result = validate_request(self.validator, result._value)
+            else:
+                result = deserialize_timed(
+                    hook, self.deserializer, self.validator, request
+                )
+            if isinstance(result, Left):
+                return post_process(result)
+            deserialized = result._value
+            if self.tracer is not None:
+                return self.dispatch_traced(
+                    self.tracer, hook, deserialized, post_process
+                )
+            dispatch_one: Callable[
+                [Dict[str, Any]], Optional[Response]
+            ] = self.dispatch_deserialized
+            if hook is not None:
+                dispatch_one = partial(self.dispatch_deserialized, hook=hook)
+            if isinstance(deserialized, list):
+                responses = (
+                    map(dispatch_one, deserialized)
+                    if self.executor is None
+                    else map_in_executor(self.executor, dispatch_one, deserialized)
+                )
+                return [post_process(r) for r in responses if r is not None] or None
+            response = dispatch_one(deserialized)
+            return None if response is None else post_process(response)
+        except Exception as exc:  # pylint: disable=broad-except
+            # There was an error with the jsonrpcserver library.
+            logger.exception(exc)
+            return post_process(Left(ServerErrorResponse(str(exc), None)))
+
+    def dispatch_to_serializable(
+        self, request: Serialized
+    ) -> Union[Dict[str, Any], List[Dict[str, Any]], None]:
+        """Dispatch a request, giving the response as dict(s), or None."""
+        return cast(
+            Union[Dict[str, Any], List[Dict[str, Any]], None],
+            self.dispatch_to_response(request, to_dict),
+        )
+
+    def dispatch(self, request: Serialized) -> str:
+        """Dispatch a request, giving a JSON-RPC response string (or an empty string
+        for notifications).
+        """
+        response = self.dispatch_to_serializable(request)
+        if response is None:
+            return ""
+        hook = get_timing_hook(self.timing_hook)
+        return (
+            self.serializer(response)
+            if hook is None
+            else timed(hook, STAGE_SERIALIZE, None, self.serializer, response)
+        )
+
+
+# Used by the dispatch functions when given the default settings
+default_dispatcher = Dispatcher()
+DEFAULT_SETTINGS = (
+    None,
+    NOCONTEXT,
+    default_deserializer,
+    default_validator,
+    None,
+    None,
+    None,
+    None,
+    None,
+    None,
+)
+
+
+def get_dispatcher(
+    methods: Optional[Methods],
+    *,
+    context: Any,
+    deserializer: Deserializer,
+    validator: Callable[[Deserialized], Deserialized],
+    executor: Optional[Executor],
+    max_workers: Optional[int],
+    timing_hook: Optional[TimingHook],
+    metrics: Optional[Metrics],
+    tracer: Optional[Tracer],
+    trace_context_field: Optional[str],
+) -> Dispatcher:
+    """The default dispatcher if all the settings are the defaults, otherwise a new
+    one with these settings.
+    """
+    # pylint: disable=too-many-arguments
+    settings = (
+        methods,
+        context,
+        deserializer,
+        validator,
+        executor,
+        max_workers,
+        timing_hook,
+        metrics,
+        tracer,
+        trace_context_field,
+    )
+    if all(map(is_, settings, DEFAULT_SETTINGS)):
+        return default_dispatcher
+    return Dispatcher(
+        methods,
+        context=context,
+        deserializer=deserializer,
+        validator=validator,
+        executor=executor,
+        max_workers=max_workers,
+        timing_hook=timing_hook,
+        metrics=metrics,
+        tracer=tracer,
+        trace_context_field=trace_context_field,
+    )
 
 
 def dispatch_to_response(
-    request: str,
+    request: Serialized,
     methods: Optional[Methods] = None,
     *,
     context: Any = NOCONTEXT,
-    deserializer: Callable[[str], Deserialized] = json.loads,
+    deserializer: Deserializer = default_deserializer,
     validator: Callable[[Deserialized], Deserialized] = default_validator,
     post_process: Callable[[Response], Any] = identity,
+    executor: Optional[Executor] = None,
+    max_workers: Optional[int] = None,
+    timing_hook: Optional[TimingHook] = None,
+    metrics: Optional[Metrics] = None,
+    tracer: Optional[Tracer] = None,
+    trace_context_field: Optional[str] = None,
 ) -> Union[Response, List[Response], None]:
-    """Takes a JSON-RPC request string and dispatches it to method(s), giving Response
-    namedtuple(s) or None.
+    """Takes a JSON-RPC request string (or bytes) and dispatches it to method(s), giving
+    Response namedtuple(s) or None.
 
-    This is a public wrapper around dispatch_to_response_pure, adding globals and
-    default values to be nicer for end users.
+    This is a public wrapper around Dispatcher, adding globals and default values to
+    be nicer for end users.
 
     Args:
-        request: The JSON-RPC request string.
+        request: The JSON-RPC request, as a string or bytes-like object (bytes,
+            bytearray or memoryview). Bytes are passed to the deserializer as they are,
+            without decoding.
         methods: Dictionary of methods that can be called - mapping of function names to
             functions. If not passed, uses the internal global_methods dict which is
             populated with the @method decorator.
         context: If given, will be passed as the first argument to methods.
-        deserializer: Function that deserializes the request string.
+        deserializer: Function that deserializes the request. It's given the request
+            as it was passed in.
         validator: Function that validates the JSON-RPC request. The function should
-            raise an exception if the request is invalid. To disable validation, pass
-            lambda _: None.
+            raise an exception if the request is invalid. To validate against the
+            JSON-RPC schema with jsonschema, pass strict_validator. To disable
+            validation, pass lambda _: None.
         post_process: Function that will be applied to Responses.
+        executor: If given, the requests in a batch are dispatched concurrently on this
+            executor, e.g. a ThreadPoolExecutor. Responses are still in request order.
+        max_workers: Alternative to executor. Dispatches batches on a shared thread
+            pool with this many workers, created on first use and then reused.
+        timing_hook: Given the time taken by each stage of dispatch. See timing.py.
+            If not passed, uses the hook set with set_timing_hook, if any.
+        metrics: A Metrics, to record the calls to each method. See metrics.py.
+        tracer: Starts a span for each call to a method, and for each batch. See
+            tracing.py.
+        trace_context_field: A named param that may hold a trace context from the
+            client, which is removed from the params and used as the parent of the
+            call's span.
 
     Returns:
         A Response, list of Responses or None.
@@ -66,14 +452,18 @@ def dispatch_to_response(
        >>> dispatch('{"jsonrpc": "2.0", "method": "ping", "id": 1}')
        '{"jsonrpc": "2.0", "result": "pong", "id": 1}'
     """
-    return dispatch_to_response_pure(
+    return get_dispatcher(
+        methods,
+        context=context,
         deserializer=deserializer,
         validator=validator,
-        post_process=post_process,
-        context=context,
-        methods=global_methods if methods is None else methods,
-        request=request,
-    )
+        executor=executor,
+        max_workers=max_workers,
+        timing_hook=timing_hook,
+        metrics=metrics,
+        tracer=tracer,
+        trace_context_field=trace_context_field,
+    ).dispatch_to_response(request, post_process)
 
 
 def dispatch_to_serializable(
@@ -108,7 +498,114 @@ def dispatch_to_json(
     response = dispatch_to_serializable(*args, **kwargs)
     # Better to respond with the empty string instead of json "null", because "null" is
     # an invalid JSON-RPC response.
-    return "" if response is None else serializer(response)
+    if response is None:
+        return ""
+    hook = get_timing_hook(kwargs.get("timing_hook"))
+    return (
+        serializer(response)
+        if hook is None
+        else timed(hook, STAGE_SERIALIZE, None, serializer, response)
+    )
+
+
+def dispatch_to_bytes(
+    *args: Any,
+    encoder: Callable[[Any], bytes] = default_encoder,
+    **kwargs: Any,
+) -> bytes:
+    """Takes a JSON-RPC request and dispatches it to method(s), giving a JSON-RPC
+    response as UTF-8 encoded bytes, to write straight to a transport.
+
+    Args:
+        encoder: A function to serialize a Python object to json bytes. Default is
+            orjson_encoder if orjson is installed, otherwise stdlib_encoder. Both
+            give the same json.
+        The rest: Passed through to dispatch_to_serializable.
+    """
+    response = dispatch_to_serializable(*args, **kwargs)
+    if response is None:
+        return b""
+    hook = get_timing_hook(kwargs.get("timing_hook"))
+    return (
+        encoder(response)
+        if hook is None
+        else timed(hook, STAGE_SERIALIZE, None, encoder, response)
+    )
+
+
+def dispatch_iter(
+    request: Serialized,
+    methods: Optional[Methods] = None,
+    *,
+    context: Any = NOCONTEXT,
+    deserializer: Deserializer = default_deserializer,
+    validator: Callable[[Deserialized], Deserialized] = default_validator,
+    encoder: Callable[[Any], bytes] = default_encoder,
+    executor: Optional[Executor] = None,
+    max_workers: Optional[int] = None,
+) -> Iterator[bytes]:
+    """Takes a JSON-RPC request and dispatches it to method(s), yielding the JSON-RPC
+    response as UTF-8 encoded chunks.
+
+    The responses in a batch are yielded as they become available (in request order),
+    rather than waiting for the whole batch, so they can be streamed to the client, e.g.
+    as a chunked HTTP response. The chunks are "[", each response with "," chunks
+    between them, then "]". A single response is one chunk. Nothing is yielded for
+    notifications.
+
+    Args: The same as dispatch_to_response and dispatch_to_bytes.
+    """
+    return dispatch_to_iter_pure(
+        deserializer=deserializer,
+        validator=validator,
+        encoder=encoder,
+        context=context,
+        methods=global_methods if methods is None else methods,
+        request=request,
+        executor=(
+            get_thread_pool(max_workers)
+            if executor is None and max_workers is not None
+            else executor
+        ),
+    )
+
+
+def dispatch_stream(
+    stream: Readable,
+    methods: Optional[Methods] = None,
+    *,
+    context: Any = NOCONTEXT,
+    validator: Callable[[Deserialized], Deserialized] = default_validator,
+    encoder: Callable[[Any], bytes] = default_encoder,
+    chunk_size: int = 65536,
+) -> Iterator[bytes]:
+    """Reads a JSON-RPC request from a stream and dispatches it to method(s), yielding
+    the JSON-RPC response as UTF-8 encoded chunks, the same as dispatch_iter.
+
+    For very large batches. The body is parsed incrementally, and each request in a
+    batch is validated and dispatched as soon as it's been read, so the whole batch is
+    never held in memory. The body is parsed with the json module.
+
+    Each request in a batch is validated on its own; an invalid one gets an Invalid
+    request response, and the rest of the batch is still dispatched. If the body is
+    malformed, the response is a Parse error - unless requests in the batch have already
+    been dispatched, in which case their responses are followed by a Parse error
+    response to end the batch.
+
+    Args:
+        stream: A file-like object opened in binary mode, e.g. the rfile of an HTTP
+            request handler. It's read until the end, so limit it to the body.
+        chunk_size: How many bytes to read at a time.
+        The rest: The same as dispatch_iter.
+    """
+    return dispatch_stream_pure(
+        validator=validator,
+        encoder=encoder,
+        context=context,
+        methods=global_methods if methods is None else methods,
+        stream=stream,
+        chunk_size=chunk_size,
+    )
 
 
 # "dispatch" aliases dispatch_to_json.
@@ -10,20 +10,412 @@ Alternatively pass your own dictionary of methods to `dispatch` with the methods
 
 Methods can take either positional or named arguments, but not both. This is a
 limitation of JSON-RPC.
+
+To save importing every module of methods at startup, methods can be registered by
+import path, and imported when first called:
+
+    >>> lazy_method("myapp.billing:charge")
+    >>> lazy_namespace("reports", "myapp.reports")  # "reports.daily" etc.
 """
-from typing import Any, Callable, Dict, Optional, cast
+from contextlib import suppress
+from importlib import import_module
+from inspect import Parameter, isfunction, signature
+from math import inf
+from threading import RLock
+from types import ModuleType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    KeysView,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    cast,
+)
+from weakref import WeakKeyDictionary
+import asyncio
+import logging
 
-from .result import Result
+from .cache import ResultCache
+from .codes import ERROR_INTERNAL_ERROR
+from .result import Error, Result
 
 Method = Callable[..., Result]
 Methods = Dict[str, Method]
+ArgsCheck = Callable[[List[Any], Dict[str, Any]], None]
+
+EXECUTOR_PROCESS = "process"
+
+logger = logging.getLogger(__name__)
+
+
+class MethodOptions(NamedTuple):
+    """Options given to the @method decorator, describing how to call a method."""
+
+    # "process" to call the method in the shared process pool
+    executor: Optional[str] = None
+    # For async dispatch, call a regular function directly in the event loop rather
+    # than in a thread. Only for cheap methods that don't block.
+    inline: bool = False
+    # Cache successful results, keyed by the params
+    cache: Optional[ResultCache] = None
+    # Identical calls made while one is in progress share its result
+    coalesce: bool = False
+
+
+class Plan(NamedTuple):
+    """What's worked out about a method from inspecting it. This is done once, when the
+    method is registered or first called, then reused for every request.
+    """
+
+    args_check: "ArgsCheck"
+    coroutine: bool  # True for async functions
+
+
+DEFAULT_OPTIONS = MethodOptions()
+
+# Plans are built once per method, then reused for every request. Weak keys so a method
+# that's no longer registered anywhere can be garbage collected.
+plans: "WeakKeyDictionary[Method, Plan]" = WeakKeyDictionary()
+
+# Options for methods registered with @method. Methods without options aren't in here.
+method_options: "WeakKeyDictionary[Method, MethodOptions]" = WeakKeyDictionary()
+
+
+def compile_args_check(func: Method) -> ArgsCheck:
+    """Build a function that checks if func can be called with the given positional and
+    keyword arguments.
+
+    The common shapes of signature are checked by counting arguments. Anything else, and
+    any failed check, goes through Signature.bind, so the TypeError raised is always the
+    one Signature.bind would raise.
+
+    Returns: A function taking the positional and keyword arguments, which raises
+        TypeError if they don't fit the signature.
+    """
+    sig = signature(func)
+    params = list(sig.parameters.values())
+    kinds = {p.kind for p in params}
+
+    def bind(args: List[Any], kwargs: Dict[str, Any]) -> None:
+        sig.bind(*args, **kwargs)
+
+    # No parameters
+    if not params:
+
+        def check_empty(args: List[Any], kwargs: Dict[str, Any]) -> None:
+            if args or kwargs:
+                bind(args, kwargs)
+
+        return check_empty
+
+    # **kwargs only
+    if kinds == {Parameter.VAR_KEYWORD}:
+
+        def check_var_keyword(args: List[Any], kwargs: Dict[str, Any]) -> None:
+            if args:
+                bind(args, kwargs)
+
+        return check_var_keyword
+
+    # *args and **kwargs accept anything
+    if kinds == {Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD}:
+        return lambda args, kwargs: None
+
+    # Positional parameters, given either all by position or all by name
+    if kinds <= {
+        Parameter.POSITIONAL_ONLY,
+        Parameter.POSITIONAL_OR_KEYWORD,
+        Parameter.VAR_POSITIONAL,
+    }:
+        fixed = [p for p in params if p.kind is not Parameter.VAR_POSITIONAL]
+        required = sum(1 for p in fixed if p.default is Parameter.empty)
+        maximum = inf if Parameter.VAR_POSITIONAL in kinds else len(fixed)
+        names = {p.name for p in fixed if p.kind is Parameter.POSITIONAL_OR_KEYWORD}
+        required_names = {p.name for p in fixed if p.default is Parameter.empty}
+
+        def check_positional(args: List[Any], kwargs: Dict[str, Any]) -> None:
+            if not kwargs:
+                if required <= len(args) <= maximum:
+                    return
+            elif not args and required_names <= kwargs.keys() <= names:
+                return
+            bind(args, kwargs)
+
+        return check_positional
+
+    return bind
+
+
+def compile_plan(func: Method) -> Plan:
+    """Inspect a method."""
+    return Plan(compile_args_check(func), asyncio.iscoroutinefunction(func))
+
+
+def get_plan(func: Method) -> Plan:
+    """Get the plan for a method, building it on first use.
+
+    Methods that can't be weakly referenced are not cached.
+    """
+    try:
+        return plans[func]
+    except KeyError:
+        plan = plans[func] = compile_plan(func)
+        return plan
+    except TypeError:
+        return compile_plan(func)
+
+
+def get_args_check(func: Method) -> ArgsCheck:
+    """Get the argument check for a method."""
+    return get_plan(func).args_check
+
+
+def get_options(func: Method) -> MethodOptions:
+    """Get the options a method was registered with."""
+    try:
+        return method_options.get(func, DEFAULT_OPTIONS)
+    except TypeError:
+        return DEFAULT_OPTIONS
+
+
+def split_path(path: str) -> Tuple[str, str]:
+    """Split an import path, "package.module:function" or "package.module.function",
+    into the module and the function's name.
+    """
+    module, colon, name = path.partition(":")
+    if not colon:
+        module, _, name = path.rpartition(".")
+    if not module or not name:
+        raise ValueError(f"Invalid import path {path!r}")
+    return module, name
+
+
+def is_public_function(module: ModuleType, value: Any) -> bool:
+    """True for a function that a namespace exposes as a method - one defined in the
+    module itself (not imported into it), without a leading underscore.
+    """
+    return (
+        isfunction(value)
+        and value.__module__ == module.__name__
+        and not value.__name__.startswith("_")
+    )
+
+
+def import_failed(message: str) -> Method:
+    """A stand-in for a method that couldn't be imported. Each call to it gets an
+    Internal error, without affecting the other requests in a batch.
+    """
+
+    def failed(*_args: Any, **_kwargs: Any) -> Result:
+        return Error(ERROR_INTERNAL_ERROR, "Internal error", message)
+
+    method_options[failed] = MethodOptions(inline=True)
+    return failed
+
+
+class LazyMethods(Dict[str, Method]):
+    """A methods dict that can also hold methods that haven't been imported yet.
+
+    A method registered by import path is imported the first time it's looked up,
+    then stored in the dict like any other, so later lookups cost nothing extra.
+    Imports are done under a lock, so concurrent first calls from threads import once.
+    Under asyncio the import runs synchronously in the event loop, so no other task
+    sees a method half-registered - but it blocks the loop while it runs, which load
+    avoids.
+
+    If an import fails, the error is logged, and calls to the method get an Internal
+    error. The import isn't tried again until load is called.
+
+    Methods registered by path count as in the dict, and are included in its keys.
+    Methods in a namespace are included once its module has been imported. The
+    values and items are only those imported so far.
+
+        >>> methods = LazyMethods()
+        >>> methods.add_lazy("myapp.billing:charge")
+        >>> methods.add_namespace("reports", "myapp.reports")
+        >>> dispatch(request, methods=methods)
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.paths: Dict[str, str] = {}  # Method names, to their import paths
+        self.namespaces: Dict[str, str] = {}  # Name prefixes, to their modules
+        # Stand-ins for the import paths and namespace modules that failed to import
+        self.failed: Dict[str, Method] = {}
+        self.lock = RLock()
+
+    def add_lazy(self, path: str, name: Optional[str] = None) -> None:
+        """Register a method by import path, to import when it's first called.
+
+        Args:
+            path: "package.module:function" or "package.module.function".
+            name: The method name. The function's name by default.
+        """
+        name = name or split_path(path)[1]
+        with self.lock:
+            self.pop(name, None)
+            self.paths[name] = path
+
+    def add_namespace(self, prefix: str, module: str) -> None:
+        """Register a module's functions as methods named "prefix.function", to import
+        when one is first called. Methods registered with @method while the module is
+        imported are also available.
+        """
+        with self.lock:
+            self.namespaces[prefix] = module
+
+    def __missing__(self, name: str) -> Method:
+        with self.lock:
+            # Another thread may have imported it while this one waited for the lock
+            func = self.get(name)
+            if func is not None:
+                return func
+            func = self.resolve(name)
+            if func in self.failed.values():
+                return func
+            self[name] = func
+        with suppress(ValueError):
+            get_plan(func)
+        return func
+
+    def __contains__(self, name: object) -> bool:
+        if super().__contains__(name) or name in self.paths:
+            return True
+        if not isinstance(name, str) or name.rpartition(".")[0] not in self.namespaces:
+            return False
+        try:
+            self[name]  # pylint: disable=pointless-statement
+        except KeyError:
+            return False
+        return True
+
+    def keys(self) -> KeysView[str]:  # type: ignore[override]
+        names = dict.fromkeys(self.paths)
+        names.update(dict.fromkeys(super().keys()))
+        return names.keys()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def fail(self, path: str, exc: Exception) -> Method:
+        """Log an import that failed, and make a stand-in for its methods."""
+        logger.error("Failed to import %s", path, exc_info=exc)
+        failed = self.failed[path] = import_failed(str(exc))
+        return failed
+
+    def resolve(self, name: str) -> Method:
+        """Import a method that isn't in the dict yet. If it can't be imported, a
+        stand-in giving an Internal error is returned.
+
+        Raises: KeyError if it's not registered.
+        """
+        path = self.paths.get(name)
+        if path is None:
+            return self.resolve_in_namespace(name)
+        failed = self.failed.get(path)
+        if failed is not None:
+            return failed
+        module_name, attr = split_path(path)
+        try:
+            return cast(Method, getattr(import_module(module_name), attr))
+        except Exception as exc:  # pylint: disable=broad-except
+            return self.fail(path, exc)
+
+    def resolve_in_namespace(self, name: str) -> Method:
+        """Import a method in a namespace, or a stand-in if its module can't be
+        imported.
+
+        Raises: KeyError if it's not in a namespace, or not in its module.
+        """
+        prefix, _, attr = name.rpartition(".")
+        module_name = self.namespaces.get(prefix)
+        if module_name is None:
+            raise KeyError(name)
+        failed = self.failed.get(module_name)
+        if failed is not None:
+            return failed
+        try:
+            module = import_module(module_name)
+        except Exception as exc:  # pylint: disable=broad-except
+            return self.fail(module_name, exc)
+        # The module may have registered it with @method when imported
+        value = self.get(name)
+        if value is not None:
+            return value
+        value = getattr(module, attr, None)
+        if not is_public_function(module, value):
+            raise KeyError(name)
+        return cast(Method, value)
 
-global_methods = {}
+    def load(self) -> None:
+        """Import all the methods now, and inspect them, so the first requests don't
+        wait for it. Call this at startup, before serving. Imports that failed before
+        are tried again.
+
+        Raises: ImportError if any of them can't be imported, after importing the
+            rest.
+        """
+        with self.lock:
+            self.failed.clear()
+            for name in list(self.paths):
+                self[name]  # pylint: disable=pointless-statement
+            for prefix, module_name in list(self.namespaces.items()):
+                try:
+                    module = import_module(module_name)
+                except Exception as exc:  # pylint: disable=broad-except
+                    self.fail(module_name, exc)
+                    continue
+                for attr, value in vars(module).items():
+                    if is_public_function(module, value):
+                        self.setdefault(f"{prefix}.{attr}", value)
+                        with suppress(ValueError):
+                            get_plan(value)
+            if self.failed:
+                raise ImportError(f"Failed to import {', '.join(self.failed)}")
+
+
+global_methods = LazyMethods()
+
+
+def lazy_method(path: str, name: Optional[str] = None) -> None:
+    """Add a method to global_methods by import path, to import when it's first called.
+    See LazyMethods.add_lazy.
+
+        >>> lazy_method("myapp.billing:charge")
+        >>> lazy_method("myapp.billing.refund", name="billing.refund")
+    """
+    global_methods.add_lazy(path, name)
+
+
+def lazy_namespace(prefix: str, module: str) -> None:
+    """Add a module's functions to global_methods as "prefix.function", to import when
+    one is first called. See LazyMethods.add_namespace.
+
+        >>> lazy_namespace("reports", "myapp.reports")
+    """
+    global_methods.add_namespace(prefix, module)
+
+
+def load_methods() -> None:
+    """Import all the methods added to global_methods lazily. See LazyMethods.load."""
+    global_methods.load()
 
 
 def method(
     f: Optional[Method] = None,  # pylint: disable=invalid-name
     name: Optional[str] = None,
+    *,
+    executor: Optional[str] = None,
+    inline: bool = False,
+    cache: Optional[ResultCache] = None,
+    coalesce: bool = False,
 ) -> Callable[..., Any]:
     """A decorator to add a function into jsonrpcserver's internal global_methods dict.
     The global_methods dict will be used by default unless a methods argument is passed
@@ -34,11 +426,55 @@ def method(
         @method(name=bar)
         def foo():
             ...
+
+    CPU-bound methods can be called in a shared pool of worker processes, so they don't
+    hold the GIL in the dispatching process. The function must be picklable (defined
+    at the top level of a module), as must its arguments:
+
+        @method(executor="process")
+        def crunch(numbers):
+            ...
+
+    With async dispatch, regular (non-async) functions are called in a thread so they
+    don't block the event loop. Cheap methods can be called directly instead:
+
+        @method(inline=True)
+        def ping():
+            ...
+
+    Methods whose result depends only on the params can have their successful results
+    cached. Requests with params seen before are answered from the cache:
+
+        @method(cache=ResultCache(maxsize=1000, ttl=60))
+        def lookup(key):
+            ...
+
+    For such methods, calls with the same params as a call that's still in progress
+    can also wait for that call and share its result, instead of calling the method
+    again. With a cache, this stops a burst of requests all calling the method when a
+    result expires:
+
+        @method(cache=ResultCache(ttl=60), coalesce=True)
+        def lookup(key):
+            ...
     """
+    if executor not in (None, EXECUTOR_PROCESS):
+        raise ValueError(f"Unknown executor {executor!r}")
+    options = MethodOptions(
+        executor=executor, inline=inline, cache=cache, coalesce=coalesce
+    )
 
     def decorator(func: Method) -> Method:
         nonlocal name
+        if options.executor == EXECUTOR_PROCESS and asyncio.iscoroutinefunction(func):
+            raise ValueError("Only regular functions can be called in a process pool")
         global_methods[name or func.__name__] = func
+        if options != DEFAULT_OPTIONS:
+            method_options[func] = options
+        # Inspect the method now rather than on the first request. If there's no
+        # signature available the error is left to surface when the method is called.
+        with suppress(ValueError):
+            get_plan(func)
         return func
 
     return decorator(f) if callable(f) else cast(Method, decorator)
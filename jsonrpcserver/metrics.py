@@ -0,0 +1,345 @@
+"""Metrics for each method: the number of requests, errors by JSON-RPC error code, a
+histogram of the time taken, and the number of calls in flight.
+
+    >>> metrics = Metrics()
+    >>> dispatch(request, metrics=metrics)
+    >>> metrics.snapshot()
+    {'ping': {'requests': 1, 'errors': {}, 'in_flight': 0, 'latency': {...}}}
+    >>> print(metrics.to_prometheus())
+
+The counters are sharded by thread: each thread updates its own, without a lock, and a
+snapshot adds them up. A method that's not found isn't recorded, so the methods are
+only those in the methods dict.
+
+Processes, such as a server's workers, can share their metrics through a directory -
+see Metrics.share.
+"""
+from bisect import bisect_left
+from threading import Lock, Thread, local
+from time import perf_counter, sleep
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+import json
+import logging
+import os
+
+from oslash.either import Left  # type: ignore
+
+from .request import Request
+from .result import Result
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram's buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MethodStats:  # pylint: disable=too-few-public-methods
+    """One thread's counters for one method."""
+
+    __slots__ = ("requests", "errors", "in_flight", "counts", "total")
+
+    def __init__(self, buckets: int) -> None:
+        self.requests = 0
+        self.errors: Dict[int, int] = {}
+        self.in_flight = 0
+        self.counts = [0] * (buckets + 1)  # The last is for longer than every bucket
+        self.total = 0.0  # Seconds
+
+    def add(self, stats: "MethodStats") -> None:
+        """Add another's counters to these."""
+        self.requests += stats.requests
+        self.in_flight += stats.in_flight
+        self.total += stats.total
+        self.counts = [a + b for a, b in zip(self.counts, stats.counts)]
+        for code, count in list(stats.errors.items()):
+            self.errors[code] = self.errors.get(code, 0) + count
+
+    def to_json(self) -> Dict[str, Any]:
+        """The counters, to write to a file shared with other processes."""
+        return {
+            "requests": self.requests,
+            "errors": {str(code): count for code, count in self.errors.items()},
+            "in_flight": self.in_flight,
+            "counts": self.counts,
+            "total": self.total,
+        }
+
+    @classmethod
+    def from_json(cls, value: Dict[str, Any], alive: bool) -> "MethodStats":
+        """Read the counters written by another process. A process that's exited has
+        nothing in flight.
+        """
+        stats = cls(len(value["counts"]) - 1)
+        stats.requests = value["requests"]
+        stats.errors = {int(code): count for code, count in value["errors"].items()}
+        stats.in_flight = value["in_flight"] if alive else 0
+        stats.counts = value["counts"]
+        stats.total = value["total"]
+        return stats
+
+
+def escape(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def header(name: str, kind: str, description: str) -> List[str]:
+    """The HELP and TYPE lines of a metric."""
+    return [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+
+
+def format_bound(bound: float) -> str:
+    """A bucket's upper bound as a Prometheus "le" label."""
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def is_alive(pid: int) -> bool:
+    """True if the process is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metrics:
+    """Records the metrics of calls to methods. Pass it to dispatch, or a Dispatcher.
+
+    Args:
+        buckets: The upper bounds of the latency histogram's buckets, in seconds.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = sorted(buckets)
+        self.local = local()
+        self.shards: List[Dict[str, MethodStats]] = []
+        self.lock = Lock()  # Only for adding a shard
+        self.directory: Optional[str] = None  # Shared with other processes
+
+    def shard(self) -> Dict[str, MethodStats]:
+        """This thread's counters."""
+        try:
+            shard: Dict[str, MethodStats] = self.local.shard
+        except AttributeError:
+            shard = self.local.shard = {}
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def start(self, name: str) -> MethodStats:
+        """Record the start of a call."""
+        shard = self.shard()
+        try:
+            stats = shard[name]
+        except KeyError:
+            stats = shard[name] = MethodStats(len(self.buckets))
+        stats.in_flight += 1
+        return stats
+
+    def finish(self, stats: MethodStats, seconds: float, result: Result) -> None:
+        """Record the end of a call, in the same thread as it started."""
+        stats.in_flight -= 1
+        stats.requests += 1
+        stats.counts[bisect_left(self.buckets, seconds)] += 1
+        stats.total += seconds
+        if isinstance(result, Left):
+            code = result._error.code  # pylint: disable=protected-access
+            stats.errors[code] = stats.errors.get(code, 0) + 1
+
+    def observe(
+        self, name: str, call: Callable[[Request], Result], request: Request
+    ) -> Result:
+        """Call a method, recording the call."""
+        stats = self.start(name)
+        start = perf_counter()
+        try:
+            result = call(request)
+        except BaseException:
+            stats.in_flight -= 1
+            raise
+        self.finish(stats, perf_counter() - start, result)
+        return result
+
+    async def observe_async(
+        self, name: str, call: Callable[[Request], Awaitable[Result]], request: Request
+    ) -> Result:
+        """Async version of observe."""
+        stats = self.start(name)
+        start = perf_counter()
+        try:
+            result = await call(request)
+        except BaseException:
+            stats.in_flight -= 1
+            raise
+        self.finish(stats, perf_counter() - start, result)
+        return result
+
+    def share(self, directory: str, interval: float = 1.0) -> None:
+        """Share the metrics with the other processes using the directory, such as the
+        workers of a server, so each gives the metrics of them all.
+
+        Each process writes its counters to a file in the directory every interval
+        seconds (in a thread), and when asked for the metrics. The metrics are those
+        files added up, so the other processes' calls in the last interval may not be
+        included yet. The counters of processes that have exited are kept.
+
+        Call it in each process, after forking. The directory is left for the caller
+        to remove.
+        """
+        self.directory = directory
+
+        def write_periodically() -> None:
+            while self.directory == directory:  # Until shared elsewhere, or not
+                sleep(interval)
+                try:
+                    self.write()
+                except OSError:
+                    logger.exception("Failed to write metrics to %s", directory)
+
+        Thread(
+            target=write_periodically, name="jsonrpcserver-metrics", daemon=True
+        ).start()
+
+    def write(self) -> None:
+        """Write this process's counters to the shared directory."""
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(
+                {name: stats.to_json() for name, stats in self.own_totals().items()},
+                file,
+            )
+        os.replace(f"{path}.tmp", path)  # Atomically, so it's never read half-written
+
+    def own_totals(self) -> Dict[str, MethodStats]:
+        """The counters of each method in this process, added up across the threads."""
+        totals: Dict[str, MethodStats] = {}
+        with self.lock:
+            shards = list(self.shards)
+        for shard in shards:
+            for name, stats in list(shard.items()):
+                total = totals.get(name)
+                if total is None:
+                    total = totals[name] = MethodStats(len(self.buckets))
+                total.add(stats)
+        return totals
+
+    def shared_totals(self, directory: str) -> Dict[str, MethodStats]:
+        """The counters of each method, added up across the processes sharing the
+        directory.
+        """
+        self.write()
+        totals: Dict[str, MethodStats] = {}
+        for filename in os.listdir(directory):
+            pid, _, extension = filename.partition(".")
+            if extension != "json":
+                continue
+            try:
+                with open(os.path.join(directory, filename), encoding="utf-8") as file:
+                    written = json.load(file)
+            except FileNotFoundError:
+                continue
+            alive = is_alive(int(pid))
+            for name, value in written.items():
+                stats = MethodStats.from_json(value, alive)
+                total = totals.get(name)
+                if total is None:
+                    totals[name] = stats
+                else:
+                    total.add(stats)
+        return totals
+
+    def totals(self) -> List[Tuple[str, MethodStats]]:
+        """The counters of each method, added up across the threads (and processes,
+        if shared).
+        """
+        if self.directory is None:
+            return sorted(self.own_totals().items())
+        return sorted(self.shared_totals(self.directory).items())
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """The metrics of each method, as a dict. The latency buckets are cumulative,
+        as in Prometheus: the number of calls that took at most that many seconds.
+        """
+        bounds = self.buckets + [float("inf")]
+        snapshot = {}
+        for name, stats in self.totals():
+            cumulative, buckets = 0, {}
+            for bound, count in zip(bounds, stats.counts):
+                cumulative += count
+                buckets[bound] = cumulative
+            snapshot[name] = {
+                "requests": stats.requests,
+                "errors": dict(sorted(stats.errors.items())),
+                "in_flight": stats.in_flight,
+                "latency": {
+                    "buckets": buckets,
+                    "sum": stats.total,
+                    "count": stats.requests,
+                },
+            }
+        return snapshot
+
+    def to_prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        labels = {name: f'method="{escape(name)}"' for name in snapshot}
+        lines = header("jsonrpc_requests_total", "counter", "Requests to each method.")
+        for name, stats in snapshot.items():
+            lines.append(
+                f"jsonrpc_requests_total{{{labels[name]}}} {stats['requests']}"
+            )
+        lines += header(
+            "jsonrpc_errors_total", "counter", "Error responses, by method and code."
+        )
+        for name, stats in snapshot.items():
+            for code, count in stats["errors"].items():
+                lines.append(
+                    f'jsonrpc_errors_total{{{labels[name]},code="{code}"}} {count}'
+                )
+        lines += header(
+            "jsonrpc_in_flight", "gauge", "Calls to each method in progress."
+        )
+        for name, stats in snapshot.items():
+            lines.append(f"jsonrpc_in_flight{{{labels[name]}}} {stats['in_flight']}")
+        histogram = "jsonrpc_request_duration_seconds"
+        lines += header(histogram, "histogram", "Time taken by calls to each method.")
+        for name, stats in snapshot.items():
+            latency = stats["latency"]
+            for bound, count in latency["buckets"].items():
+                lines.append(
+                    f'{histogram}_bucket{{{labels[name]},le="{format_bound(bound)}"}} '
+                    f"{count}"
+                )
+            lines.append(f"{histogram}_sum{{{labels[name]}}} {latency['sum']!r}")
+            lines.append(f"{histogram}_count{{{labels[name]}}} {latency['count']}")
+        return "\n".join(lines) + "\n"
@@ -12,6 +12,7 @@ from .codes import (
     ERROR_PARSE_ERROR,
     ERROR_SERVER_ERROR,
 )
+from .result import CompactLeft, CompactRight
 from .sentinels import NODATA
 
 Deserialized = Union[Dict[str, Any], List[Dict[str, Any]]]
@@ -37,6 +38,14 @@ class ErrorResponse(NamedTuple):
     id: Any
 
 
+class SuccessResponseRight(CompactRight, SuccessResponse):
+    """Right(SuccessResponse(...)) as one object. See result.CompactRight."""
+
+
+class ErrorResponseLeft(CompactLeft, ErrorResponse):
+    """Left(ErrorResponse(...)) as one object. See result.CompactLeft."""
+
+
 Response = Either[ErrorResponse, SuccessResponse]
 ResponseType = Type[Either[ErrorResponse, SuccessResponse]]
 
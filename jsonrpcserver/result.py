@@ -6,7 +6,7 @@ parts - the library takes care of these parts for you.
 
 The public functions are Success, Error and InvalidParams.
 """
-from typing import Any, NamedTuple
+from typing import Any, Dict, NamedTuple, Tuple, cast
 
 from oslash.either import Either, Left, Right  # type: ignore
 
@@ -36,6 +36,114 @@ class ErrorResult(NamedTuple):
 Result = Either[ErrorResult, SuccessResult]
 
 
+# Compact Eithers. Right(SuccessResult(...)) is two objects; a CompactRight subclass
+# that's also a SuccessResult is one, the Right being the tuple it holds - its _value is
+# itself. They're equal to, and work the same as, the two-object versions.
+
+
+class CompactRight(Right):  # type: ignore[misc]
+    """A Right that's also the NamedTuple it holds. Subclass it with the NamedTuple."""
+
+    # The fields are set by the tuple's __new__. Right.__init__ would store a value.
+    def __init__(  # pylint: disable=super-init-not-called
+        self, *_: Any, **__: Any
+    ) -> None:
+        pass
+
+    @property
+    def _value(self) -> Any:
+        return self
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Left):
+            return False
+        if isinstance(other, Right):
+            other = other._value
+        return isinstance(other, tuple) and tuple.__eq__(
+            cast(Tuple[Any, ...], self), other
+        )
+
+    def __ne__(self, other: Any) -> bool:
+        return not self == other
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return f"Right({super().__repr__()})"
+
+    __str__ = __repr__
+
+
+class CompactLeft(Left):  # type: ignore[misc]
+    """A Left that's also the NamedTuple it holds. Subclass it with the NamedTuple."""
+
+    def __init__(  # pylint: disable=super-init-not-called
+        self, *_: Any, **__: Any
+    ) -> None:
+        pass
+
+    @property
+    def _error(self) -> Any:
+        return self
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Right):
+            return False
+        if isinstance(other, Left):
+            other = other._error
+        return isinstance(other, tuple) and tuple.__eq__(
+            cast(Tuple[Any, ...], self), other
+        )
+
+    def __ne__(self, other: Any) -> bool:
+        return not self == other
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return f"Left({super().__repr__()})"
+
+    __str__ = __repr__
+
+
+class SuccessResultRight(CompactRight, SuccessResult):
+    """Right(SuccessResult(...)) as one object. What Success gives."""
+
+
+class ErrorResultLeft(CompactLeft, ErrorResult):
+    """Left(ErrorResult(...)) as one object. What Error gives."""
+
+
+# Serializing
+
+
+def to_dict(result: Either[ErrorResult, SuccessResult]) -> Dict[str, Any]:
+    """Serialize a Result to a dict, the same shape as a response minus "jsonrpc" and
+    "id". Used to send results back from worker processes, which can't send the
+    sentinels.
+    """
+    # pylint: disable=protected-access
+    if isinstance(result, Left):
+        error = result._error
+        return {
+            "error": {
+                "code": error.code,
+                "message": error.message,
+                **({"data": error.data} if error.data is not NODATA else {}),
+            }
+        }
+    return {"result": result._value.result}
+
+
+def from_dict(result: Dict[str, Any]) -> Either[ErrorResult, SuccessResult]:
+    """The inverse of to_dict."""
+    return (
+        ErrorResultLeft(**result["error"])
+        if "error" in result
+        else SuccessResultRight(result["result"])
+    )
+
+
 # Helpers
 
 
@@ -55,15 +163,15 @@ def InvalidParamsResult(data: Any = NODATA) -> ErrorResult:
 
 
 def Success(*args: Any, **kwargs: Any) -> Either[ErrorResult, SuccessResult]:
-    return Right(SuccessResult(*args, **kwargs))
+    return SuccessResultRight(*args, **kwargs)
 
 
 def Error(*args: Any, **kwargs: Any) -> Either[ErrorResult, SuccessResult]:
-    return Left(ErrorResult(*args, **kwargs))
+    return ErrorResultLeft(*args, **kwargs)
 
 
 def InvalidParams(*args: Any, **kwargs: Any) -> Either[ErrorResult, SuccessResult]:
     """InvalidParams is a shortcut to save you from having to pass the Invalid Params
     JSON-RPC code to Error.
     """
-    return Left(InvalidParamsResult(*args, **kwargs))
+    return ErrorResultLeft(ERROR_INVALID_PARAMS, "Invalid params", *args, **kwargs)
@@ -1,28 +1,271 @@
-"""A simple development server for serving JSON-RPC requests using Python's builtin
-http.server module.
+"""A JSON-RPC server using Python's builtin http.server module.
+
+Each connection is read by its own thread, over HTTP/1.1 connections that are kept
+alive between requests, and the requests are dispatched in a pool of threads. So idle
+keep-alive connections don't hold up the others, while the pool bounds how many methods
+run at once. A request with no response - a notification, or a batch of notifications -
+is answered with 204 No Content.
+
+If given a Metrics, the calls are recorded, and the metrics are served in the
+Prometheus text format with a GET request to the metrics path.
+
+With workers, requests are served by that many forked processes, sharing the port
+with SO_REUSEPORT where it's available, so the kernel spreads the connections across
+them. Otherwise they share a listening socket inherited from the supervisor. See
+supervisor.py. The workers share their metrics through a temporary directory, so any
+of them serves the metrics of them all.
 """
-import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Any, Callable, Optional, Tuple, Type
+import io
+import logging
+import os
+import shutil
+import socket
+import tempfile
+
+from .main import dispatch_to_bytes
+from .metrics import PROMETHEUS_CONTENT_TYPE, Metrics
+from .supervisor import Supervisor, stop_on_sigterm
+
+DEFAULT_MAX_WORKERS = 32
+DEFAULT_MAX_REQUEST_SIZE = 1024 * 1024  # Bytes
+DEFAULT_KEEP_ALIVE_TIMEOUT = 15.0  # Seconds
 
-from .main import dispatch
+logger = logging.getLogger(__name__)
 
 
 class RequestHandler(BaseHTTPRequestHandler):
     """Handle HTTP requests"""
 
+    server: "Server"
+    protocol_version = "HTTP/1.1"
+    # Send small responses straight away, and the headers and body in one write
+    disable_nagle_algorithm = True
+    wbufsize = io.DEFAULT_BUFFER_SIZE
+
+    def setup(self) -> None:
+        super().setup()
+        # An idle keep-alive connection is closed after this long
+        self.connection.settimeout(self.server.keep_alive_timeout)
+
+    def content_length(self) -> Optional[int]:
+        """The length of the request body, or None if an error response was sent
+        because it's missing, invalid or too large.
+        """
+        if "Transfer-Encoding" in self.headers:
+            self.send_error(HTTPStatus.LENGTH_REQUIRED)
+            return None
+        try:
+            length = int(str(self.headers["Content-Length"]))
+        except ValueError:
+            self.send_error(
+                HTTPStatus.LENGTH_REQUIRED
+                if self.headers["Content-Length"] is None
+                else HTTPStatus.BAD_REQUEST
+            )
+            return None
+        if length < 0:
+            self.send_error(HTTPStatus.BAD_REQUEST)
+            return None
+        if length > self.server.max_request_size:
+            self.send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            return None
+        return length
+
+    def handle_expect_100(self) -> bool:
+        """Reject a body that's too large before the client sends it."""
+        if self.command == "POST" and self.content_length() is None:
+            return False
+        return super().handle_expect_100()
+
     def do_POST(self) -> None:  # pylint: disable=invalid-name
         """Handle POST request"""
-        response = dispatch(
-            self.rfile.read(int(str(self.headers["Content-Length"]))).decode()
-        )
-        if response is not None:
-            self.send_response(200)
-            self.send_header("Content-type", "application/json")
+        length = self.content_length()
+        if length is None:
+            return
+        response = self.server.pool.submit(
+            dispatch_to_bytes, self.rfile.read(length), metrics=self.server.metrics
+        ).result()
+        if not response:
+            self.send_response(HTTPStatus.NO_CONTENT)
             self.end_headers()
-            self.wfile.write(str(response).encode())
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Handle GET request, for the metrics"""
+        metrics = self.server.metrics
+        if metrics is None or self.path != self.server.metrics_path:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        body = metrics.to_prometheus().encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # pylint: disable=redefined-builtin
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    """An HTTP server reading each connection in its own thread, and dispatching the
+    requests in a pool of threads.
+
+    Args:
+        server_address: The host and port to listen on.
+        handler: The request handler class.
+        metrics: Records the calls, and serves the metrics at the metrics path.
+        metrics_path: The path to serve the metrics at.
+        max_workers: The most requests dispatched at once. Further requests wait for
+            a thread to become free.
+        max_request_size: The largest request body accepted, in bytes. A larger one
+            is answered with 413.
+        keep_alive_timeout: How long to keep an idle connection open, in seconds.
+        reuse_port: Set SO_REUSEPORT, so other processes can listen on the port.
+    """
+
+    daemon_threads = True
+    block_on_close = False
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        server_address: Tuple[str, int],
+        handler: Type[BaseHTTPRequestHandler] = RequestHandler,
+        metrics: Optional[Metrics] = None,
+        metrics_path: str = "/metrics",
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_request_size: int = DEFAULT_MAX_REQUEST_SIZE,
+        keep_alive_timeout: float = DEFAULT_KEEP_ALIVE_TIMEOUT,
+        reuse_port: bool = False,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        self.metrics = metrics
+        self.metrics_path = metrics_path
+        self.max_request_size = max_request_size
+        self.keep_alive_timeout = keep_alive_timeout
+        self.reuse_port = reuse_port
+        self.pool = ThreadPoolExecutor(
+            max_workers, thread_name_prefix="jsonrpcserver-http"
+        )
+        super().__init__(server_address, handler)
+
+    def server_bind(self) -> None:
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        logger.exception("Error handling a request from %s", client_address)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def work(server: Callable[[], Server], metrics_directory: Optional[str] = None) -> None:
+    """Serve in a worker process, until it's stopped."""
+    with server() as server_:
+        if server_.metrics is not None and metrics_directory is not None:
+            server_.metrics.share(metrics_directory)
+        stop_on_sigterm(server_.shutdown)
+        try:
+            server_.serve_forever()
+        finally:
+            if server_.metrics is not None:
+                server_.metrics.write()
+
+
+def serve(
+    name: str = "",
+    port: int = 5000,
+    metrics: Optional[Metrics] = None,
+    metrics_path: str = "/metrics",
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    max_request_size: int = DEFAULT_MAX_REQUEST_SIZE,
+    keep_alive_timeout: float = DEFAULT_KEEP_ALIVE_TIMEOUT,
+    workers: Optional[int] = None,
+) -> None:
+    """Serve HTTP requests until interrupted.
+
+    Args:
+        name: The host to listen on. All interfaces by default.
+        port: The port to listen on.
+        metrics: Records the calls, and serves the metrics at the metrics path. With
+            workers, the metrics are those of all the workers, added up.
+        metrics_path: The path to serve the metrics at.
+        max_workers: The most requests dispatched at once (by each worker).
+        max_request_size: The largest request body accepted, in bytes.
+        keep_alive_timeout: How long to keep an idle connection open, in seconds.
+        workers: The number of worker processes to serve with. By default, requests
+            are served in this process.
+    """
+    # pylint: disable=too-many-arguments
+    server = partial(
+        Server,
+        metrics=metrics,
+        metrics_path=metrics_path,
+        max_workers=max_workers,
+        max_request_size=max_request_size,
+        keep_alive_timeout=keep_alive_timeout,
+    )
+    if workers is None:
+        with server((name, port)) as server_:
+            logging.info(" * Listening on port %s", server_.server_address[1])
+            server_.serve_forever()
+        return
+    if not hasattr(os, "fork"):
+        raise ValueError("Serving with workers needs os.fork")
+    metrics_directory = (
+        tempfile.mkdtemp(prefix="jsonrpcserver-metrics-")
+        if metrics is not None
+        else None
+    )
+    try:
+        serve_workers(name, port, server, workers, metrics_directory)
+    finally:
+        if metrics_directory is not None:
+            shutil.rmtree(metrics_directory, ignore_errors=True)
 
 
-def serve(name: str = "", port: int = 5000) -> None:
-    """A simple function to serve HTTP requests"""
-    logging.info(" * Listening on port %s", port)
-    HTTPServer((name, port), RequestHandler).serve_forever()
+def serve_workers(
+    name: str,
+    port: int,
+    server: Callable[..., Server],
+    workers: int,
+    metrics_directory: Optional[str],
+) -> None:
+    """Serve with worker processes, until interrupted."""
+    if hasattr(socket, "SO_REUSEPORT"):
+        # Bound to reserve the port, but not listening, so connections only go to
+        # the workers' sockets
+        with socket.socket() as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((name, port))
+            port = sock.getsockname()[1]
+            logging.info(" * Listening on port %s", port)
+            Supervisor(
+                workers,
+                partial(
+                    work,
+                    partial(server, (name, port), reuse_port=True),
+                    metrics_directory,
+                ),
+            ).run()
+    else:
+        with server((name, port)) as server_:
+            logging.info(" * Listening on port %s", server_.server_address[1])
+            Supervisor(workers, partial(work, lambda: server_, metrics_directory)).run()
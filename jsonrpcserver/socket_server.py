@@ -0,0 +1,577 @@
+"""Serving JSON-RPC over TCP or Unix domain sockets, without HTTP.
+
+Each message is a request (or batch) and each response is framed the same way, with
+one of these framings:
+
+- NDJSON: each message is a line of json, ending with a newline.
+- LENGTH_PREFIXED: each message is preceded by its length in bytes, as a 4 byte
+  big-endian unsigned integer.
+- CONTENT_LENGTH: each message is preceded by headers including its length, as in
+  the Language Server Protocol: "Content-Length: 2\r\n\r\n{}".
+
+A client can send many requests on a connection without waiting for the responses.
+They're dispatched concurrently, up to max_concurrency at once for each connection, and
+each response is sent as soon as it's ready, so they may be out of order - match them
+to the requests by id. Notifications get no response. With the threaded server, a
+client that doesn't read its responses within send_timeout is disconnected, so it can't
+hold up the threads dispatching the other connections' requests.
+
+The address is a (host, port) tuple for TCP, or a path for a Unix domain socket.
+
+    >>> serve_stream(("", 5000))  # Threaded
+    >>> asyncio.run(serve_stream_async("/run/jsonrpc.sock", framing=LENGTH_PREFIXED))
+"""
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import (
+    StreamRequestHandler,
+    TCPServer,
+    ThreadingMixIn,
+    UnixStreamServer,
+)
+from threading import BoundedSemaphore, Lock
+from typing import Any, BinaryIO, List, Optional, Set, Tuple, Type, Union
+import asyncio
+import io
+import logging
+import os
+import socket
+import stat
+import struct
+
+from . import async_main, main
+from .metrics import Metrics
+
+DEFAULT_MAX_MESSAGE_SIZE = 1024 * 1024  # Bytes
+DEFAULT_MAX_CONCURRENCY = 64  # Requests dispatched at once for each connection
+DEFAULT_MAX_WORKERS = 32  # Threads dispatching requests, for the threaded server
+DEFAULT_SEND_TIMEOUT = 30.0  # Seconds, for the threaded server
+
+Address = Union[Tuple[str, int], str]
+
+logger = logging.getLogger(__name__)
+
+
+class FramingError(Exception):
+    """A message that's too large, or not framed properly. The connection is closed,
+    as the next message can't be found.
+    """
+
+
+class Ndjson:
+    """Newline-delimited json framing."""
+
+    def read(self, stream: BinaryIO, max_size: int) -> Optional[bytes]:
+        """Read the next message, or None at the end of the stream."""
+        while True:
+            line = stream.readline(max_size + 1)
+            if not line:
+                return None
+            if len(line) > max_size and not line.endswith(b"\n"):
+                raise FramingError("Message too large")
+            if line.strip():  # Blank lines are skipped
+                return line
+
+    async def read_async(
+        self, reader: asyncio.StreamReader, max_size: int
+    ) -> Optional[bytes]:
+        """Async version of read. The reader's limit should be max_size."""
+        # pylint: disable=unused-argument
+        while True:
+            try:
+                line = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError as exc:
+                line = exc.partial
+                if not line.strip():
+                    return None
+            except asyncio.LimitOverrunError:
+                raise FramingError("Message too large") from None
+            if line.strip():
+                return line
+
+    def frame(self, message: bytes) -> bytes:
+        """The message framed, ready to send."""
+        return message + b"\n"
+
+
+class LengthPrefixed:
+    """Framing with the length of each message before it."""
+
+    prefix = struct.Struct(">I")
+
+    def length(self, prefix: bytes, max_size: int) -> int:
+        """The length of the message following the prefix."""
+        (length,) = self.prefix.unpack(prefix)
+        if length > max_size:
+            raise FramingError("Message too large")
+        return int(length)
+
+    def read(self, stream: BinaryIO, max_size: int) -> Optional[bytes]:
+        """Read the next message, or None at the end of the stream."""
+        prefix = stream.read(self.prefix.size)
+        if not prefix:
+            return None
+        if len(prefix) < self.prefix.size:
+            raise FramingError("Incomplete length prefix")
+        length = self.length(prefix, max_size)
+        message = stream.read(length)
+        if len(message) < length:
+            raise FramingError("Incomplete message")
+        return message
+
+    async def read_async(
+        self, reader: asyncio.StreamReader, max_size: int
+    ) -> Optional[bytes]:
+        """Async version of read."""
+        try:
+            prefix = await reader.readexactly(self.prefix.size)
+        except asyncio.IncompleteReadError as exc:
+            if not exc.partial:
+                return None
+            raise FramingError("Incomplete length prefix") from None
+        try:
+            return await reader.readexactly(self.length(prefix, max_size))
+        except asyncio.IncompleteReadError:
+            raise FramingError("Incomplete message") from None
+
+    def frame(self, message: bytes) -> bytes:
+        """The message framed, ready to send."""
+        return self.prefix.pack(len(message)) + message
+
+
+def parse_content_length(headers: bytes, max_size: int) -> int:
+    """The length of the message from its headers. Other headers are ignored."""
+    for line in headers.splitlines():
+        name, colon, value = line.partition(b":")
+        if colon and name.strip().lower() == b"content-length":
+            if not value.strip().isdigit():
+                raise FramingError("Invalid Content-Length")
+            length = int(value)
+            if length > max_size:
+                raise FramingError("Message too large")
+            return length
+    raise FramingError("No Content-Length")
+
+
+class ContentLength:
+    """Framing with headers before each message, including its Content-Length. The
+    header lines end with "\r\n", or "\n" alone.
+    """
+
+    max_headers_size = 4096  # Bytes
+
+    def end_of_headers(self, headers: bytes, line: bytes) -> bool:
+        """True if the line is the blank line ending the headers. Raises FramingError
+        if the headers are too large, or the stream ended in them.
+        """
+        if line in (b"\r\n", b"\n"):
+            return True
+        if len(headers) + len(line) > self.max_headers_size:
+            raise FramingError("Headers too large")
+        if not line.endswith(b"\n"):
+            raise FramingError("Incomplete headers")
+        return False
+
+    def read(self, stream: BinaryIO, max_size: int) -> Optional[bytes]:
+        """Read the next message, or None at the end of the stream."""
+        headers = b""
+        while True:
+            line = stream.readline(self.max_headers_size - len(headers) + 1)
+            if not line and not headers:
+                return None
+            if self.end_of_headers(headers, line):
+                break
+            headers += line
+        length = parse_content_length(headers, max_size)
+        message = stream.read(length)
+        if len(message) < length:
+            raise FramingError("Incomplete message")
+        return message
+
+    async def read_async(
+        self, reader: asyncio.StreamReader, max_size: int
+    ) -> Optional[bytes]:
+        """Async version of read."""
+        headers = b""
+        while True:
+            try:
+                line = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError as exc:
+                line = exc.partial
+            except asyncio.LimitOverrunError:  # A line longer than the reader's limit
+                raise FramingError("Headers too large") from None
+            if not line and not headers:
+                return None
+            if self.end_of_headers(headers, line):
+                break
+            headers += line
+        try:
+            return await reader.readexactly(parse_content_length(headers, max_size))
+        except asyncio.IncompleteReadError:
+            raise FramingError("Incomplete message") from None
+
+    def frame(self, message: bytes) -> bytes:
+        """The message framed, ready to send."""
+        return b"Content-Length: %d\r\n\r\n%s" % (len(message), message)
+
+
+Framing = Union[Ndjson, LengthPrefixed, ContentLength]
+
+NDJSON = Ndjson()
+LENGTH_PREFIXED = LengthPrefixed()
+CONTENT_LENGTH = ContentLength()
+
+
+class PatientReader(io.RawIOBase):
+    """Reads a socket that has a timeout as though it had none, waiting as long as it
+    takes for data.
+    """
+
+    def __init__(self, sock: socket.socket) -> None:
+        super().__init__()
+        self.sock = sock
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while True:
+            try:
+                return self.sock.recv_into(buffer)
+            except socket.timeout:
+                pass
+
+
+class StreamHandler(StreamRequestHandler):
+    """Handles a connection to a threaded stream server."""
+
+    server: Union["ThreadingTcpServer", "ThreadingUnixServer"]
+
+    def setup(self) -> None:
+        super().setup()
+        if self.connection.family != socket.AF_UNIX:
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # The timeout is for sending. A connection can be idle for as long as it likes
+        self.connection.settimeout(self.server.send_timeout)
+        self.rfile.close()
+        self.rfile = io.BufferedReader(PatientReader(self.connection))
+
+    def handle(self) -> None:
+        server = self.server
+        lock = Lock()  # For writing a response
+        in_flight = BoundedSemaphore(server.max_concurrency)
+        try:
+            while True:
+                message = server.framing.read(self.rfile, server.max_message_size)
+                if message is None:
+                    break
+                in_flight.acquire()  # pylint: disable=consider-using-with
+                server.pool.submit(self.respond, message, lock, in_flight)
+        except FramingError as exc:
+            logger.info("Closing connection from %s: %s", self.client_address, exc)
+        except ConnectionError:
+            pass
+        finally:
+            # Wait for the responses to the requests in progress
+            for _ in range(server.max_concurrency):
+                in_flight.acquire()  # pylint: disable=consider-using-with
+
+    def respond(self, message: bytes, lock: Lock, in_flight: BoundedSemaphore) -> None:
+        """Dispatch a request, in a thread from the server's pool, and send the
+        response.
+        """
+        try:
+            response = main.dispatch_to_bytes(message, metrics=self.server.metrics)
+            if response:
+                framed = self.server.framing.frame(response)
+                with lock:
+                    self.wfile.write(framed)
+        except socket.timeout:
+            # Perhaps part of the response was sent, so the connection is unusable
+            logger.info(
+                "Closing connection from %s: Send timed out", self.client_address
+            )
+            self.disconnect()
+        except OSError:
+            pass  # The connection was closed
+        finally:
+            in_flight.release()
+
+    def disconnect(self) -> None:
+        """Shut the connection down, ending the requests read from it."""
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # Already disconnected
+
+
+class ThreadingStreamServer:  # pylint: disable=too-few-public-methods
+    """The options of a threaded stream server. Each connection is handled by a
+    thread, and the requests are dispatched in a shared pool of threads.
+
+    Args:
+        framing: NDJSON, LENGTH_PREFIXED or CONTENT_LENGTH.
+        max_message_size: The largest message accepted, in bytes. A larger one closes
+            the connection.
+        max_concurrency: The most requests dispatched at once for each connection.
+            Once reached, no more are read from the connection until one finishes. At
+            most half of max_workers, so one connection can't take all the threads.
+        max_workers: The size of the pool of threads dispatching requests.
+        metrics: Records the calls.
+        send_timeout: How long to wait for a client to read a response, in seconds,
+            before disconnecting it.
+    """
+
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(
+        self,
+        framing: Framing = NDJSON,
+        max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        metrics: Optional[Metrics] = None,
+        send_timeout: float = DEFAULT_SEND_TIMEOUT,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        self.framing = framing
+        self.max_message_size = max_message_size
+        self.max_concurrency = min(max_concurrency, max(1, max_workers // 2))
+        self.metrics = metrics
+        self.send_timeout = send_timeout
+        self.pool = ThreadPoolExecutor(
+            max_workers, thread_name_prefix="jsonrpcserver-stream"
+        )
+
+
+class ThreadingTcpServer(ThreadingStreamServer, ThreadingMixIn, TCPServer):
+    """A threaded server for TCP. See ThreadingStreamServer for the options."""
+
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        handler: Type[StreamHandler] = StreamHandler,
+        **options: Any,
+    ) -> None:
+        ThreadingStreamServer.__init__(self, **options)
+        TCPServer.__init__(self, address, handler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+class ThreadingUnixServer(ThreadingStreamServer, ThreadingMixIn, UnixStreamServer):
+    """A threaded server for a Unix domain socket. A socket file left at the path is
+    replaced. See ThreadingStreamServer for the options.
+    """
+
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        path: str,
+        handler: Type[StreamHandler] = StreamHandler,
+        **options: Any,
+    ) -> None:
+        ThreadingStreamServer.__init__(self, **options)
+        self.path = path
+        UnixStreamServer.__init__(self, path, handler)
+
+    def server_bind(self) -> None:
+        remove_socket_file(self.path)
+        super().server_bind()
+
+    def server_close(self) -> None:
+        super().server_close()
+        remove_socket_file(self.path)
+        self.pool.shutdown(wait=True)
+
+
+def remove_socket_file(path: str) -> None:
+    """Remove the socket file at the path, if there's one."""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def make_server(
+    address: Address, **options: Any
+) -> Union[ThreadingTcpServer, ThreadingUnixServer]:
+    """A threaded server for the address. See ThreadingStreamServer for the options."""
+    if isinstance(address, str):
+        return ThreadingUnixServer(address, **options)
+    return ThreadingTcpServer(address, **options)
+
+
+def serve_stream(
+    address: Address,
+    framing: Framing = NDJSON,
+    max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    metrics: Optional[Metrics] = None,
+    send_timeout: float = DEFAULT_SEND_TIMEOUT,
+) -> None:
+    """Serve requests over TCP or a Unix domain socket, with threads, until
+    interrupted. See ThreadingStreamServer for the options.
+    """
+    # pylint: disable=too-many-arguments
+    with make_server(
+        address,
+        framing=framing,
+        max_message_size=max_message_size,
+        max_concurrency=max_concurrency,
+        max_workers=max_workers,
+        metrics=metrics,
+        send_timeout=send_timeout,
+    ) as server:
+        logging.info(" * Listening on %s", server.server_address)
+        server.serve_forever()
+
+
+class ResponseWriter:
+    """Writes the responses on a connection. Those finished in the same iteration of
+    the event loop are joined, and sent in one write.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.pending: List[bytes] = []
+        self.drain_lock = asyncio.Lock()  # Only one drain at a time before Python 3.10
+
+    async def send(self, data: bytes) -> None:
+        """Send a framed response, waiting if the client is slow to read them."""
+        if not self.pending:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.pending.append(data)
+        # Usually the responses were sent straight away, with nothing to drain
+        if self.writer.transport.get_write_buffer_size():
+            async with self.drain_lock:
+                await self.writer.drain()
+
+    def flush(self) -> None:
+        """Write the pending responses."""
+        if self.pending and not self.writer.is_closing():
+            self.writer.write(b"".join(self.pending))
+        self.pending.clear()
+
+
+class StreamConnectionHandler:
+    """Handles the connections to an async stream server. See start_stream_server for
+    the arguments.
+    """
+
+    def __init__(
+        self,
+        framing: Framing,
+        max_message_size: int,
+        max_concurrency: int,
+        metrics: Optional[Metrics],
+    ) -> None:
+        self.framing = framing
+        self.max_message_size = max_message_size
+        self.max_concurrency = max_concurrency
+        self.metrics = metrics
+
+    async def __call__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        in_flight = asyncio.Semaphore(self.max_concurrency)
+        responses = ResponseWriter(writer)
+        tasks: Set["asyncio.Future[None]"] = set()
+        try:
+            while True:
+                message = await self.framing.read_async(reader, self.max_message_size)
+                if message is None:
+                    break
+                await in_flight.acquire()
+                task = asyncio.ensure_future(
+                    self.respond(responses, in_flight, message)
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except FramingError as exc:
+            logger.info(
+                "Closing connection from %s: %s", writer.get_extra_info("peername"), exc
+            )
+        except ConnectionError:
+            pass
+        finally:
+            if tasks:
+                await asyncio.wait(tasks)
+            responses.flush()
+            writer.close()
+
+    async def respond(
+        self, responses: ResponseWriter, in_flight: asyncio.Semaphore, message: bytes
+    ) -> None:
+        """Dispatch a request and send the response."""
+        try:
+            response = await async_main.dispatch_to_bytes(message, metrics=self.metrics)
+            if response:
+                await responses.send(self.framing.frame(response))
+        except ConnectionError:
+            pass
+        finally:
+            in_flight.release()
+
+
+async def start_stream_server(
+    address: Address,
+    framing: Framing = NDJSON,
+    max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    metrics: Optional[Metrics] = None,
+) -> asyncio.AbstractServer:
+    """Start serving requests over TCP or a Unix domain socket in the running event
+    loop.
+
+    Args:
+        address: A (host, port) tuple for TCP, or a path for a Unix domain socket.
+        framing: NDJSON, LENGTH_PREFIXED or CONTENT_LENGTH.
+        max_message_size: The largest message accepted, in bytes. A larger one closes
+            the connection.
+        max_concurrency: The most requests dispatched at once for each connection.
+            Once reached, no more are read from the connection until one finishes.
+        metrics: Records the calls.
+
+    Returns: The server, already serving.
+    """
+    # pylint: disable=too-many-arguments
+    handler = StreamConnectionHandler(
+        framing, max_message_size, max_concurrency, metrics
+    )
+    if isinstance(address, str):
+        return await asyncio.start_unix_server(handler, address, limit=max_message_size)
+    return await asyncio.start_server(
+        handler, address[0], address[1], limit=max_message_size
+    )
+
+
+async def serve_stream_async(
+    address: Address,
+    framing: Framing = NDJSON,
+    max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    metrics: Optional[Metrics] = None,
+) -> None:
+    """Serve requests over TCP or a Unix domain socket until cancelled. See
+    start_stream_server for the arguments.
+    """
+    # pylint: disable=too-many-arguments
+    server = await start_stream_server(
+        address,
+        framing=framing,
+        max_message_size=max_message_size,
+        max_concurrency=max_concurrency,
+        metrics=metrics,
+    )
+    logging.info(" * Listening on %s", address)
+    async with server:
+        await server.serve_forever()
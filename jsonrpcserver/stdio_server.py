@@ -0,0 +1,76 @@
+"""Serving JSON-RPC over stdin and stdout, for a process run by another, such as an
+editor's language server or tool sidecar.
+
+Messages are framed with Content-Length headers by default, as in the Language Server
+Protocol. Requests are read from stdin and dispatched concurrently, and each response
+is written to stdout as soon as it's ready - see socket_server.py, which this shares
+its framing and connection handling with.
+
+    >>> asyncio.run(serve_stdio_async())
+
+stdout is used for the responses only, so log to stderr. stdin and stdout must be
+pipes, sockets or character devices (not regular files), and the event loop must
+support pipes - on Windows, the ProactorEventLoop doesn't for stdin.
+"""
+from typing import BinaryIO, Optional, Tuple
+import asyncio
+import sys
+
+from .metrics import Metrics
+from .socket_server import (
+    CONTENT_LENGTH,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_MESSAGE_SIZE,
+    Framing,
+    StreamConnectionHandler,
+)
+
+
+async def open_pipes(
+    stdin: BinaryIO, stdout: BinaryIO, limit: int
+) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """A stream reader and writer for the pipes."""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=limit)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), stdin)
+    # A StreamReaderProtocol gives the writer flow control (for drain) and wait_closed.
+    # Its reader is unused, as nothing is read from stdout
+    transport, protocol = await loop.connect_write_pipe(
+        lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()), stdout
+    )
+    return reader, asyncio.StreamWriter(transport, protocol, reader, loop)
+
+
+async def serve_stdio_async(
+    framing: Framing = CONTENT_LENGTH,
+    max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    metrics: Optional[Metrics] = None,
+    stdin: Optional[BinaryIO] = None,
+    stdout: Optional[BinaryIO] = None,
+) -> None:
+    """Serve requests from stdin until it's closed, then close stdout.
+
+    Args:
+        framing: CONTENT_LENGTH, NDJSON or LENGTH_PREFIXED.
+        max_message_size: The largest message accepted, in bytes. A larger one stops
+            the server, as the next message can't be found.
+        max_concurrency: The most requests dispatched at once. Once reached, no more
+            are read until one finishes.
+        metrics: Records the calls.
+        stdin: Read the requests from this instead of stdin.
+        stdout: Write the responses to this instead of stdout.
+    """
+    # pylint: disable=too-many-arguments
+    reader, writer = await open_pipes(
+        sys.stdin.buffer if stdin is None else stdin,
+        sys.stdout.buffer if stdout is None else stdout,
+        max_message_size,
+    )
+    await StreamConnectionHandler(framing, max_message_size, max_concurrency, metrics)(
+        reader, writer
+    )
+    try:
+        await writer.wait_closed()  # The responses have all been written
+    except ConnectionError:
+        pass  # The other process closed its end first
@@ -0,0 +1,309 @@
+"""Incremental parsing of request bodies, for batches too large to parse in one go.
+
+The parser is fed the body in chunks. Each request in a batch is given as soon as it's
+been received in full, so it can be dispatched while the rest of the body is still
+being read, and the whole batch never has to be held in memory.
+
+A body that isn't a batch is parsed when it's been received in full.
+"""
+from codecs import getincrementaldecoder
+from json import JSONDecodeError, JSONDecoder
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+    Union,
+    runtime_checkable,
+)
+import re
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+# What find_end looks for, inside and outside strings
+STRING_SPECIAL = re.compile(r'["\\]')
+STRUCTURAL = re.compile(r'["{}\[\]]')
+
+NUMBER_CHARS = "+-.0123456789Ee"
+# The characters a json value can start with
+VALUE_START = '{["-0123456789tfnNI'
+
+decoder = JSONDecoder()
+
+
+def is_incomplete_number(buffer: str, start: int, end: int) -> bool:
+    """True if the value parsed from buffer[start:end] is a number that may not have
+    been received in full.
+    """
+    return buffer[start] in NUMBER_CHARS and (
+        end == len(buffer) or buffer[end] in NUMBER_CHARS
+    )
+
+
+class Readable(Protocol):  # pylint: disable=too-few-public-methods
+    """A file-like object opened for reading in binary mode."""
+
+    def read(self, size: int) -> bytes:
+        """Read up to size bytes. Gives empty bytes at the end of the stream."""
+
+
+@runtime_checkable
+class AsyncReadable(Protocol):  # pylint: disable=too-few-public-methods
+    """An async stream with a read method, such as asyncio.StreamReader."""
+
+    async def read(self, size: int) -> bytes:
+        """Read up to size bytes. Gives empty bytes at the end of the stream."""
+
+
+class StreamParser:  # pylint: disable=too-many-instance-attributes
+    """Parses a JSON-RPC request body incrementally.
+
+    Feed it chunks of the body, and it gives back the values completed by each chunk.
+    Once the first non-whitespace character has been received, is_batch says if the
+    body is a batch (a json array).
+
+    Raises JSONDecodeError (or UnicodeDecodeError) if the body is not valid json. The
+    values before the error are always given first: if a chunk has both, the error is
+    raised by the next feed or close. Error positions are in the whole body.
+    """
+
+    def __init__(self) -> None:
+        self.decoder = getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.is_batch: Optional[bool] = None
+        self.count = 0  # Values given so far
+        self.expecting_value = True  # Otherwise expecting a "," or "]"
+        self.finished = False  # The end of the batch has been reached
+        self.error: Optional[JSONDecodeError] = None  # Raised by the next feed or close
+        # Where the buffer starts in the body
+        self.offset = 0
+        self.lineno = 1
+        self.colno = 1
+        # An incomplete value at the start of the buffer has been parsed before
+        self.retrying = False
+        # How far it's been scanned, its nesting depth, and whether that's in a string
+        self.scan: Optional[Tuple[int, int, bool]] = None
+
+    def feed(self, data: Union[bytes, str]) -> List[Any]:
+        """Parse the next chunk of the body."""
+        if self.error is not None:
+            raise self.error
+        self.buffer += data if isinstance(data, str) else self.decoder.decode(data)
+        return self.parse(final=False)
+
+    def close(self) -> List[Any]:
+        """Call at the end of the body. Raises if the body was incomplete."""
+        if self.error is not None:
+            raise self.error
+        self.buffer += self.decoder.decode(b"", final=True)
+        values = self.parse(final=True)
+        if self.error is not None:
+            raise self.error
+        if self.is_batch is None:
+            raise self.decode_error("Expecting value", self.buffer, 0)
+        if self.is_batch and not self.finished:
+            raise self.decode_error(
+                "Expecting value"
+                if self.expecting_value
+                else "Expecting ',' delimiter",
+                self.buffer,
+                len(self.buffer),
+            )
+        return values
+
+    def decode_error(self, msg: str, buffer: str, pos: int) -> JSONDecodeError:
+        """An error at a position in the buffer, positioned in the whole body."""
+        exc = JSONDecodeError(msg, buffer, pos)
+        newline = buffer.rfind("\n", 0, pos)
+        exc.pos = self.offset + pos
+        exc.lineno = self.lineno + buffer.count("\n", 0, pos)
+        exc.colno = pos - newline if newline >= 0 else self.colno + pos
+        exc.args = (f"{msg}: line {exc.lineno} column {exc.colno} (char {exc.pos})",)
+        return exc
+
+    def consume(self, buffer: str, pos: int) -> None:
+        """Drop the parsed part of the buffer."""
+        newline = buffer.rfind("\n", 0, pos)
+        if newline >= 0:
+            self.lineno += buffer.count("\n", 0, pos)
+            self.colno = pos - newline
+        else:
+            self.colno += pos
+        self.offset += pos
+        self.buffer = buffer[pos:]
+
+    def parse(self, final: bool) -> List[Any]:
+        """Parse as much of the buffer as possible, keeping what's left for later."""
+        buffer, pos, values = self.buffer, 0, []
+        try:
+            while True:
+                pos = WHITESPACE.match(buffer, pos).end()  # type: ignore
+                if pos == len(buffer):
+                    break
+                if self.is_batch is None:
+                    self.is_batch = buffer[pos] == "["
+                    if self.is_batch:
+                        pos += 1
+                        continue
+                if not self.is_batch:
+                    self.consume(buffer, pos)
+                    return self.parse_single(final)
+                if self.finished:
+                    raise self.decode_error("Extra data", buffer, pos)
+                if not self.expecting_value or buffer[pos] == "]":
+                    pos = self.parse_delimiter(buffer, pos)
+                    continue
+                value, end = self.parse_value(buffer, pos, final)
+                if end is None:
+                    break  # Wait for the rest of the value
+                values.append(value)
+                self.count += 1
+                self.expecting_value = False
+                pos = end
+        except JSONDecodeError as exc:
+            if not values:
+                raise
+            # Give the values before the error, and raise it next time
+            self.error = exc
+        self.consume(buffer, pos)
+        return values
+
+    def parse_value(
+        self, buffer: str, pos: int, final: bool
+    ) -> Tuple[Any, Optional[int]]:
+        """Parse the value in a batch starting at pos.
+
+        Returns: The value and where it ends, or an end of None if it may not have
+            been received in full.
+        """
+        # A large value that's still being received isn't parsed again until it's
+        # complete
+        if self.scan and not final and self.find_end(buffer, pos) is None:
+            return None, None
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except JSONDecodeError as exc:
+            self.check_incomplete(buffer, pos, final, exc)
+            return None, None
+        if self.retrying:
+            self.scan, self.retrying = None, False
+        # A number may continue in the next chunk
+        if not final and is_incomplete_number(buffer, pos, end):
+            return None, None
+        return value, end
+
+    def check_incomplete(
+        self, buffer: str, pos: int, final: bool, exc: JSONDecodeError
+    ) -> None:
+        """Raise the error parsing the value at pos, unless it may only be because the
+        value hasn't been received in full.
+        """
+        if final or buffer[pos] not in VALUE_START or self.scan is not None:
+            raise self.decode_error(exc.msg, buffer, exc.pos) from None
+        # An object, array or string that's been tried before is scanned from now on,
+        # as more of it's received. If it's complete, it's malformed.
+        if buffer[pos] in '{["':
+            if self.retrying and self.find_end(buffer, pos) is not None:
+                raise self.decode_error(exc.msg, buffer, exc.pos) from None
+            self.retrying = True
+
+    def find_end(self, buffer: str, start: int) -> Optional[int]:
+        """Find the end of the object, array or string starting at start, by matching
+        brackets and quotes, or None if it hasn't been received in full. Carries on
+        from where the last call left off, so a large value received in many chunks is
+        scanned once rather than parsed again with each chunk.
+        """
+        pos, depth, in_string = self.scan or (0, 0, False)
+        pos += start
+        while True:
+            if in_string:
+                match = STRING_SPECIAL.search(buffer, pos)
+                if match is None:
+                    pos = len(buffer)
+                    break
+                if match.group() == "\\":
+                    if match.end() == len(buffer):
+                        pos = match.start()  # The escaped character is still to come
+                        break
+                    pos = match.end() + 1
+                    continue
+                in_string, pos = False, match.end()
+                if not depth:
+                    return pos
+            else:
+                match = STRUCTURAL.search(buffer, pos)
+                if match is None:
+                    pos = len(buffer)
+                    break
+                char, pos = match.group(), match.end()
+                if char == '"':
+                    in_string = True
+                elif char in "{[":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if not depth:
+                        return pos
+        self.scan = (pos - start, depth, in_string)
+        return None
+
+    def parse_delimiter(self, buffer: str, pos: int) -> int:
+        """Parse the "," or "]" following a value in a batch. A "]" can also end an
+        empty batch.
+        """
+        if self.expecting_value:
+            if self.count:  # A trailing comma
+                raise self.decode_error("Expecting value", buffer, pos)
+        elif buffer[pos] not in ",]":
+            raise self.decode_error("Expecting ',' delimiter", buffer, pos)
+        self.finished = buffer[pos] == "]"
+        self.expecting_value = True
+        return pos + 1
+
+    def parse_single(self, final: bool) -> List[Any]:
+        """A body that's not a batch is parsed once it's all been received."""
+        if not final:
+            return []
+        buffer = self.buffer
+        try:
+            value, end = decoder.raw_decode(buffer)
+        except JSONDecodeError as exc:
+            raise self.decode_error(exc.msg, buffer, exc.pos) from None
+        if WHITESPACE.match(buffer, end).end() != len(buffer):  # type: ignore
+            raise self.decode_error("Extra data", buffer, end)
+        self.consume(buffer, len(buffer))
+        return [value]
+
+
+def parse_stream(
+    parser: StreamParser, stream: Readable, chunk_size: int
+) -> Iterator[Any]:
+    """Read and parse a body from a file-like object, giving each value as soon as it's
+    been parsed.
+    """
+    while chunk := stream.read(chunk_size):
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+async def async_parse_stream(
+    parser: StreamParser,
+    stream: Union[AsyncReadable, AsyncIterable[bytes]],
+    chunk_size: int,
+) -> AsyncIterator[Any]:
+    """Async version of parse_stream. The stream can be an async iterable of chunks
+    instead of an object with a read method.
+    """
+    if isinstance(stream, AsyncReadable):
+        while chunk := await stream.read(chunk_size):
+            for value in parser.feed(chunk):
+                yield value
+    else:
+        async for chunk in stream:
+            for value in parser.feed(chunk):
+                yield value
+    for value in parser.close():
+        yield value
@@ -0,0 +1,131 @@
+"""Running a server in several forked worker processes, to use more than one core.
+
+The supervisor is the parent process. It forks the workers - so the methods are
+imported once, before forking - and restarts any worker that exits. Signals to the
+supervisor:
+
+- SIGTERM or SIGINT: stop the workers gracefully, then exit.
+- SIGHUP: a graceful reload. New workers are started, then the old ones are stopped
+  gracefully, finishing the requests they're handling.
+
+A worker is stopped gracefully with SIGTERM. Only available where os.fork is.
+"""
+from threading import Thread
+from time import monotonic, sleep
+from types import FrameType
+from typing import Callable, Dict, Iterable, Optional, Set
+import logging
+import os
+import signal
+
+# A worker exiting sooner than this after starting is restarted after a delay, so a
+# worker that can't start isn't restarted in a busy loop
+MIN_WORKER_LIFETIME = 1.0  # Seconds
+
+logger = logging.getLogger(__name__)
+
+
+class Supervisor:
+    """Runs workers, restarting any that exit, until stopped.
+
+    Args:
+        workers: The number of worker processes.
+        work: Runs in each worker, until it's stopped by SIGTERM.
+    """
+
+    def __init__(self, workers: int, work: Callable[[], None]) -> None:
+        if workers < 1:
+            raise ValueError("There must be at least one worker")
+        self.workers = workers
+        self.work = work
+        self.started: Dict[int, float] = {}  # The workers' pids, to their start times
+        self.replaced: Set[int] = set()  # Workers being stopped by a reload
+        self.stopping = False
+
+    def spawn(self) -> None:
+        """Fork a worker."""
+        pid = os.fork()
+        if pid == 0:  # The worker
+            status = 0
+            try:
+                # Stopping is up to the supervisor
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                self.work()
+            except BaseException:  # pylint: disable=broad-except
+                logger.exception("Worker %s failed", os.getpid())
+                status = 1
+            finally:
+                os._exit(status)  # pylint: disable=protected-access
+        self.started[pid] = monotonic()
+
+    def kill(self, pids: Iterable[int]) -> None:
+        """Stop these workers gracefully."""
+        for pid in list(pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def stop(self, *_args: object) -> None:
+        """Stop all the workers, and then the supervisor."""
+        self.stopping = True
+        self.kill(self.started)
+
+    def reload(self, *_args: object) -> None:
+        """Replace all the workers."""
+        if self.stopping:
+            return
+        old = set(self.started) - self.replaced
+        for _ in range(self.workers):
+            self.spawn()
+        self.replaced |= old
+        self.kill(old)
+
+    def run(self) -> None:
+        """Start the workers, and restart any that exit, until stopped."""
+        handlers = {
+            signum: signal.signal(signum, handler)
+            for signum, handler in (
+                (signal.SIGTERM, self.stop),
+                (signal.SIGINT, self.stop),
+                (signal.SIGHUP, self.reload),
+            )
+        }
+        try:
+            for _ in range(self.workers):
+                self.spawn()
+            while self.started:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                started = self.started.pop(pid, None)
+                if pid in self.replaced:
+                    self.replaced.discard(pid)
+                    continue
+                if started is None or self.stopping:
+                    continue
+                logger.warning(
+                    "Worker %s exited with status %s, restarting", pid, status
+                )
+                if monotonic() - started < MIN_WORKER_LIFETIME:
+                    sleep(MIN_WORKER_LIFETIME)
+                if not self.stopping:
+                    self.spawn()
+        finally:
+            self.stop()
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+
+def stop_on_sigterm(shutdown: Callable[[], None]) -> None:
+    """In a worker, call shutdown on SIGTERM. It's called in a new thread, as a
+    server's shutdown waits for serve_forever, which the signal interrupts.
+    """
+
+    def handler(_signum: int, _frame: Optional[FrameType]) -> None:
+        Thread(target=shutdown).start()
+
+    signal.signal(signal.SIGTERM, handler)
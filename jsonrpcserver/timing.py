@@ -0,0 +1,89 @@
+"""Timing the stages of dispatch, to see where the time goes.
+
+A timing hook is called at the end of each stage of dispatching a request, with the
+stage, the time it took in seconds, the method name (for the stages of a call) and the
+JSON-RPC error code the stage ended with (None if it succeeded):
+
+    >>> def print_timing(stage, seconds, method, code):
+    ...     print(stage, f"{seconds * 1e6:.0f}us", method, code)
+    >>> dispatch('{"jsonrpc": "2.0", "method": "ping", "id": 1}', timing_hook=print_timing)
+    deserialize 3us None None
+    validate 1us None None
+    get_method 0us ping None
+    validate_args 1us ping None
+    call 2us ping None
+    serialize 4us None None
+
+Pass a hook to dispatch (or a Dispatcher), or set one for all dispatching with
+set_timing_hook. When no hook is set, the stages aren't timed at all; the only cost is
+checking for a hook once per request.
+
+For methods with a cache, or coalescing identical calls, the arguments are validated
+in the "call" stage, because a cached result skips validation. The serialize stage is
+the serializer or encoder turning the response(s) into json.
+
+dispatch_iter and dispatch_stream don't time the stages.
+"""
+from time import perf_counter
+from typing import Any, Callable, Optional, Protocol, TypeVar
+
+from oslash.either import Left  # type: ignore
+
+# pylint: disable=global-statement
+
+T = TypeVar("T")
+
+STAGE_DESERIALIZE = "deserialize"
+STAGE_VALIDATE = "validate"
+STAGE_GET_METHOD = "get_method"
+STAGE_VALIDATE_ARGS = "validate_args"
+STAGE_CALL = "call"
+STAGE_SERIALIZE = "serialize"
+
+
+class TimingHook(Protocol):  # pylint: disable=too-few-public-methods
+    """Receives the time taken by each stage of dispatch."""
+
+    def __call__(
+        self, stage: str, seconds: float, method: Optional[str], code: Optional[int]
+    ) -> None:
+        """Called at the end of a stage. It's called in the thread that did the stage,
+        so it should be thread-safe if dispatching with an executor.
+        """
+
+
+timing_hook: Optional[TimingHook] = None
+
+
+def set_timing_hook(hook: Optional[TimingHook]) -> None:
+    """Set the hook used by all dispatching that isn't given one. None to remove it."""
+    global timing_hook
+    timing_hook = hook
+
+
+def get_timing_hook(hook: Optional[TimingHook] = None) -> Optional[TimingHook]:
+    """The hook given, otherwise the one set with set_timing_hook, if any."""
+    return timing_hook if hook is None else hook
+
+
+def error_code(result: Any) -> Optional[int]:
+    """The error code of a Left result or response, otherwise None."""
+    return (
+        result._error.code  # pylint: disable=protected-access
+        if isinstance(result, Left)
+        else None
+    )
+
+
+def timed(
+    hook: TimingHook,
+    stage: str,
+    method: Optional[str],
+    func: Callable[..., T],
+    *args: Any,
+) -> T:
+    """Call func, giving the time it took to the hook."""
+    start = perf_counter()
+    result = func(*args)
+    hook(stage, perf_counter() - start, method, error_code(result))
+    return result
@@ -0,0 +1,148 @@
+"""Tracing spans around dispatched calls.
+
+Given a tracer, a span is started for each call to a method, and for a batch, a parent
+span for the whole batch. There's no dependency on a tracing library; the tracer just
+has to follow the Tracer protocol. For example, with OpenTelemetry:
+
+    >>> from opentelemetry import trace
+    >>> from opentelemetry.trace.propagation.tracecontext import (
+    ...     TraceContextTextMapPropagator
+    ... )
+    >>> class OpenTelemetryTracer:
+    ...     tracer = trace.get_tracer("jsonrpcserver")
+    ...     def start_span(self, name, parent, attributes):
+    ...         return self.tracer.start_span(name, parent, attributes=attributes)
+    ...     def extract(self, carrier):
+    ...         return TraceContextTextMapPropagator().extract(carrier)
+    >>> dispatch(request, tracer=OpenTelemetryTracer())
+
+A trace context sent by the client can be passed in the params. With
+trace_context_field="_trace", a request with named params including "_trace" (e.g.
+{"traceparent": "00-..."}) has it removed from the params before the method is called,
+and given to the tracer's extract method to get the parent of the call's span.
+
+With no tracer, nothing is traced, and there's no cost beyond checking for a tracer.
+dispatch_iter and dispatch_stream don't trace.
+"""
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from oslash.either import Left  # type: ignore
+
+from .request import Request
+from .result import Result
+from .sentinels import NOID
+
+BATCH_SPAN = "jsonrpc.batch"
+
+# Span attributes, following the OpenTelemetry conventions for JSON-RPC
+ATTRIBUTE_SYSTEM = "rpc.system"
+ATTRIBUTE_METHOD = "rpc.method"
+ATTRIBUTE_REQUEST_ID = "rpc.jsonrpc.request_id"
+ATTRIBUTE_ERROR_CODE = "rpc.jsonrpc.error_code"
+ATTRIBUTE_BATCH_INDEX = "rpc.jsonrpc.batch_index"
+ATTRIBUTE_BATCH_SIZE = "rpc.jsonrpc.batch_size"
+
+
+class Span(Protocol):
+    """A span started by a Tracer."""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Set an attribute of the span."""
+
+    def end(self) -> None:
+        """End the span."""
+
+
+class Tracer(Protocol):
+    """Starts spans. Can be an adapter for a tracing library."""
+
+    def start_span(self, name: str, parent: Any, attributes: Dict[str, Any]) -> Span:
+        """Start a span. The parent is a span, a context from extract, or None."""
+
+    def extract(self, carrier: Any) -> Any:
+        """Get a parent for a span from a trace context sent in the params."""
+
+
+def extract_context(
+    tracer: Tracer, field: Optional[str], request: Request
+) -> Tuple[Request, Any]:
+    """Take the trace context out of the request's params, if there's one in the
+    field.
+
+    Returns: The request without the trace context, and the parent it gives, or None.
+    """
+    params = request.params
+    if field is None or not isinstance(params, dict) or field not in params:
+        return request, None
+    params = dict(params)
+    carrier = params.pop(field)
+    return request._replace(params=params), tracer.extract(carrier)
+
+
+def start_call_span(
+    tracer: Tracer, request: Request, parent: Any, index: Optional[int]
+) -> Span:
+    """Start the span of a call to a method, as part of a batch if index is given."""
+    attributes: Dict[str, Any] = {
+        ATTRIBUTE_SYSTEM: "jsonrpc",
+        ATTRIBUTE_METHOD: request.method,
+    }
+    if request.id is not NOID:
+        attributes[ATTRIBUTE_REQUEST_ID] = request.id
+    if index is not None:
+        attributes[ATTRIBUTE_BATCH_INDEX] = index
+    return tracer.start_span(request.method, parent, attributes)
+
+
+def start_batch_span(tracer: Tracer, size: int) -> Span:
+    """Start the parent span of the calls in a batch."""
+    return tracer.start_span(
+        BATCH_SPAN, None, {ATTRIBUTE_SYSTEM: "jsonrpc", ATTRIBUTE_BATCH_SIZE: size}
+    )
+
+
+def set_result(span: Span, result: Result) -> None:
+    """Set the error code of a failed call, as an attribute of its span."""
+    if isinstance(result, Left):
+        span.set_attribute(
+            ATTRIBUTE_ERROR_CODE, result._error.code  # pylint: disable=protected-access
+        )
+
+
+class MemorySpan:
+    """A span kept in memory by MemoryTracer."""
+
+    def __init__(self, name: str, parent: Any, attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes)
+        self.ended = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Set an attribute of the span."""
+        self.attributes[key] = value
+
+    def end(self) -> None:
+        """End the span."""
+        self.ended = True
+
+
+class MemoryTracer:
+    """A tracer that keeps the spans it starts in a list, for testing. A trace context
+    is used as the parent as it is.
+    """
+
+    def __init__(self) -> None:
+        self.spans: List[MemorySpan] = []
+
+    def start_span(
+        self, name: str, parent: Any, attributes: Dict[str, Any]
+    ) -> MemorySpan:
+        """Start a span, and keep it."""
+        span = MemorySpan(name, parent, attributes)
+        self.spans.append(span)
+        return span
+
+    def extract(self, carrier: Any) -> Any:
+        """The trace context as it is."""
+        return carrier
@@ -1,6 +1,6 @@
 """Utility functions"""
 from functools import reduce
-from typing import Any, Callable, List
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Iterable, Iterator, List
 
 # pylint: disable=invalid-name
 
@@ -18,3 +18,33 @@ def compose(*funcs: Callable[..., Any]) -> Callable[..., Any]:
 def make_list(x: Any) -> List[Any]:
     """Puts a value into a list if it's not already."""
     return x if isinstance(x, list) else [x]
+
+
+def json_array(items: Iterable[bytes]) -> Iterator[bytes]:
+    """Frame json-encoded items as a json array, in chunks: "[", then the items with ","
+    between them, then "]". Gives nothing at all if there are no items.
+    """
+    separator = b"["
+    for item in items:
+        yield separator
+        yield item
+        separator = b","
+    if separator == b",":
+        yield b"]"
+
+
+async def async_json_array(items: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Async version of json_array."""
+    separator = b"["
+    async for item in items:
+        yield separator
+        yield item
+        separator = b","
+    if separator == b",":
+        yield b"]"
+
+
+async def async_iter(items: Iterable[Any]) -> AsyncIterator[Any]:
+    """Turn a regular iterable into an async iterator."""
+    for item in items:
+        yield item
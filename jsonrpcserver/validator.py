@@ -0,0 +1,53 @@
+"""A fast JSON-RPC request validator.
+
+Enforces the same rules as request-schema.json, using plain type and key checks rather
+than a jsonschema validator. This is the default validator; validating against the
+schema itself is available as main.strict_validator.
+"""
+from numbers import Number
+from typing import Any
+
+from .dispatcher import Deserialized
+
+REQUEST_KEYS = frozenset(("jsonrpc", "method", "params", "id"))
+
+
+def is_valid_id(id_: Any) -> bool:
+    """The schema allows a string, number or null id. As in jsonschema, a bool is not a
+    number.
+    """
+    return (
+        id_ is None
+        or isinstance(id_, str)
+        or (isinstance(id_, Number) and not isinstance(id_, bool))
+    )
+
+
+def is_valid_request(request: Any) -> bool:
+    """True if a single (not batch) request is valid."""
+    return (
+        isinstance(request, dict)
+        and "jsonrpc" in request
+        and "method" in request
+        and request.keys() <= REQUEST_KEYS
+        and isinstance(request["jsonrpc"], str)
+        and request["jsonrpc"] == "2.0"
+        and isinstance(request["method"], str)
+        and ("params" not in request or isinstance(request["params"], (list, dict)))
+        and ("id" not in request or is_valid_id(request["id"]))
+    )
+
+
+def validate(request: Deserialized) -> Deserialized:
+    """Validate a deserialized request, which may be a single request or a batch.
+
+    Raises: ValueError if the request is not valid JSON-RPC.
+
+    Returns: The request, unchanged.
+    """
+    if isinstance(request, list):
+        if request and all(map(is_valid_request, request)):
+            return request
+    elif is_valid_request(request):
+        return request
+    raise ValueError("The request is not valid JSON-RPC")
@@ -25,6 +25,9 @@ setup(
             "websockets",
             "werkzeug",
         ],
+        "orjson": [
+            "orjson",
+        ],
         "test": [
             "pytest",
             "pytest-cov",
@@ -1,5 +1,11 @@
 """Test async_dispatcher.py"""
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from functools import partial
+from threading import current_thread, main_thread
+from typing import AsyncGenerator, AsyncIterator, Awaitable, List, Set, cast
 from unittest.mock import Mock, patch
+import asyncio
 import pytest
 
 from oslash.either import Left, Right  # type: ignore
@@ -7,25 +13,46 @@ from oslash.either import Left, Right  # type: ignore
 from jsonrpcserver.async_dispatcher import (
     call,
     dispatch_deserialized,
+    gather_limited,
+    as_completed_limited,
+    dispatch_as_completed_pure,
+    map_limited,
     dispatch_request,
+    in_flight,
     dispatch_to_response_pure,
 )
+from jsonrpcserver.cache import ResultCache
 from jsonrpcserver.main import default_deserializer, default_validator
-from jsonrpcserver.codes import ERROR_INTERNAL_ERROR, ERROR_SERVER_ERROR
+from jsonrpcserver.codes import (
+    ERROR_INTERNAL_ERROR,
+    ERROR_PARSE_ERROR,
+    ERROR_SERVER_ERROR,
+)
 from jsonrpcserver.exceptions import JsonRpcError
+from jsonrpcserver import methods
 from jsonrpcserver.request import Request
 from jsonrpcserver.response import ErrorResponse, SuccessResponse
 from jsonrpcserver.result import ErrorResult, Result, Success, SuccessResult
 from jsonrpcserver.sentinels import NOCONTEXT, NODATA
 from jsonrpcserver.utils import identity
 
-# pylint: disable=missing-function-docstring,duplicate-code
+# pylint: disable=missing-function-docstring,duplicate-code,protected-access
 
 
 async def ping() -> Result:
     return Success("pong")
 
 
+@methods.method(executor="process")
+def async_square(number: int) -> Result:
+    return Success(number * number)
+
+
+@methods.method(executor="process")
+def async_process_raising_exception() -> Result:
+    raise ValueError("foo")
+
+
 @pytest.mark.asyncio
 async def test_call() -> None:
     assert await call(Request("ping", [], 1), NOCONTEXT, ping) == Right(
@@ -53,6 +80,80 @@ async def test_call_raising_exception() -> None:
     )
 
 
+@pytest.mark.asyncio
+async def test_call_sync() -> None:
+    def sync_ping() -> Result:
+        assert current_thread() is not main_thread()
+        return Success("pong")
+
+    assert await call(Request("sync_ping", [], 1), NOCONTEXT, sync_ping) == Right(
+        SuccessResult("pong")
+    )
+
+
+@pytest.mark.asyncio
+async def test_call_sync_inline() -> None:
+    @methods.method(inline=True)
+    def inline_ping() -> Result:
+        assert current_thread() is main_thread()
+        return Success("pong")
+
+    assert await call(Request("inline_ping", [], 1), NOCONTEXT, inline_ping) == Right(
+        SuccessResult("pong")
+    )
+
+
+@pytest.mark.asyncio
+async def test_call_sync_executor() -> None:
+    def sync_ping() -> Result:
+        assert current_thread().name.startswith("test")
+        return Success("pong")
+
+    with ThreadPoolExecutor(1, thread_name_prefix="test") as executor:
+        assert await call(
+            Request("sync_ping", [], 1), NOCONTEXT, sync_ping, executor
+        ) == Right(SuccessResult("pong"))
+
+
+@pytest.mark.asyncio
+async def test_call_sync_context() -> None:
+    var: ContextVar[str] = ContextVar("var")
+    var.set("foo")
+
+    def get_var() -> Result:
+        return Success(var.get())
+
+    assert await call(Request("get_var", [], 1), NOCONTEXT, get_var) == Right(
+        SuccessResult("foo")
+    )
+
+
+@pytest.mark.asyncio
+async def test_call_sync_returning_awaitable() -> None:
+    def wrapped() -> Awaitable[Result]:
+        return ping()
+
+    assert await call(Request("wrapped", [], 1), NOCONTEXT, wrapped) == Right(
+        SuccessResult("pong")
+    )
+
+
+@pytest.mark.asyncio
+async def test_call_process() -> None:
+    assert await call(
+        Request("async_square", [3], 1), NOCONTEXT, async_square
+    ) == Right(SuccessResult(9))
+
+
+@pytest.mark.asyncio
+async def test_call_process_raising_exception() -> None:
+    assert await call(
+        Request("async_process_raising_exception", [], 1),
+        NOCONTEXT,
+        async_process_raising_exception,
+    ) == Left(ErrorResult(ERROR_INTERNAL_ERROR, "Internal error", "foo"))
+
+
 @pytest.mark.asyncio
 async def test_dispatch_request() -> None:
     request = Request("ping", [], 1)
@@ -62,6 +163,122 @@ async def test_dispatch_request() -> None:
     )
 
 
+@pytest.mark.asyncio
+async def test_dispatch_request_cached() -> None:
+    calls = []
+    cache = ResultCache()
+
+    @methods.method(name="async_cached_square", cache=cache)
+    async def square(number: int) -> Result:
+        calls.append(number)
+        return Success(number * number)
+
+    for number in [2, 3, 2, 2]:
+        request = Request("square", [number], 1)
+        assert await dispatch_request({"square": square}, NOCONTEXT, request) == (
+            request,
+            Right(SuccessResult(number * number)),
+        )
+    assert calls == [2, 3]
+    assert cache.stats().hits == 2
+
+
+@pytest.mark.asyncio
+async def test_dispatch_request_cached_invalid_params() -> None:
+    cache = ResultCache()
+
+    @methods.method(name="async_cached_ping", cache=cache)
+    def cached_ping() -> Result:
+        return Success("pong")
+
+    request = Request("ping", [1], 1)
+    (_, result) = await dispatch_request({"ping": cached_ping}, NOCONTEXT, request)
+    assert isinstance(result, Left)
+    assert cache.stats().size == 0
+
+
+@pytest.mark.asyncio
+async def test_dispatch_request_cached_not_json() -> None:
+    calls = []
+    cache = ResultCache()
+
+    @methods.method(name="async_cached_not_json", cache=cache, coalesce=True)
+    async def size(numbers: Set[int]) -> Result:
+        calls.append(numbers)
+        return Success(len(numbers))
+
+    requests = [Request("size", [{1, 2}], i) for i in range(2)]
+    results = await asyncio.gather(
+        *(dispatch_request({"size": size}, NOCONTEXT, r) for r in requests)
+    )
+    assert results == [(r, Right(SuccessResult(2))) for r in requests]
+    assert len(calls) == 2
+    assert cache.stats().size == 0
+
+
+@pytest.mark.asyncio
+async def test_dispatch_request_coalesced() -> None:
+    calls = []
+
+    @methods.method(name="async_coalesced_slow", coalesce=True)
+    async def slow(number: int) -> Result:
+        calls.append(number)
+        await asyncio.sleep(0.01)
+        return Success(number)
+
+    results = await asyncio.gather(
+        *(
+            dispatch_request({"slow": slow}, NOCONTEXT, Request("slow", [i % 2], i))
+            for i in range(6)
+        )
+    )
+    assert sorted(calls) == [0, 1]
+    assert results == [
+        (Request("slow", [i % 2], i), Right(SuccessResult(i % 2))) for i in range(6)
+    ]
+    assert not in_flight
+
+
+@pytest.mark.asyncio
+async def test_dispatch_request_coalesced_cancel() -> None:
+    @methods.method(name="async_coalesced_cancel", coalesce=True)
+    async def slow() -> Result:
+        await asyncio.sleep(0.01)
+        return Success("done")
+
+    first = asyncio.ensure_future(
+        dispatch_request({"slow": slow}, NOCONTEXT, Request("slow", [], 1))
+    )
+    second = asyncio.ensure_future(
+        dispatch_request({"slow": slow}, NOCONTEXT, Request("slow", [], 2))
+    )
+    await asyncio.sleep(0)
+    first.cancel()
+    assert (await second)[1] == Right(SuccessResult("done"))
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_dispatch_request_coalesced_with_cache() -> None:
+    calls: List[None] = []
+    cache = ResultCache(ttl=0)
+
+    @methods.method(name="async_coalesced_cached", cache=cache, coalesce=True)
+    async def slow() -> Result:
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        return Success("done")
+
+    await asyncio.gather(
+        *(
+            dispatch_request({"slow": slow}, NOCONTEXT, Request("slow", [], i))
+            for i in range(10)
+        )
+    )
+    assert len(calls) == 1
+    assert cache.stats().misses == 10
+
+
 @pytest.mark.asyncio
 async def test_dispatch_deserialized() -> None:
     assert await dispatch_deserialized(
@@ -72,6 +289,140 @@ async def test_dispatch_deserialized() -> None:
     ) == Right(SuccessResponse("pong", 1))
 
 
+@pytest.mark.asyncio
+async def test_gather_limited() -> None:
+    running = []
+
+    async def double(number: int) -> int:
+        running.append(number)
+        assert len(running) <= 2
+        await asyncio.sleep(0.001 * (number % 3))
+        running.remove(number)
+        return number * 2
+
+    assert await gather_limited(2, double, list(range(10))) == list(range(0, 20, 2))
+
+
+@pytest.mark.asyncio
+async def test_map_limited() -> None:
+    running = []
+
+    async def double(number: int) -> int:
+        running.append(number)
+        assert len(running) <= 2
+        await asyncio.sleep(0.001 * (number % 3))
+        running.remove(number)
+        return number * 2
+
+    assert [x async for x in map_limited(2, double, list(range(10)))] == list(
+        range(0, 20, 2)
+    )
+
+
+@pytest.mark.asyncio
+async def test_as_completed_limited() -> None:
+    async def wait(delay: int) -> int:
+        await asyncio.sleep(0.01 * delay)
+        return delay
+
+    assert [x async for x in as_completed_limited(3, wait, [3, 1, 2])] == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_as_completed_limited_one() -> None:
+    async def wait(delay: int) -> int:
+        await asyncio.sleep(0.01 * delay)
+        return delay
+
+    # Each call is only started when the one before finishes
+    assert [x async for x in as_completed_limited(1, wait, [3, 1, 2])] == [3, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_as_completed_limited_stopped_early() -> None:
+    finished = []
+
+    async def wait(delay: int) -> int:
+        await asyncio.sleep(0.01 * delay)
+        finished.append(delay)
+        return delay
+
+    results = cast(AsyncGenerator[int, None], as_completed_limited(2, wait, [1, 5]))
+    assert await results.__anext__() == 1
+    await results.aclose()
+    await asyncio.sleep(0.06)
+    assert finished == [1]
+
+
+@pytest.mark.asyncio
+async def test_map_limited_async_iterable() -> None:
+    taken = []
+
+    async def numbers() -> AsyncIterator[int]:
+        for number in range(5):
+            taken.append(number)
+            yield number
+
+    async def double(number: int) -> int:
+        return number * 2
+
+    results = map_limited(2, double, numbers())
+    assert await results.__anext__() == 0
+    assert taken == [0, 1, 2]
+    assert [x async for x in results] == [2, 4, 6, 8]
+
+
+@pytest.mark.asyncio
+async def test_gather_limited_invalid_limit() -> None:
+    with pytest.raises(ValueError):
+        await gather_limited(0, asyncio.sleep, [0])
+
+
+async def tracked(running: List[int], number: int) -> Result:
+    running.append(number)
+    await asyncio.sleep(0)
+    peak = len(running)
+    running.remove(number)
+    return Success(peak)
+
+
+@pytest.mark.asyncio
+async def test_dispatch_deserialized_max_concurrency() -> None:
+    running: List[int] = []
+    responses = await dispatch_deserialized(
+        {"tracked": partial(tracked, running)},
+        NOCONTEXT,
+        identity,
+        [
+            {"jsonrpc": "2.0", "method": "tracked", "params": [n], "id": n}
+            for n in range(10)
+        ],
+        max_concurrency=3,
+    )
+    assert isinstance(responses, list)
+    assert [r._value.id for r in responses] == list(range(10))
+    assert max(r._value.result for r in responses) == 3
+
+
+@pytest.mark.asyncio
+async def test_dispatch_deserialized_semaphore() -> None:
+    running: List[int] = []
+    semaphore = asyncio.Semaphore(2)
+    responses = await dispatch_deserialized(
+        {"tracked": partial(tracked, running)},
+        NOCONTEXT,
+        identity,
+        [
+            {"jsonrpc": "2.0", "method": "tracked", "params": [n], "id": n}
+            for n in range(10)
+        ],
+        semaphore=semaphore,
+    )
+    assert isinstance(responses, list)
+    assert [r._value.id for r in responses] == list(range(10))
+    assert max(r._value.result for r in responses) == 2
+
+
 @pytest.mark.asyncio
 async def test_dispatch_to_response_pure_success() -> None:
     assert await dispatch_to_response_pure(
@@ -98,3 +449,46 @@ async def test_dispatch_to_response_pure_server_error(*_: Mock) -> None:
         methods={"hello": hello},
         request='{"jsonrpc": "2.0", "method": "hello", "id": 1}',
     ) == Left(ErrorResponse(ERROR_SERVER_ERROR, "Server error", "hello", None))
+
+
+@pytest.mark.asyncio
+async def test_dispatch_as_completed_pure() -> None:
+    async def slow() -> Result:
+        await asyncio.sleep(0.02)
+        return Success("slow")
+
+    responses = [
+        response
+        async for response in dispatch_as_completed_pure(
+            deserializer=default_deserializer,
+            validator=default_validator,
+            methods={"ping": ping, "slow": slow},
+            context=NOCONTEXT,
+            request="""[
+                {"jsonrpc": "2.0", "method": "slow", "id": 1},
+                {"jsonrpc": "2.0", "method": "ping"},
+                {"jsonrpc": "2.0", "method": "ping", "id": 2}
+            ]""",
+        )
+    ]
+    assert responses == [
+        Right(SuccessResponse("pong", 2)),
+        Right(SuccessResponse("slow", 1)),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_as_completed_pure_parse_error() -> None:
+    responses = [
+        response
+        async for response in dispatch_as_completed_pure(
+            deserializer=default_deserializer,
+            validator=default_validator,
+            methods={"ping": ping},
+            context=NOCONTEXT,
+            request="{",
+        )
+    ]
+    assert len(responses) == 1
+    assert isinstance(responses[0], Left)
+    assert responses[0]._error.code == ERROR_PARSE_ERROR
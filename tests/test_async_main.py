@@ -1,17 +1,33 @@
 """Test async_main.py"""
+from typing import Any, AsyncIterator, List, Optional, Tuple
+import asyncio
+import json
+
 import pytest
 
 from oslash.either import Right  # type: ignore
 
 from jsonrpcserver.async_main import (
+    AsyncDispatcher,
+    default_dispatcher,
+    get_dispatcher,
+    dispatch_as_completed,
+    dispatch_iter,
+    dispatch_stream,
+    dispatch_to_bytes,
     dispatch_to_response,
     dispatch_to_serializable,
     dispatch_to_json,
 )
 from jsonrpcserver.response import SuccessResponse
+from jsonrpcserver.main import default_deserializer, default_validator, stdlib_encoder
+from jsonrpcserver.methods import LazyMethods
+from jsonrpcserver.metrics import Metrics
 from jsonrpcserver.result import Result, Success
+from jsonrpcserver.sentinels import NOCONTEXT
+from jsonrpcserver.tracing import MemoryTracer
 
-# pylint: disable=missing-function-docstring
+# pylint: disable=missing-function-docstring,duplicate-code
 
 
 async def ping() -> Result:
@@ -25,6 +41,52 @@ async def test_dispatch_to_response() -> None:
     ) == Right(SuccessResponse("pong", 1))
 
 
+@pytest.mark.asyncio
+async def test_dispatch_to_response_sync_method() -> None:
+    def sync_ping() -> Result:
+        return Success("pong")
+
+    assert await dispatch_to_response(
+        '{"jsonrpc": "2.0", "method": "ping", "id": 1}',
+        {"ping": sync_ping},
+        max_workers=2,
+    ) == Right(SuccessResponse("pong", 1))
+
+
+@pytest.mark.asyncio
+async def test_dispatch_to_response_bytes() -> None:
+    assert await dispatch_to_response(
+        memoryview(b'{"jsonrpc": "2.0", "method": "ping", "id": 1}'), {"ping": ping}
+    ) == Right(SuccessResponse("pong", 1))
+
+
+@pytest.mark.asyncio
+async def test_dispatch_lazy_method_import_error() -> None:
+    """Only the request for the method that can't be imported fails."""
+    methods = LazyMethods({"ping": ping})
+    methods.add_lazy("no_such_module:ping", name="broken")
+    request = (
+        '[{"jsonrpc": "2.0", "method": "broken", "id": 1},'
+        '{"jsonrpc": "2.0", "method": "ping", "id": 2}]'
+    )
+    for response in (
+        await dispatch_to_serializable(request, methods),
+        await AsyncDispatcher(methods).dispatch_to_serializable(request),
+    ):
+        assert response == [
+            {
+                "jsonrpc": "2.0",
+                "error": {
+                    "code": -32603,
+                    "message": "Internal error",
+                    "data": "No module named 'no_such_module'",
+                },
+                "id": 1,
+            },
+            {"jsonrpc": "2.0", "result": "pong", "id": 2},
+        ]
+
+
 @pytest.mark.asyncio
 async def test_dispatch_to_serializable() -> None:
     assert await dispatch_to_serializable(
@@ -48,3 +110,443 @@ async def test_dispatch_to_json_notification() -> None:
         await dispatch_to_json('{"jsonrpc": "2.0", "method": "ping"}', {"ping": ping})
         == ""
     )
+
+
+@pytest.mark.asyncio
+async def test_dispatch_to_bytes() -> None:
+    assert (
+        await dispatch_to_bytes(
+            b'{"jsonrpc": "2.0", "method": "ping", "id": 1}', {"ping": ping}
+        )
+        == b'{"jsonrpc":"2.0","result":"pong","id":1}'
+    )
+
+
+@pytest.mark.asyncio
+async def test_dispatch_to_bytes_notification() -> None:
+    assert (
+        await dispatch_to_bytes(b'{"jsonrpc": "2.0", "method": "ping"}', {"ping": ping})
+        == b""
+    )
+
+
+@pytest.mark.asyncio
+async def test_dispatch_iter_batch() -> None:
+    assert [
+        chunk
+        async for chunk in dispatch_iter(
+            b'[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+            b'{"jsonrpc": "2.0", "method": "ping"}, '
+            b'{"jsonrpc": "2.0", "method": "ping", "id": 2}]',
+            {"ping": ping},
+            max_concurrency=1,
+        )
+    ] == [
+        b"[",
+        b'{"jsonrpc":"2.0","result":"pong","id":1}',
+        b",",
+        b'{"jsonrpc":"2.0","result":"pong","id":2}',
+        b"]",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_iter_notification() -> None:
+    assert [
+        chunk
+        async for chunk in dispatch_iter(
+            b'{"jsonrpc": "2.0", "method": "ping"}', {"ping": ping}
+        )
+    ] == []
+
+
+@pytest.mark.asyncio
+async def test_dispatch_as_completed() -> None:
+    async def slow() -> Result:
+        await asyncio.sleep(0.02)
+        return Success("slow")
+
+    assert [
+        response
+        async for response in dispatch_as_completed(
+            '[{"jsonrpc": "2.0", "method": "slow", "id": 1}, '
+            '{"jsonrpc": "2.0", "method": "ping", "id": 2}]',
+            {"ping": ping, "slow": slow},
+        )
+    ] == [Right(SuccessResponse("pong", 2)), Right(SuccessResponse("slow", 1))]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_as_completed_notification() -> None:
+    assert [
+        response
+        async for response in dispatch_as_completed(
+            '{"jsonrpc": "2.0", "method": "ping"}', {"ping": ping}
+        )
+    ] == []
+
+
+UNENCODABLE_BATCH = (
+    b'[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+    b'{"jsonrpc": "2.0", "method": "unencodable", "id": 2}, '
+    b'{"jsonrpc": "2.0", "method": "ping", "id": 3}]'
+)
+
+
+async def unencodable() -> Result:
+    return Success(object())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "dispatch",
+    [
+        lambda methods: dispatch_iter(
+            UNENCODABLE_BATCH, methods, encoder=stdlib_encoder, max_concurrency=1
+        ),
+        lambda methods: dispatch_stream(
+            chunks_of(UNENCODABLE_BATCH, 10),
+            methods,
+            encoder=stdlib_encoder,
+            max_concurrency=1,
+        ),
+    ],
+)
+async def test_dispatch_iter_encoder_error(dispatch: Any) -> None:
+    """A response that can't be encoded finishes the batch with a Server error, so
+    it's still valid json.
+    """
+    methods = {"ping": ping, "unencodable": unencodable}
+    (first, error) = json.loads(b"".join([chunk async for chunk in dispatch(methods)]))
+    assert first == {"jsonrpc": "2.0", "result": "pong", "id": 1}
+    assert error["error"]["code"] == -32000
+    assert error["id"] is None
+
+
+def no_validation(request: Any) -> Any:
+    return request
+
+
+@pytest.mark.asyncio
+async def test_dispatch_empty_batch_no_validation() -> None:
+    # The same nothing from each, rather than a Server error
+    assert await dispatch_to_json("[]", {"ping": ping}, validator=no_validation) == ""
+    assert [
+        chunk
+        async for chunk in dispatch_iter("[]", {"ping": ping}, validator=no_validation)
+    ] == []
+    assert [
+        response
+        async for response in dispatch_as_completed(
+            "[]", {"ping": ping}, validator=no_validation
+        )
+    ] == []
+
+
+@pytest.mark.parametrize(
+    "dispatch",
+    [
+        lambda: dispatch_iter("[]", max_concurrency=0),
+        lambda: dispatch_as_completed("[]", max_concurrency=0),
+        lambda: dispatch_stream(chunks_of(b"[]", 1), max_concurrency=0),
+        lambda: AsyncDispatcher(max_concurrency=0),
+        lambda: get_dispatcher(
+            None,
+            context=NOCONTEXT,
+            deserializer=default_deserializer,
+            validator=default_validator,
+            executor=None,
+            max_workers=None,
+            max_concurrency=-1,
+            semaphore=None,
+            timing_hook=None,
+            metrics=None,
+            tracer=None,
+            trace_context_field=None,
+        ),
+    ],
+)
+def test_invalid_max_concurrency(dispatch: Any) -> None:
+    with pytest.raises(ValueError):
+        dispatch()
+
+
+@pytest.mark.asyncio
+async def test_dispatch_to_json_invalid_max_concurrency() -> None:
+    # Raised to the caller, not answered with a Server error
+    with pytest.raises(ValueError):
+        await dispatch_to_json("[]", max_concurrency=0)
+
+
+async def chunks_of(body: bytes, size: int) -> AsyncIterator[bytes]:
+    for i in range(0, len(body), size):
+        yield body[i : i + size]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_stream() -> None:
+    assert [
+        chunk
+        async for chunk in dispatch_stream(
+            chunks_of(
+                b'[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+                b'{"jsonrpc": "2.0", "method": "ping"}, '
+                b'{"jsonrpc": "2.0", "method": "ping", "id": 2}]',
+                8,
+            ),
+            {"ping": ping},
+        )
+    ] == [
+        b"[",
+        b'{"jsonrpc":"2.0","result":"pong","id":1}',
+        b",",
+        b'{"jsonrpc":"2.0","result":"pong","id":2}',
+        b"]",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_stream_reader() -> None:
+    reader = asyncio.StreamReader()
+    reader.feed_data(b'{"jsonrpc": "2.0", "method": "ping", "id": 1}')
+    reader.feed_eof()
+    assert [chunk async for chunk in dispatch_stream(reader, {"ping": ping})] == [
+        b'{"jsonrpc":"2.0","result":"pong","id":1}'
+    ]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_stream_max_concurrency() -> None:
+    running: List[int] = []
+
+    async def tracked(number: int) -> Result:
+        running.append(number)
+        await asyncio.sleep(0)
+        peak = len(running)
+        running.remove(number)
+        return Success(peak)
+
+    body = b"[%s]" % b",".join(
+        b'{"jsonrpc": "2.0", "method": "tracked", "params": [%d], "id": %d}' % (i, i)
+        for i in range(10)
+    )
+    chunks = [
+        chunk
+        async for chunk in dispatch_stream(
+            chunks_of(body, 10), {"tracked": tracked}, max_concurrency=3
+        )
+    ]
+    peaks = [json.loads(chunk)["result"] for chunk in chunks[1::2]]
+    assert len(peaks) == 10
+    assert max(peaks) <= 3
+
+
+@pytest.mark.asyncio
+async def test_dispatch_stream_malformed_partway() -> None:
+    chunks = [
+        chunk
+        async for chunk in dispatch_stream(
+            chunks_of(b'[{"jsonrpc": "2.0", "method": "ping", "id": 1}, {]', 4),
+            {"ping": ping},
+        )
+    ]
+    assert chunks[:3] == [b"[", b'{"jsonrpc":"2.0","result":"pong","id":1}', b","]
+    assert chunks[3].startswith(b'{"jsonrpc":"2.0","error":{"code":-32700')
+    assert chunks[4:] == [b"]"]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_stream_parse_error() -> None:
+    (chunk,) = [
+        chunk async for chunk in dispatch_stream(chunks_of(b"[{", 1), {"ping": ping})
+    ]
+    assert chunk.startswith(b'{"jsonrpc":"2.0","error":{"code":-32700')
+
+
+@pytest.mark.asyncio
+async def test_async_dispatcher_dispatch() -> None:
+    assert (
+        await AsyncDispatcher({"ping": ping}).dispatch(
+            '{"jsonrpc": "2.0", "method": "ping", "id": 1}'
+        )
+        == '{"jsonrpc": "2.0", "result": "pong", "id": 1}'
+    )
+
+
+@pytest.mark.asyncio
+async def test_async_dispatcher_batch() -> None:
+    def sync_ping() -> Result:
+        return Success("sync pong")
+
+    assert await AsyncDispatcher(
+        {"ping": ping, "sync_ping": sync_ping}, max_concurrency=1
+    ).dispatch_to_serializable(
+        '[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+        '{"jsonrpc": "2.0", "method": "ping"}, '
+        '{"jsonrpc": "2.0", "method": "sync_ping", "id": 2}, '
+        '{"jsonrpc": "2.0", "method": "ping", "params": [1], "id": 3}]'
+    ) == [
+        {"jsonrpc": "2.0", "result": "pong", "id": 1},
+        {"jsonrpc": "2.0", "result": "sync pong", "id": 2},
+        {
+            "jsonrpc": "2.0",
+            "error": {
+                "code": -32602,
+                "message": "Invalid params",
+                "data": "too many positional arguments",
+            },
+            "id": 3,
+        },
+    ]
+
+
+@pytest.mark.asyncio
+async def test_async_dispatcher_notification() -> None:
+    assert (
+        await AsyncDispatcher({"ping": ping}).dispatch(
+            '{"jsonrpc": "2.0", "method": "ping"}'
+        )
+        == ""
+    )
+
+
+@pytest.mark.asyncio
+async def test_async_dispatcher_semaphore() -> None:
+    running: List[None] = []
+    peaks = []
+
+    async def tracked() -> Result:
+        running.append(None)
+        peaks.append(len(running))
+        await asyncio.sleep(0)
+        running.pop()
+        return Success()
+
+    dispatcher = AsyncDispatcher({"tracked": tracked}, semaphore=asyncio.Semaphore(2))
+    await asyncio.gather(
+        *(
+            dispatcher.dispatch('{"jsonrpc": "2.0", "method": "tracked", "id": 1}')
+            for _ in range(5)
+        )
+    )
+    assert max(peaks) == 2
+
+
+@pytest.mark.asyncio
+async def test_async_dispatcher_compiles_once() -> None:
+    dispatcher = AsyncDispatcher({"ping": ping})
+    await dispatcher.dispatch('{"jsonrpc": "2.0", "method": "ping", "id": 1}')
+    entry = dispatcher.table["ping"]
+    await dispatcher.dispatch('{"jsonrpc": "2.0", "method": "ping", "id": 2}')
+    assert dispatcher.table["ping"] is entry
+
+
+def test_async_get_dispatcher_default() -> None:
+    settings: Any = {
+        "context": NOCONTEXT,
+        "deserializer": default_deserializer,
+        "validator": default_validator,
+        "executor": None,
+        "max_workers": None,
+        "max_concurrency": None,
+        "semaphore": None,
+        "timing_hook": None,
+        "metrics": None,
+        "tracer": None,
+        "trace_context_field": None,
+    }
+    assert get_dispatcher(None, **settings) is default_dispatcher
+    settings["max_concurrency"] = 2
+    assert get_dispatcher(None, **settings) is not default_dispatcher
+
+
+@pytest.mark.asyncio
+async def test_dispatch_timing_hook() -> None:
+    stages: List[Tuple[str, Optional[str], Optional[int]]] = []
+
+    def hook(
+        stage: str, seconds: float, method: Optional[str], code: Optional[int]
+    ) -> None:
+        assert seconds >= 0
+        stages.append((stage, method, code))
+
+    await dispatch_to_json(
+        '[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+        '{"jsonrpc": "2.0", "method": "ping", "params": [1], "id": 2}]',
+        {"ping": ping},
+        timing_hook=hook,
+        semaphore=asyncio.Semaphore(1),
+    )
+    # The requests in the batch are dispatched concurrently
+    assert sorted(stages, key=str) == sorted(
+        [
+            ("deserialize", None, None),
+            ("validate", None, None),
+            ("get_method", "ping", None),
+            ("validate_args", "ping", None),
+            ("call", "ping", None),
+            ("get_method", "ping", None),
+            ("validate_args", "ping", -32602),
+            ("serialize", None, None),
+        ],
+        key=str,
+    )
+
+
+@pytest.mark.asyncio
+async def test_dispatch_metrics() -> None:
+    metrics = Metrics()
+    await dispatch_to_response(
+        '[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+        '{"jsonrpc": "2.0", "method": "ping", "params": [1], "id": 2}]',
+        {"ping": ping},
+        metrics=metrics,
+        semaphore=asyncio.Semaphore(1),
+    )
+    snapshot = metrics.snapshot()["ping"]
+    assert snapshot["requests"] == 2
+    assert snapshot["errors"] == {-32602: 1}
+    assert snapshot["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_concurrency", [None, 1])
+async def test_dispatch_tracer(max_concurrency: Optional[int]) -> None:
+    tracer = MemoryTracer()
+    await dispatch_to_response(
+        '[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+        '{"jsonrpc": "2.0", "method": "ping", "params": [1], "id": 2}]',
+        {"ping": ping},
+        tracer=tracer,
+        max_concurrency=max_concurrency,
+    )
+    batch, *calls = tracer.spans
+    assert batch.name == "jsonrpc.batch"
+    assert [span.parent for span in calls] == [batch, batch]
+    assert sorted(span.attributes["rpc.jsonrpc.batch_index"] for span in calls) == [
+        0,
+        1,
+    ]
+    assert sorted(
+        str(span.attributes.get("rpc.jsonrpc.error_code")) for span in calls
+    ) == ["-32602", "None"]
+    assert all(span.ended for span in tracer.spans)
+
+
+@pytest.mark.asyncio
+async def test_dispatch_tracer_trace_context() -> None:
+    async def echo(value: int) -> Result:
+        return Success(value)
+
+    tracer = MemoryTracer()
+    await dispatch_to_response(
+        '{"jsonrpc": "2.0", "method": "echo",'
+        ' "params": {"value": 1, "_trace": "ctx"}, "id": 1}',
+        {"echo": echo},
+        tracer=tracer,
+        trace_context_field="_trace",
+    )
+    assert len(tracer.spans) == 1
+    span = tracer.spans[0]
+    assert span.parent == "ctx"
+    assert "rpc.jsonrpc.error_code" not in span.attributes
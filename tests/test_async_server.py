@@ -0,0 +1,276 @@
+"""Test async_server.py"""
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Tuple
+import asyncio
+import json
+
+import pytest
+
+from jsonrpcserver.async_server import (
+    HttpError,
+    content_length,
+    parse_head,
+    start_server,
+)
+from jsonrpcserver.methods import method
+from jsonrpcserver.metrics import Metrics
+from jsonrpcserver.result import Result, Success
+
+# pylint: disable=missing-function-docstring
+
+
+@method(name="async_server_sleep")
+async def sleep(seconds: float) -> Result:
+    await asyncio.sleep(seconds)
+    return Success(seconds)
+
+
+def error_status(func: Callable[..., Any], *args: Any) -> int:
+    """The status of the HttpError raised by the function."""
+    try:
+        func(*args)
+    except HttpError as exc:
+        return exc.status
+    raise AssertionError("HttpError not raised")
+
+
+def post(body: str, headers: str = "") -> bytes:
+    return (
+        f"POST / HTTP/1.1\r\nHost: x\r\nContent-Length: {len(body)}\r\n{headers}\r\n"
+        f"{body}"
+    ).encode()
+
+
+def call(seconds: float, id_: int) -> str:
+    return json.dumps(
+        {
+            "jsonrpc": "2.0",
+            "method": "async_server_sleep",
+            "params": [seconds],
+            "id": id_,
+        }
+    )
+
+
+async def read_head(reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str]]:
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    headers = dict(line.lower().split(": ", 1) for line in lines[1:] if line)
+    return int(lines[0].split(" ")[1]), headers
+
+
+async def read_response(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    status, headers = await read_head(reader)
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, body
+
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+@asynccontextmanager
+async def connect() -> AsyncIterator[Connection]:
+    server = await start_server(
+        "127.0.0.1",
+        0,
+        metrics=Metrics(),
+        max_request_size=1000,
+        max_header_size=1000,
+        max_pipeline=2,
+        keep_alive_timeout=0.5,
+    )
+    port = server.sockets[0].getsockname()[1]  # type: ignore
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    yield reader, writer
+    writer.close()
+    server.close()
+    await server.wait_closed()
+
+
+def test_parse_head() -> None:
+    request = parse_head(b"POST /foo HTTP/1.1\r\nContent-Length: 2\r\n\r\n")
+    assert request.method == "POST"
+    assert request.path == "/foo"
+    assert request.headers == {"content-length": "2"}
+    assert request.keep_alive is True
+
+
+@pytest.mark.parametrize(
+    "head,keep_alive",
+    [
+        (b"GET / HTTP/1.1\r\nConnection: close\r\n\r\n", False),
+        (b"GET / HTTP/1.0\r\n\r\n", False),
+        (b"GET / HTTP/1.0\r\nConnection: Keep-Alive\r\n\r\n", True),
+    ],
+)
+def test_parse_head_keep_alive(head: bytes, keep_alive: bool) -> None:
+    assert parse_head(head).keep_alive is keep_alive
+
+
+@pytest.mark.parametrize(
+    "head,status",
+    [
+        (b"POST /\r\n\r\n", 400),
+        (b"POST / HTTP/2\r\n\r\n", 505),
+        (b"POST / HTTP/1.1\r\nfoo\r\n\r\n", 400),
+        (b"POST / HTTP/1.1\r\nfoo : bar\r\n\r\n", 400),
+    ],
+)
+def test_parse_head_invalid(head: bytes, status: int) -> None:
+    assert error_status(parse_head, head) == status
+
+
+@pytest.mark.parametrize(
+    "headers,status",
+    [
+        (b"", 411),
+        (b"Transfer-Encoding: chunked\r\n", 411),
+        (b"Content-Length: -1\r\n", 400),
+        ("Content-Length: \u00b2\r\n".encode("latin-1"), 400),
+        ("Content-Length: 1\u00b9\r\n".encode("latin-1"), 400),
+        (b"Content-Length: 11\r\n", 413),
+    ],
+)
+def test_content_length_invalid(headers: bytes, status: int) -> None:
+    request = parse_head(b"POST / HTTP/1.1\r\n" + headers + b"\r\n")
+    assert error_status(content_length, request, 10) == status
+
+
+def test_content_length() -> None:
+    request = parse_head(b"POST / HTTP/1.1\r\nContent-Length: 10\r\n\r\n")
+    assert content_length(request, 10) == 10
+    assert content_length(parse_head(b"GET / HTTP/1.1\r\n\r\n"), 10) == 0
+
+
+@pytest.mark.asyncio
+async def test_keep_alive() -> None:
+    async with connect() as (reader, writer):
+        for id_ in range(3):
+            writer.write(post(call(0, id_)))
+            status, body = await read_response(reader)
+            assert status == 200
+            assert json.loads(body)["id"] == id_
+
+
+@pytest.mark.asyncio
+async def test_pipelining() -> None:
+    """The slower first request is answered first."""
+    async with connect() as (reader, writer):
+        writer.write(post(call(0.1, 1)) + post(call(0, 2)) + post(call(0, 3)))
+        ids = [json.loads((await read_response(reader))[1])["id"] for _ in range(3)]
+        assert ids == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_notification() -> None:
+    async with connect() as (reader, writer):
+        writer.write(
+            post(json.dumps({"jsonrpc": "2.0", "method": "async_server_sleep"}))
+        )
+        writer.write(post(call(0, 1)))
+        assert await read_response(reader) == (204, b"")
+        assert (await read_response(reader))[0] == 200
+
+
+@pytest.mark.asyncio
+async def test_connection_close() -> None:
+    async with connect() as (reader, writer):
+        writer.write(post(call(0, 1), "Connection: close\r\n"))
+        assert (await read_response(reader))[0] == 200
+        assert await reader.read() == b""
+
+
+@pytest.mark.asyncio
+async def test_request_too_large() -> None:
+    async with connect() as (reader, writer):
+        writer.write(post(" " * 1001))
+        assert (await read_response(reader))[0] == 413
+        assert await reader.read() == b""
+
+
+@pytest.mark.asyncio
+async def test_header_too_large() -> None:
+    async with connect() as (reader, writer):
+        writer.write(post("", "Foo: " + "a" * 1000 + "\r\n"))
+        assert (await read_response(reader))[0] == 431
+
+
+@pytest.mark.asyncio
+async def test_invalid_content_length() -> None:
+    async with connect() as (reader, writer):
+        writer.write(
+            "POST / HTTP/1.1\r\nContent-Length: \u00b2\r\n\r\n".encode("latin-1")
+        )
+        assert (await read_response(reader))[0] == 400
+
+
+@pytest.mark.asyncio
+async def test_expect_100() -> None:
+    async with connect() as (reader, writer):
+        body = call(0, 1)
+        writer.write(
+            f"POST / HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+            "Expect: 100-continue\r\n\r\n".encode()
+        )
+        assert await reader.readuntil(b"\r\n\r\n") == b"HTTP/1.1 100 Continue\r\n\r\n"
+        writer.write(body.encode())
+        assert (await read_response(reader))[0] == 200
+
+
+@pytest.mark.asyncio
+async def test_metrics() -> None:
+    async with connect() as (reader, writer):
+        writer.write(post(call(0, 1)))
+        await read_response(reader)
+        writer.write(b"GET /metrics HTTP/1.1\r\n\r\n")
+        status, body = await read_response(reader)
+        assert status == 200
+        assert b'jsonrpc_requests_total{method="async_server_sleep"} 1' in body
+        writer.write(b"GET /other HTTP/1.1\r\n\r\n")
+        status, headers = await read_head(reader)
+        assert status == 404
+        # The connection is kept open
+        assert "connection" not in headers
+        writer.write(post(call(0, 2)))
+        assert (await read_response(reader))[0] == 200
+
+
+@pytest.mark.asyncio
+async def test_not_implemented() -> None:
+    async with connect() as (reader, writer):
+        writer.write(b"PUT / HTTP/1.1\r\nContent-Length: 0\r\n\r\n")
+        assert (await read_response(reader))[0] == 501
+        writer.write(post(call(0, 1)))
+        assert (await read_response(reader))[0] == 200
+
+
+@pytest.mark.asyncio
+async def test_http_10_keep_alive() -> None:
+    async with connect() as (reader, writer):
+        body = call(0, 1)
+        for _ in range(2):
+            writer.write(
+                f"POST / HTTP/1.0\r\nConnection: keep-alive\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n{body}".encode()
+            )
+            status, headers = await read_head(reader)
+            assert status == 200
+            assert headers["connection"] == "keep-alive"
+            await reader.readexactly(int(headers["content-length"]))
+
+
+@pytest.mark.asyncio
+async def test_slow_method_outlasts_keep_alive_timeout() -> None:
+    """The connection isn't idle while a response is being computed."""
+    async with connect() as (reader, writer):
+        writer.write(post(call(0.8, 1)))
+        status, body = await read_response(reader)
+        assert status == 200
+        assert json.loads(body)["id"] == 1
+
+
+@pytest.mark.asyncio
+async def test_keep_alive_timeout() -> None:
+    async with connect() as (reader, _):
+        # The server closes the idle connection
+        assert await asyncio.wait_for(reader.read(), 5) == b""
@@ -0,0 +1,107 @@
+"""Test cache.py"""
+from typing import List
+
+import pytest
+
+from jsonrpcserver.cache import CacheStats, ResultCache, make_key
+from jsonrpcserver.result import Success
+
+# pylint: disable=missing-function-docstring
+
+
+class Clock:  # pylint: disable=too-few-public-methods
+    """A clock that only moves when told to."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_make_key_named_params_order() -> None:
+    assert make_key({"a": 1, "b": [2, 3]}) == make_key({"b": [2, 3], "a": 1})
+
+
+@pytest.mark.parametrize(
+    "params",
+    [{"0": 1, "1": 2}, [1.0, 2], [True, 2], ["1", 2], [[1, 2]]],
+)
+def test_make_key_different_params(params: List[object]) -> None:
+    assert make_key(params) != make_key([1, 2])
+
+
+def test_make_key_not_json() -> None:
+    circular: List[object] = []
+    circular.append(circular)
+    assert make_key([{1, 2}]) is None
+    assert make_key(circular) is None
+
+
+def test_get_miss() -> None:
+    cache = ResultCache()
+    assert cache.get("[]") is None
+    assert cache.stats() == CacheStats(
+        hits=0, misses=1, evictions=0, expirations=0, size=0
+    )
+
+
+def test_put_get() -> None:
+    cache = ResultCache()
+    cache.put("[1]", Success(1))
+    assert cache.get("[1]") == Success(1)
+    assert cache.stats() == CacheStats(
+        hits=1, misses=0, evictions=0, expirations=0, size=1
+    )
+
+
+def test_evicts_least_recently_used() -> None:
+    cache = ResultCache(maxsize=2)
+    cache.put("[1]", Success(1))
+    cache.put("[2]", Success(2))
+    cache.get("[1]")
+    cache.put("[3]", Success(3))
+    assert cache.get("[2]") is None
+    assert cache.get("[1]") == Success(1)
+    assert cache.get("[3]") == Success(3)
+    assert cache.stats().evictions == 1
+
+
+def test_ttl() -> None:
+    clock = Clock()
+    cache = ResultCache(ttl=10, clock=clock)
+    cache.put("[1]", Success(1))
+    clock.now = 9.9
+    assert cache.get("[1]") == Success(1)
+    clock.now = 10
+    assert cache.get("[1]") is None
+    assert cache.stats() == CacheStats(
+        hits=1, misses=1, evictions=0, expirations=1, size=0
+    )
+
+
+def test_put_replaces() -> None:
+    clock = Clock()
+    cache = ResultCache(maxsize=1, ttl=10, clock=clock)
+    cache.put("[1]", Success(1))
+    clock.now = 5
+    cache.put("[1]", Success(2))
+    clock.now = 12
+    assert cache.get("[1]") == Success(2)
+    assert cache.stats().evictions == 0
+
+
+def test_clear() -> None:
+    cache = ResultCache()
+    cache.put("[1]", Success(1))
+    cache.get("[1]")
+    cache.clear()
+    assert cache.get("[1]") is None
+    assert cache.stats() == CacheStats(
+        hits=1, misses=1, evictions=0, expirations=0, size=0
+    )
+
+
+def test_invalid_maxsize() -> None:
+    with pytest.raises(ValueError):
+        ResultCache(maxsize=0)
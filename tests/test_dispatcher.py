@@ -2,13 +2,18 @@
 
 TODO: Add tests for dispatch_requests (non-pure version)
 """
-from typing import Any, Callable, Dict
-from unittest.mock import Mock, patch, sentinel
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier, Event
+from time import sleep
+from typing import Any, Callable, Dict, NoReturn, Set
+from unittest.mock import ANY, Mock, patch, sentinel
 import json
+import os
 import pytest
 
 from oslash.either import Left, Right  # type: ignore
 
+from jsonrpcserver.cache import ResultCache
 from jsonrpcserver.codes import (
     ERROR_INTERNAL_ERROR,
     ERROR_INVALID_PARAMS,
@@ -19,14 +24,17 @@ from jsonrpcserver.codes import (
 )
 from jsonrpcserver.dispatcher import (
     call,
+    compile_call,
     create_request,
     dispatch_deserialized,
     dispatch_request,
+    dispatch_to_iter_pure,
     dispatch_to_response_pure,
     extract_list,
     extract_args,
     extract_kwargs,
     get_method,
+    in_flight,
     not_notification,
     to_response,
     validate_args,
@@ -43,6 +51,7 @@ from jsonrpcserver.methods import method
 from jsonrpcserver.request import Request
 from jsonrpcserver.response import ErrorResponse, SuccessResponse
 from jsonrpcserver.result import (
+    Error,
     ErrorResult,
     InvalidParams,
     Result,
@@ -52,13 +61,36 @@ from jsonrpcserver.result import (
 from jsonrpcserver.sentinels import NOCONTEXT, NODATA, NOID
 from jsonrpcserver.utils import identity
 
-# pylint: disable=missing-function-docstring,missing-class-docstring,too-few-public-methods,unnecessary-lambda-assignment,invalid-name,disallowed-name
+# pylint: disable=missing-function-docstring,missing-class-docstring,too-few-public-methods,unnecessary-lambda-assignment,invalid-name,disallowed-name,too-many-lines
 
 
 def ping() -> Result:
     return Success("pong")
 
 
+# Methods called in a process pool must be importable by the workers
+
+
+@method(executor="process")
+def square(number: int) -> Result:
+    return Success(number * number)
+
+
+@method(executor="process")
+def process_raising_jsonrpcerror() -> Result:
+    raise JsonRpcError(code=1, message="foo", data="bar")
+
+
+@method(executor="process")
+def process_raising_exception() -> Result:
+    raise ValueError("foo")
+
+
+@method(executor="process")
+def process_crash() -> NoReturn:
+    os._exit(1)  # pylint: disable=protected-access
+
+
 # extract_list
 
 
@@ -211,6 +243,48 @@ def test_call_raising_exception() -> None:
     )
 
 
+# call in a process
+
+
+def test_call_process() -> None:
+    assert call(Request("square", [3], 1), NOCONTEXT, square) == Right(SuccessResult(9))
+
+
+def test_call_process_with_context() -> None:
+    assert call(Request("square", [], 1), 3, square) == Right(SuccessResult(9))
+
+
+def test_call_process_raising_jsonrpcerror() -> None:
+    assert call(
+        Request("process_raising_jsonrpcerror", [], 1),
+        NOCONTEXT,
+        process_raising_jsonrpcerror,
+    ) == Left(ErrorResult(1, "foo", "bar"))
+
+
+def test_call_process_raising_exception() -> None:
+    assert call(
+        Request("process_raising_exception", [], 1),
+        NOCONTEXT,
+        process_raising_exception,
+    ) == Left(ErrorResult(ERROR_INTERNAL_ERROR, "Internal error", "foo"))
+
+
+def test_call_process_crash() -> None:
+    assert call(Request("process_crash", [], 1), NOCONTEXT, process_crash) == Left(
+        ErrorResult(ERROR_INTERNAL_ERROR, "Internal error", ANY)
+    )
+    # The broken pool is replaced
+    assert call(Request("square", [3], 1), NOCONTEXT, square) == Right(SuccessResult(9))
+
+
+def test_call_process_not_picklable() -> None:
+    func = method(lambda: Success("foo"), name="not_picklable", executor="process")
+    assert call(Request("not_picklable", [], 1), NOCONTEXT, func) == Left(
+        ErrorResult(ERROR_INTERNAL_ERROR, "Internal error", ANY)
+    )
+
+
 # validate_args
 
 
@@ -283,6 +357,154 @@ def test_dispatch_request_with_context() -> None:
     # Assert is in the method
 
 
+def test_dispatch_request_cached() -> None:
+    calls = []
+    cache = ResultCache()
+
+    @method(name="cached_square", cache=cache)
+    def cached_square(number: int) -> Result:
+        calls.append(number)
+        return Success(number * number)
+
+    methods = {"square": cached_square}
+    for number in [2, 3, 2, 2]:
+        request = Request("square", [number], 1)
+        assert dispatch_request(methods, NOCONTEXT, request) == (
+            request,
+            Right(SuccessResult(number * number)),
+        )
+    assert calls == [2, 3]
+    assert cache.stats().hits == 2
+
+
+def test_dispatch_request_cached_errors_not_cached() -> None:
+    calls = []
+    cache = ResultCache()
+
+    @method(name="cached_fail", cache=cache)
+    def fail(number: int) -> Result:
+        calls.append(number)
+        return Error(1, "Failed")
+
+    methods = {"fail": fail}
+    for params in [[1], [1], [1, 2], [1, 2]]:
+        assert isinstance(
+            dispatch_request(methods, NOCONTEXT, Request("fail", params, 1))[1], Left
+        )
+    assert calls == [1, 1]
+    assert cache.stats().size == 0
+
+
+def test_dispatch_request_cached_not_json() -> None:
+    calls = []
+    cache = ResultCache()
+
+    @method(name="cached_not_json", cache=cache, coalesce=True)
+    def size(numbers: Set[int]) -> Result:
+        calls.append(numbers)
+        return Success(len(numbers))
+
+    # Params from a custom deserializer, with no json key, are neither cached nor
+    # coalesced
+    for _ in range(2):
+        request = Request("size", [{1, 2}], 1)
+        assert dispatch_request({"size": size}, NOCONTEXT, request) == (
+            request,
+            Right(SuccessResult(2)),
+        )
+    assert len(calls) == 2
+    assert cache.stats().size == 0
+
+
+def test_dispatch_request_cached_threads() -> None:
+    cache = ResultCache(maxsize=8)
+
+    @method(name="cached_identity", cache=cache)
+    def identity_(number: int) -> Result:
+        return Success(number)
+
+    def dispatch_number(number: int) -> Any:
+        return dispatch_request(
+            {"identity": identity_}, NOCONTEXT, Request("identity", [number % 20], 1)
+        )[1]
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(dispatch_number, range(1000)))
+    assert results == [Right(SuccessResult(n % 20)) for n in range(1000)]
+    stats = cache.stats()
+    assert stats.hits + stats.misses == 1000
+    assert stats.size == 8
+
+
+def test_dispatch_request_coalesced() -> None:
+    calls = []
+    release = Event()
+
+    @method(name="coalesced_slow", coalesce=True)
+    def slow(number: int) -> Result:
+        calls.append(number)
+        release.wait(5)
+        return Success(number)
+
+    def dispatch_id(request_id: int) -> Any:
+        return dispatch_request(
+            {"slow": slow}, NOCONTEXT, Request("slow", [1], request_id)
+        )
+
+    with ThreadPoolExecutor(5) as pool:
+        leader = pool.submit(dispatch_id, 0)
+        while not in_flight:
+            sleep(0.001)
+        followers = [pool.submit(dispatch_id, i) for i in range(1, 5)]
+        sleep(0.1)
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+    assert calls == [1]
+    assert [request.id for request, _ in results] == [0, 1, 2, 3, 4]
+    assert all(result == Right(SuccessResult(1)) for _, result in results)
+    assert not in_flight
+    # Later calls are made again
+    dispatch_id(5)
+    assert calls == [1, 1]
+
+
+def test_dispatch_request_coalesced_exception() -> None:
+    @method(name="coalesced_fail", coalesce=True)
+    def fail() -> Result:
+        raise ValueError("Failed")
+
+    with patch("jsonrpcserver.dispatcher.call", side_effect=RuntimeError):
+        with pytest.raises(RuntimeError):
+            dispatch_request({"fail": fail}, NOCONTEXT, Request("fail", [], 1))
+    assert not in_flight
+
+
+def test_compile_call() -> None:
+    def add(context: int, first: int, second: int = 0) -> Result:
+        return Success(context + first + second)
+
+    call_ = compile_call(add, 100)
+    assert call_(Request("add", [1, 2], 1)) == Right(SuccessResult(103))
+    assert call_(Request("add", {"first": 1}, 1)) == Right(SuccessResult(101))
+    assert call_(Request("add", [], 1)) == Left(
+        ErrorResult(
+            ERROR_INVALID_PARAMS,
+            "Invalid params",
+            "missing a required argument: 'first'",
+        )
+    )
+
+
+def test_compile_call_with_options() -> None:
+    @method(name="compiled_cached", cache=ResultCache())
+    def cached() -> Result:
+        return Success("cached")
+
+    with patch("jsonrpcserver.dispatcher.call_cached") as call_cached:
+        compile_call(cached, NOCONTEXT)(Request("cached", [], 1))
+    call_cached.assert_called_once_with(Request("cached", [], 1), NOCONTEXT, cached)
+
+
 # create_request
 
 
@@ -314,6 +536,26 @@ def test_dispatch_deserialized() -> None:
     ) == Right(SuccessResponse("pong", 1))
 
 
+def test_dispatch_deserialized_executor() -> None:
+    barrier = Barrier(3, timeout=5)
+
+    def wait(n: int) -> Result:
+        barrier.wait()
+        return Success(n)
+
+    with ThreadPoolExecutor(3) as executor:
+        assert dispatch_deserialized(
+            methods={"wait": wait},
+            context=NOCONTEXT,
+            post_process=identity,
+            deserialized=[
+                {"jsonrpc": "2.0", "method": "wait", "params": [n], "id": n}
+                for n in range(3)
+            ],
+            executor=executor,
+        ) == [Right(SuccessResponse(n, n)) for n in range(3)]
+
+
 # validate_request
 
 
@@ -466,6 +708,29 @@ def test_dispatch_to_response_pure_server_error(*_: Mock) -> None:
     ) == Left(ErrorResponse(ERROR_SERVER_ERROR, "Server error", "foo", None))
 
 
+def test_dispatch_to_iter_pure_server_error() -> None:
+    """A library error part way through a batch finishes it with a server error."""
+    with patch(
+        "jsonrpcserver.dispatcher.dispatch_request",
+        side_effect=[(Request("ping", [], 1), Success("pong")), ValueError("foo")],
+    ):
+        assert b"".join(
+            dispatch_to_iter_pure(
+                deserializer=default_deserializer,
+                validator=default_validator,
+                encoder=lambda x: json.dumps(x).encode(),
+                context=NOCONTEXT,
+                methods={"ping": ping},
+                request='[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+                '{"jsonrpc": "2.0", "method": "ping", "id": 2}]',
+            )
+        ) == (
+            b'[{"jsonrpc": "2.0", "result": "pong", "id": 1},'
+            b'{"jsonrpc": "2.0", "error": {"code": -32000, "message": "Server error", '
+            b'"data": "foo"}, "id": null}]'
+        )
+
+
 def test_dispatch_to_response_pure_invalid_result() -> None:
     """Methods should return a Result, otherwise we get an Internal Error response."""
 
@@ -0,0 +1,37 @@
+"""Test executors.py"""
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from threading import Barrier
+
+from jsonrpcserver.executors import get_thread_pool, map_in_executor
+
+# pylint: disable=missing-function-docstring
+
+var: ContextVar[str] = ContextVar("var")
+
+
+def test_get_thread_pool() -> None:
+    assert get_thread_pool(2) is get_thread_pool(2)
+    assert get_thread_pool(2) is not get_thread_pool(3)
+
+
+def test_map_in_executor_order() -> None:
+    with ThreadPoolExecutor(4) as executor:
+        assert list(map_in_executor(executor, lambda x: x * 2, range(10))) == list(
+            range(0, 20, 2)
+        )
+
+
+def test_map_in_executor_concurrent() -> None:
+    barrier = Barrier(3, timeout=5)
+    with ThreadPoolExecutor(3) as executor:
+        assert list(map_in_executor(executor, lambda _: barrier.wait(), range(3)))
+
+
+def test_map_in_executor_context() -> None:
+    var.set("foo")
+    with ThreadPoolExecutor(2) as executor:
+        assert list(map_in_executor(executor, lambda _: var.get(), range(2))) == [
+            "foo",
+            "foo",
+        ]
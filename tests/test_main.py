@@ -1,13 +1,35 @@
 """Test main.py"""
+from io import BytesIO
+from typing import Any, List, Optional, Tuple
+import json
+
+import pytest
+
 from oslash.either import Right  # type: ignore
 
+from jsonrpcserver.cache import ResultCache
 from jsonrpcserver.main import (
+    Dispatcher,
+    default_deserializer,
+    default_dispatcher,
+    default_validator,
+    dispatch_iter,
+    dispatch_stream,
+    dispatch_to_bytes,
     dispatch_to_response,
     dispatch_to_serializable,
     dispatch_to_json,
+    get_dispatcher,
+    stdlib_encoder,
 )
+from jsonrpcserver.methods import LazyMethods, method
+from jsonrpcserver.metrics import Metrics
 from jsonrpcserver.response import SuccessResponse
 from jsonrpcserver.result import Result, Success
+from jsonrpcserver.sentinels import NOCONTEXT
+from jsonrpcserver.timing import set_timing_hook
+from jsonrpcserver.tracing import MemoryTracer
+from jsonrpcserver.utils import identity
 
 # pylint: disable=missing-function-docstring
 
@@ -16,12 +38,90 @@ def ping() -> Result:
     return Success("pong")
 
 
+def test_dispatch_lazy_methods() -> None:
+    methods = LazyMethods()
+    methods.add_lazy("tests.test_main:ping")
+    methods.add_lazy("no_such_module:ping", name="broken")
+    methods.add_namespace("main", "tests.test_main")
+    for dispatcher in (
+        Dispatcher(methods),
+        Dispatcher(methods, timing_hook=lambda *_: None),
+    ):
+        assert dispatcher.dispatch(
+            '[{"jsonrpc": "2.0", "method": "ping", "id": 1},'
+            '{"jsonrpc": "2.0", "method": "main.ping", "id": 2},'
+            '{"jsonrpc": "2.0", "method": "main.missing", "id": 3}]'
+        ) == (
+            '[{"jsonrpc": "2.0", "result": "pong", "id": 1}, '
+            '{"jsonrpc": "2.0", "result": "pong", "id": 2}, '
+            '{"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not '
+            'found", "data": "main.missing"}, "id": 3}]'
+        )
+    # Only the request for the method that can't be imported fails
+    assert json.loads(
+        Dispatcher(methods).dispatch(
+            '[{"jsonrpc": "2.0", "method": "broken", "id": 1},'
+            '{"jsonrpc": "2.0", "method": "ping", "id": 2}]'
+        )
+    ) == [
+        {
+            "jsonrpc": "2.0",
+            "error": {
+                "code": -32603,
+                "message": "Internal error",
+                "data": "No module named 'no_such_module'",
+            },
+            "id": 1,
+        },
+        {"jsonrpc": "2.0", "result": "pong", "id": 2},
+    ]
+
+
 def test_dispatch_to_response() -> None:
     assert dispatch_to_response(
         '{"jsonrpc": "2.0", "method": "ping", "id": 1}', {"ping": ping}
     ) == Right(SuccessResponse("pong", 1))
 
 
+REQUEST = '{"jsonrpc": "2.0", "method": "ping", "id": 1}'
+
+
+@pytest.mark.parametrize(
+    "request_",
+    [
+        REQUEST,
+        REQUEST.encode(),
+        bytearray(REQUEST.encode()),
+        memoryview(REQUEST.encode()),
+    ],
+)
+def test_default_deserializer(request_: Any) -> None:
+    assert default_deserializer(request_) == {
+        "jsonrpc": "2.0",
+        "method": "ping",
+        "id": 1,
+    }
+
+
+@pytest.mark.parametrize(
+    "request_",
+    [REQUEST.encode(), bytearray(REQUEST.encode()), memoryview(REQUEST.encode())],
+)
+def test_dispatch_to_response_bytes(request_: Any) -> None:
+    assert dispatch_to_response(request_, {"ping": ping}) == Right(
+        SuccessResponse("pong", 1)
+    )
+
+
+def test_dispatch_to_response_max_workers() -> None:
+    assert dispatch_to_response(
+        '[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+        '{"jsonrpc": "2.0", "method": "ping", "id": 2}]',
+        {"ping": ping},
+        max_workers=2,
+    ) == [Right(SuccessResponse("pong", 1)), Right(SuccessResponse("pong", 2))]
+
+
 def test_dispatch_to_serializable() -> None:
     assert dispatch_to_serializable(
         '{"jsonrpc": "2.0", "method": "ping", "id": 1}', {"ping": ping}
@@ -37,7 +137,558 @@ def test_dispatch_to_json() -> None:
     )
 
 
+def test_dispatch_to_json_bytes_parse_error() -> None:
+    assert '"code": -32700' in dispatch_to_json(b"\xff", {"ping": ping})
+
+
 def test_dispatch_to_json_notification() -> None:
     assert (
         dispatch_to_json('{"jsonrpc": "2.0", "method": "ping"}', {"ping": ping}) == ""
     )
+
+
+def test_stdlib_encoder() -> None:
+    assert stdlib_encoder({"foo": "bär"}) == '{"foo":"bär"}'.encode()
+
+
+def test_dispatch_to_bytes() -> None:
+    assert (
+        dispatch_to_bytes(
+            b'{"jsonrpc": "2.0", "method": "ping", "id": 1}', {"ping": ping}
+        )
+        == b'{"jsonrpc":"2.0","result":"pong","id":1}'
+    )
+
+
+def test_dispatch_to_bytes_stdlib_encoder() -> None:
+    assert (
+        dispatch_to_bytes(
+            b'{"jsonrpc": "2.0", "method": "ping", "id": 1}',
+            {"ping": ping},
+            encoder=stdlib_encoder,
+        )
+        == b'{"jsonrpc":"2.0","result":"pong","id":1}'
+    )
+
+
+@pytest.mark.parametrize(
+    "result",
+    [{1: "a"}, 2**70, [{"a": 1, 2: -(2**70)}]],
+)
+def test_dispatch_to_bytes_like_stdlib(result: Any) -> None:
+    """Whatever the encoder, results orjson can't serialize by default are as json."""
+    request = b'{"jsonrpc": "2.0", "method": "result", "id": 1}'
+    methods = {"result": lambda: Success(result)}
+    assert dispatch_to_bytes(request, methods) == dispatch_to_bytes(
+        request, methods, encoder=stdlib_encoder
+    )
+    assert json.loads(dispatch_to_bytes(request, methods)) == json.loads(
+        dispatch_to_json(request, methods)
+    )
+
+
+def test_dispatch_to_bytes_notification() -> None:
+    assert (
+        dispatch_to_bytes(b'{"jsonrpc": "2.0", "method": "ping"}', {"ping": ping})
+        == b""
+    )
+
+
+def test_dispatch_iter() -> None:
+    assert list(
+        dispatch_iter(b'{"jsonrpc": "2.0", "method": "ping", "id": 1}', {"ping": ping})
+    ) == [b'{"jsonrpc":"2.0","result":"pong","id":1}']
+
+
+def test_dispatch_iter_batch() -> None:
+    assert list(
+        dispatch_iter(
+            b'[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+            b'{"jsonrpc": "2.0", "method": "ping"}, '
+            b'{"jsonrpc": "2.0", "method": "ping", "id": 2}]',
+            {"ping": ping},
+        )
+    ) == [
+        b"[",
+        b'{"jsonrpc":"2.0","result":"pong","id":1}',
+        b",",
+        b'{"jsonrpc":"2.0","result":"pong","id":2}',
+        b"]",
+    ]
+
+
+def test_dispatch_iter_lazy() -> None:
+    dispatched = []
+
+    def record(number: int) -> Result:
+        dispatched.append(number)
+        return Success(number)
+
+    chunks = dispatch_iter(
+        b'[{"jsonrpc": "2.0", "method": "record", "params": [1], "id": 1}, '
+        b'{"jsonrpc": "2.0", "method": "record", "params": [2], "id": 2}]',
+        {"record": record},
+    )
+    assert next(chunks) == b"["
+    assert next(chunks) == b'{"jsonrpc":"2.0","result":1,"id":1}'
+    assert dispatched == [1]
+
+
+def test_dispatch_iter_batch_of_notifications() -> None:
+    assert not list(
+        dispatch_iter(b'[{"jsonrpc": "2.0", "method": "ping"}]', {"ping": ping})
+    )
+
+
+def test_dispatch_iter_parse_error() -> None:
+    (chunk,) = dispatch_iter(b"[", {"ping": ping})
+    assert chunk.startswith(b'{"jsonrpc":"2.0","error":{"code":-32700')
+
+
+UNENCODABLE_BATCH = (
+    b'[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+    b'{"jsonrpc": "2.0", "method": "unencodable", "id": 2}, '
+    b'{"jsonrpc": "2.0", "method": "ping", "id": 3}]'
+)
+
+
+def unencodable() -> Result:
+    return Success(object())
+
+
+@pytest.mark.parametrize(
+    "dispatch",
+    [
+        lambda methods: dispatch_iter(
+            UNENCODABLE_BATCH, methods, encoder=stdlib_encoder
+        ),
+        lambda methods: dispatch_stream(
+            BytesIO(UNENCODABLE_BATCH), methods, encoder=stdlib_encoder
+        ),
+    ],
+)
+def test_dispatch_iter_encoder_error(dispatch: Any) -> None:
+    """A response that can't be encoded finishes the batch with a Server error, so
+    it's still valid json.
+    """
+    methods = {"ping": ping, "unencodable": unencodable}
+    (first, error) = json.loads(b"".join(dispatch(methods)))
+    assert first == {"jsonrpc": "2.0", "result": "pong", "id": 1}
+    assert error["error"]["code"] == -32000
+    assert error["id"] is None
+
+
+def test_dispatch_stream() -> None:
+    assert list(
+        dispatch_stream(
+            BytesIO(
+                b'[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+                b'{"jsonrpc": "2.0", "method": "ping"}, '
+                b'{"jsonrpc": "2.0", "method": "ping", "id": 2}]'
+            ),
+            {"ping": ping},
+            chunk_size=8,
+        )
+    ) == [
+        b"[",
+        b'{"jsonrpc":"2.0","result":"pong","id":1}',
+        b",",
+        b'{"jsonrpc":"2.0","result":"pong","id":2}',
+        b"]",
+    ]
+
+
+def test_dispatch_stream_dispatches_as_it_reads() -> None:
+    stream = BytesIO(
+        b'[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+        b'{"jsonrpc": "2.0", "method": "ping", "id": 2}]'
+    )
+    chunks = dispatch_stream(stream, {"ping": ping}, chunk_size=50)
+    assert next(chunks) == b"["
+    assert next(chunks) == b'{"jsonrpc":"2.0","result":"pong","id":1}'
+    assert stream.tell() == 50
+
+
+def test_dispatch_stream_not_batch() -> None:
+    assert list(
+        dispatch_stream(
+            BytesIO(b'{"jsonrpc": "2.0", "method": "ping", "id": 1}'), {"ping": ping}
+        )
+    ) == [b'{"jsonrpc":"2.0","result":"pong","id":1}']
+
+
+def test_dispatch_stream_invalid_request_in_batch() -> None:
+    assert list(
+        dispatch_stream(
+            BytesIO(b'[{"jsonrpc": "2.0", "method": "ping", "id": 1}, 1, [2]]'),
+            {"ping": ping},
+        )
+    ) == [
+        b"[",
+        b'{"jsonrpc":"2.0","result":"pong","id":1}',
+        b",",
+        b'{"jsonrpc":"2.0","error":{"code":-32600,"message":"Invalid request",'
+        b'"data":"The request failed schema validation"},"id":null}',
+        b",",
+        b'{"jsonrpc":"2.0","error":{"code":-32600,"message":"Invalid request",'
+        b'"data":"The request failed schema validation"},"id":null}',
+        b"]",
+    ]
+
+
+def test_dispatch_stream_empty_batch() -> None:
+    (chunk,) = dispatch_stream(BytesIO(b"[]"), {"ping": ping})
+    assert chunk.startswith(b'{"jsonrpc":"2.0","error":{"code":-32600')
+
+
+@pytest.mark.parametrize("body", [b"", b"[", b"[{", b"{", b"[1", b"[x]"])
+def test_dispatch_stream_parse_error(body: bytes) -> None:
+    (chunk,) = dispatch_stream(BytesIO(body), {"ping": ping})
+    assert chunk.startswith(b'{"jsonrpc":"2.0","error":{"code":-32700')
+
+
+PING = b'{"jsonrpc": "2.0", "method": "ping", "id": %d}'
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 30, 65536])
+@pytest.mark.parametrize(
+    "body,ids",
+    [
+        (b"[" + PING % 0 + b"," + PING % 1 + b" " + PING % 2 + b"]", [0, 1]),
+        (b"[" + PING % 0 + b"," + PING % 1 + b",]", [0, 1]),
+        (b"[" + PING % 0 + b"] x", [0]),
+        (b"[" + PING % 0 + b", x]", [0]),
+    ],
+)
+def test_dispatch_stream_malformed_after_requests(
+    body: bytes, ids: List[int], chunk_size: int
+) -> None:
+    """The requests before the error are answered, whatever the chunk size."""
+    chunks = list(dispatch_stream(BytesIO(body), {"ping": ping}, chunk_size=chunk_size))
+    responses = [json.loads(chunk) for chunk in chunks[1:-1:2]]
+    assert [response.get("id") for response in responses[:-1]] == ids
+    assert responses[-1]["error"]["code"] == -32700
+
+
+def test_dispatch_stream_malformed_partway() -> None:
+    chunks = list(
+        dispatch_stream(
+            BytesIO(b'[{"jsonrpc": "2.0", "method": "ping", "id": 1}, {"jsonrpc"'),
+            {"ping": ping},
+        )
+    )
+    assert chunks[:3] == [b"[", b'{"jsonrpc":"2.0","result":"pong","id":1}', b","]
+    assert chunks[3].startswith(b'{"jsonrpc":"2.0","error":{"code":-32700')
+    assert chunks[4:] == [b"]"]
+
+
+def test_dispatcher_dispatch() -> None:
+    assert (
+        Dispatcher({"ping": ping}).dispatch(
+            '{"jsonrpc": "2.0", "method": "ping", "id": 1}'
+        )
+        == '{"jsonrpc": "2.0", "result": "pong", "id": 1}'
+    )
+
+
+def test_dispatcher_batch() -> None:
+    assert Dispatcher({"ping": ping}).dispatch_to_serializable(
+        '[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+        '{"jsonrpc": "2.0", "method": "ping"}, '
+        '{"jsonrpc": "2.0", "method": "nope", "id": 2}]'
+    ) == [
+        {"jsonrpc": "2.0", "result": "pong", "id": 1},
+        {
+            "jsonrpc": "2.0",
+            "error": {"code": -32601, "message": "Method not found", "data": "nope"},
+            "id": 2,
+        },
+    ]
+
+
+def test_dispatcher_notifications() -> None:
+    dispatcher = Dispatcher({"ping": ping})
+    assert dispatcher.dispatch('{"jsonrpc": "2.0", "method": "ping"}') == ""
+    assert dispatcher.dispatch('[{"jsonrpc": "2.0", "method": "ping"}]') == ""
+
+
+def test_dispatcher_context_and_params() -> None:
+    def add(context: int, first: int, second: int) -> Result:
+        return Success(context + first + second)
+
+    dispatcher = Dispatcher({"add": add}, context=100)
+    assert dispatcher.dispatch_to_serializable(
+        '{"jsonrpc": "2.0", "method": "add", "params": [1, 2], "id": 1}'
+    ) == {"jsonrpc": "2.0", "result": 103, "id": 1}
+    assert dispatcher.dispatch_to_serializable(
+        '{"jsonrpc": "2.0", "method": "add", "params": [1], "id": 1}'
+    ) == {
+        "jsonrpc": "2.0",
+        "error": {
+            "code": -32602,
+            "message": "Invalid params",
+            "data": "missing a required argument: 'second'",
+        },
+        "id": 1,
+    }
+
+
+def test_dispatcher_compiles_once() -> None:
+    dispatcher = Dispatcher({"ping": ping})
+    dispatcher.dispatch('{"jsonrpc": "2.0", "method": "ping", "id": 1}')
+    entry = dispatcher.table["ping"]
+    dispatcher.dispatch('{"jsonrpc": "2.0", "method": "ping", "id": 2}')
+    assert dispatcher.table["ping"] is entry
+
+
+def test_dispatcher_method_replaced() -> None:
+    methods = {"ping": ping}
+    dispatcher = Dispatcher(methods)
+    dispatcher.dispatch('{"jsonrpc": "2.0", "method": "ping", "id": 1}')
+    methods["ping"] = lambda: Success("replaced")
+    assert (
+        dispatcher.dispatch('{"jsonrpc": "2.0", "method": "ping", "id": 1}')
+        == '{"jsonrpc": "2.0", "result": "replaced", "id": 1}'
+    )
+
+
+def test_dispatcher_method_options() -> None:
+    calls: List[None] = []
+    cache = ResultCache()
+
+    @method(name="main_cached", cache=cache)
+    def cached() -> Result:
+        calls.append(None)
+        return Success("cached")
+
+    dispatcher = Dispatcher({"cached": cached})
+    for _ in range(3):
+        dispatcher.dispatch('{"jsonrpc": "2.0", "method": "cached", "id": 1}')
+    assert len(calls) == 1
+
+
+def test_dispatcher_parse_error() -> None:
+    assert Dispatcher({"ping": ping}).dispatch_to_serializable("{") == {
+        "jsonrpc": "2.0",
+        "error": {
+            "code": -32700,
+            "message": "Parse error",
+            "data": "Expecting property name enclosed in double quotes: line 1 column "
+            "2 (char 1)",
+        },
+        "id": None,
+    }
+
+
+def test_dispatcher_server_error() -> None:
+    response = Dispatcher({"ping": ping}, validator=identity).dispatch_to_response("1")
+    assert response is not None and not isinstance(response, list)
+    assert response._error.code == -32000  # pylint: disable=protected-access
+
+
+def test_dispatcher_max_workers() -> None:
+    assert Dispatcher({"ping": ping}, max_workers=2).dispatch_to_serializable(
+        '[{"jsonrpc": "2.0", "method": "ping", "id": 1}, '
+        '{"jsonrpc": "2.0", "method": "ping", "id": 2}]'
+    ) == [
+        {"jsonrpc": "2.0", "result": "pong", "id": 1},
+        {"jsonrpc": "2.0", "result": "pong", "id": 2},
+    ]
+
+
+def test_get_dispatcher_default() -> None:
+    settings: Any = {
+        "context": NOCONTEXT,
+        "deserializer": default_deserializer,
+        "validator": default_validator,
+        "executor": None,
+        "max_workers": None,
+        "timing_hook": None,
+        "metrics": None,
+        "tracer": None,
+        "trace_context_field": None,
+    }
+    assert get_dispatcher(None, **settings) is default_dispatcher
+    assert get_dispatcher({"ping": ping}, **settings) is not default_dispatcher
+
+
+Stage = Tuple[str, Optional[str], Optional[int]]
+
+
+def recorder(stages: List[Stage]) -> Any:
+    def hook(
+        stage: str, seconds: float, name: Optional[str], code: Optional[int]
+    ) -> None:
+        assert seconds >= 0
+        stages.append((stage, name, code))
+
+    return hook
+
+
+def test_dispatch_timing_hook() -> None:
+    stages: List[Stage] = []
+    assert dispatch_to_json(REQUEST, {"ping": ping}, timing_hook=recorder(stages))
+    assert stages == [
+        ("deserialize", None, None),
+        ("validate", None, None),
+        ("get_method", "ping", None),
+        ("validate_args", "ping", None),
+        ("call", "ping", None),
+        ("serialize", None, None),
+    ]
+
+
+def test_dispatch_timing_hook_errors() -> None:
+    stages: List[Stage] = []
+    hook = recorder(stages)
+    dispatch_to_bytes("{", {"ping": ping}, timing_hook=hook)
+    dispatch_to_bytes('{"jsonrpc": "2.0"}', {"ping": ping}, timing_hook=hook)
+    dispatch_to_bytes(
+        '[{"jsonrpc": "2.0", "method": "foo", "id": 1}, '
+        '{"jsonrpc": "2.0", "method": "ping", "params": [1], "id": 2}]',
+        {"ping": ping},
+        timing_hook=hook,
+    )
+    assert stages == [
+        ("deserialize", None, -32700),
+        ("serialize", None, None),
+        ("deserialize", None, None),
+        ("validate", None, -32600),
+        ("serialize", None, None),
+        ("deserialize", None, None),
+        ("validate", None, None),
+        ("get_method", "foo", -32601),
+        ("get_method", "ping", None),
+        ("validate_args", "ping", -32602),
+        ("serialize", None, None),
+    ]
+
+
+def test_dispatch_timing_hook_cached_method() -> None:
+    stages: List[Stage] = []
+
+    @method(name="timed_cached", cache=ResultCache())
+    def cached() -> Result:
+        return Success("pong")
+
+    dispatch_to_response(REQUEST, {"ping": cached}, timing_hook=recorder(stages))
+    assert [stage for stage, _, _ in stages] == [
+        "deserialize",
+        "validate",
+        "get_method",
+        "call",
+    ]
+
+
+def test_set_timing_hook() -> None:
+    stages: List[Stage] = []
+    set_timing_hook(recorder(stages))
+    try:
+        assert Dispatcher({"ping": ping}).dispatch(REQUEST)
+    finally:
+        set_timing_hook(None)
+    assert len(stages) == 6
+    Dispatcher({"ping": ping}).dispatch(REQUEST)
+    assert len(stages) == 6
+
+
+def test_dispatch_metrics() -> None:
+    metrics = Metrics()
+    dispatcher = Dispatcher({"ping": ping}, metrics=metrics)
+    dispatcher.dispatch(REQUEST)
+    dispatcher.dispatch('{"jsonrpc": "2.0", "method": "ping", "params": [1], "id": 1}')
+    dispatcher.dispatch('{"jsonrpc": "2.0", "method": "foo", "id": 1}')
+    snapshot = metrics.snapshot()
+    assert list(snapshot) == ["ping"]
+    assert snapshot["ping"]["requests"] == 2
+    assert snapshot["ping"]["errors"] == {-32602: 1}
+
+
+def test_dispatch_metrics_timing_hook() -> None:
+    metrics = Metrics()
+    stages: List[Stage] = []
+    dispatch_to_response(
+        '[{"jsonrpc": "2.0", "method": "ping", "id": 1},'
+        ' {"jsonrpc": "2.0", "method": "foo", "id": 2}]',
+        {"ping": ping},
+        metrics=metrics,
+        timing_hook=recorder(stages),
+    )
+    assert list(metrics.snapshot()) == ["ping"]
+    assert metrics.snapshot()["ping"]["requests"] == 1
+
+
+def test_dispatch_tracer() -> None:
+    tracer = MemoryTracer()
+    assert dispatch_to_response(REQUEST, {"ping": ping}, tracer=tracer) == Right(
+        SuccessResponse("pong", 1)
+    )
+    assert len(tracer.spans) == 1
+    span = tracer.spans[0]
+    assert span.name == "ping"
+    assert span.parent is None
+    assert span.attributes == {
+        "rpc.system": "jsonrpc",
+        "rpc.method": "ping",
+        "rpc.jsonrpc.request_id": 1,
+    }
+    assert span.ended is True
+
+
+def test_dispatch_tracer_batch() -> None:
+    tracer = MemoryTracer()
+    response = dispatch_to_response(
+        '[{"jsonrpc": "2.0", "method": "ping", "id": 1},'
+        ' {"jsonrpc": "2.0", "method": "ping", "params": [1], "id": 2},'
+        ' {"jsonrpc": "2.0", "method": "ping"}]',
+        {"ping": ping},
+        tracer=tracer,
+    )
+    assert isinstance(response, list) and len(response) == 2
+    assert len(tracer.spans) == 4
+    batch, *calls = tracer.spans
+    first, second, third = calls
+    assert batch.name == "jsonrpc.batch"
+    assert batch.attributes["rpc.jsonrpc.batch_size"] == 3
+    assert [span.parent for span in (first, second, third)] == [batch] * 3
+    assert [
+        span.attributes["rpc.jsonrpc.batch_index"] for span in tracer.spans[1:]
+    ] == [
+        0,
+        1,
+        2,
+    ]
+    assert "rpc.jsonrpc.error_code" not in first.attributes
+    assert second.attributes["rpc.jsonrpc.error_code"] == -32602
+    assert "rpc.jsonrpc.request_id" not in third.attributes
+    assert all(span.ended for span in tracer.spans)
+
+
+def test_dispatch_tracer_trace_context() -> None:
+    def echo(value: int) -> Result:
+        return Success(value)
+
+    tracer = MemoryTracer()
+    assert dispatch_to_response(
+        '{"jsonrpc": "2.0", "method": "echo",'
+        ' "params": {"value": 1, "_trace": {"traceparent": "00-1"}}, "id": 1}',
+        {"echo": echo},
+        tracer=tracer,
+        trace_context_field="_trace",
+        timing_hook=lambda *args: None,
+    ) == Right(SuccessResponse(1, 1))
+    assert tracer.spans[0].parent == {"traceparent": "00-1"}
+
+
+def test_dispatch_tracer_raises() -> None:
+    def fail() -> Result:
+        raise KeyboardInterrupt
+
+    tracer = MemoryTracer()
+    with pytest.raises(KeyboardInterrupt):
+        dispatch_to_response(
+            '{"jsonrpc": "2.0", "method": "fail", "id": 1}',
+            {"fail": fail},
+            tracer=tracer,
+        )
+    assert tracer.spans[0].ended is True
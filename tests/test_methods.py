@@ -1,7 +1,32 @@
 """Test methods.py"""
-from jsonrpcserver.methods import global_methods, method
+from inspect import signature
+from pathlib import Path
+from threading import Barrier, Thread
+from typing import Any, Callable, Dict, List, Optional
+import sys
 
-# pylint: disable=missing-function-docstring
+import pytest
+
+from oslash.either import Left  # type: ignore
+
+from jsonrpcserver.cache import ResultCache
+from jsonrpcserver.codes import ERROR_INTERNAL_ERROR
+from jsonrpcserver.result import Success
+from jsonrpcserver.methods import (
+    DEFAULT_OPTIONS,
+    LazyMethods,
+    MethodOptions,
+    compile_args_check,
+    get_args_check,
+    get_options,
+    get_plan,
+    global_methods,
+    method,
+    plans,
+    split_path,
+)
+
+# pylint: disable=missing-function-docstring,unnecessary-lambda-assignment,unused-argument
 
 
 def test_decorator() -> None:
@@ -18,3 +43,329 @@ def test_decorator_custom_name() -> None:
         pass
 
     assert callable(global_methods["new_name"])
+
+
+def test_decorator_builds_plan() -> None:
+    @method
+    def func() -> None:
+        pass
+
+    assert func in plans
+
+
+def test_decorator_cache() -> None:
+    cache = ResultCache()
+
+    @method(cache=cache)
+    def func() -> None:
+        pass
+
+    assert get_options(func) == MethodOptions(cache=cache)
+
+
+def test_decorator_inline() -> None:
+    @method(inline=True)
+    def func() -> None:
+        pass
+
+    assert get_options(func) == MethodOptions(inline=True)
+
+
+def test_decorator_executor() -> None:
+    @method(executor="process")
+    def func() -> None:
+        pass
+
+    assert get_options(func) == MethodOptions(executor="process")
+
+
+def test_decorator_unknown_executor() -> None:
+    with pytest.raises(ValueError):
+        method(executor="foo")
+
+
+def test_decorator_process_coroutine() -> None:
+    async def func() -> None:
+        pass
+
+    with pytest.raises(ValueError):
+        method(func, executor="process")
+
+
+# get_options
+
+
+def test_get_options_default() -> None:
+    assert get_options(lambda: None) is DEFAULT_OPTIONS
+
+
+# get_plan
+
+
+def test_get_plan() -> None:
+    assert get_plan(lambda: None).coroutine is False
+
+
+def test_get_plan_coroutine() -> None:
+    async def func() -> None:
+        pass
+
+    assert get_plan(func).coroutine is True
+
+
+# compile_args_check
+
+
+def positional_only(first: int, second: int = 0, /) -> None:
+    pass
+
+
+def keyword_only(*, first: int) -> None:
+    pass
+
+
+def mixed(first: int, *args: int, second: int = 0, **kwargs: int) -> None:
+    pass
+
+
+FUNCS: List[Callable[..., Any]] = [
+    lambda: None,
+    lambda x: None,
+    lambda x, y=1: None,
+    lambda *args: None,
+    lambda x, *args: None,
+    lambda **kwargs: None,
+    lambda *args, **kwargs: None,
+    positional_only,
+    keyword_only,
+    mixed,
+]
+
+ARGUMENTS: List[Any] = [
+    ([], {}),
+    ([1], {}),
+    ([1, 2], {}),
+    ([1, 2, 3], {}),
+    ([], {"x": 1}),
+    ([], {"x": 1, "y": 2}),
+    ([], {"y": 2}),
+    ([], {"first": 1}),
+    ([], {"first": 1, "second": 2}),
+    ([], {"foo": "bar"}),
+    ([1], {"x": 1}),
+    ([1], {"y": 2}),
+]
+
+
+def bind_error(
+    func: Callable[..., Any], args: List[Any], kwargs: Dict[str, Any]
+) -> Optional[str]:
+    try:
+        signature(func).bind(*args, **kwargs)
+    except TypeError as exc:
+        return str(exc)
+    return None
+
+
+def check_error(
+    func: Callable[..., Any], args: List[Any], kwargs: Dict[str, Any]
+) -> Optional[str]:
+    try:
+        compile_args_check(func)(args, kwargs)
+    except TypeError as exc:
+        return str(exc)
+    return None
+
+
+@pytest.mark.parametrize("func", FUNCS)
+@pytest.mark.parametrize("args,kwargs", ARGUMENTS)
+def test_compile_args_check_matches_bind(
+    func: Callable[..., Any], args: List[Any], kwargs: Dict[str, Any]
+) -> None:
+    assert check_error(func, args, kwargs) == bind_error(func, args, kwargs)
+
+
+# get_args_check
+
+
+def test_get_args_check_cached() -> None:
+    func = lambda: None
+    assert get_args_check(func) is get_args_check(func)
+
+
+def test_get_args_check_not_weakrefable() -> None:
+    get_args_check(len)([[]], {})
+
+
+MODULE = """
+from jsonrpcserver import Success, method
+from os import getcwd
+
+imports.append(__name__)
+
+def ping():
+    return Success("pong")
+
+def _private():
+    pass
+
+@method(name="{name}.registered")
+def registered():
+    return Success("registered")
+"""
+
+
+@pytest.fixture(name="make_module")
+def fixture_make_module(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Callable[[str], List[str]]:
+    """Write a module of methods. The returned list records the modules imported."""
+    monkeypatch.syspath_prepend(str(tmp_path))
+    imports: List[str] = []
+    monkeypatch.setattr("builtins.imports", imports, raising=False)
+
+    def make_module(name: str) -> List[str]:
+        (tmp_path / f"{name}.py").write_text(MODULE.format(name=name))
+        monkeypatch.delitem(sys.modules, name, raising=False)
+        return imports
+
+    return make_module
+
+
+def test_split_path() -> None:
+    assert split_path("a.b:c") == ("a.b", "c")
+    assert split_path("a.b.c") == ("a.b", "c")
+    with pytest.raises(ValueError):
+        split_path("c")
+
+
+def test_lazy_method(make_module: Callable[[str], List[str]]) -> None:
+    imports = make_module("lazy_one")
+    methods = LazyMethods()
+    methods.add_lazy("lazy_one:ping")
+    assert imports == []
+    assert methods["ping"]() == Success("pong")
+    assert imports == ["lazy_one"]
+    # Stored once imported
+    assert dict.get(methods, "ping") is methods["ping"]
+
+
+def test_lazy_method_name(make_module: Callable[[str], List[str]]) -> None:
+    make_module("lazy_two")
+    methods = LazyMethods()
+    methods.add_lazy("lazy_two.ping", name="other")
+    assert callable(methods["other"])
+    with pytest.raises(KeyError):
+        methods["ping"]  # pylint: disable=pointless-statement
+
+
+def test_lazy_method_builds_plan(make_module: Callable[[str], List[str]]) -> None:
+    make_module("lazy_plan")
+    methods = LazyMethods()
+    methods.add_lazy("lazy_plan:ping")
+    assert methods["ping"] in plans
+
+
+@pytest.mark.parametrize("path", ["no_such_module:ping", "jsonrpcserver:no_such"])
+def test_lazy_method_import_error(path: str) -> None:
+    methods = LazyMethods()
+    methods.add_lazy(path, name="ping")
+    result = methods["ping"]()
+    assert isinstance(result, Left)
+    error = result._error  # pylint: disable=protected-access
+    assert error.code == ERROR_INTERNAL_ERROR
+    assert "ping" in methods
+
+
+def test_lazy_method_import_error_not_retried(
+    make_module: Callable[[str], List[str]], tmp_path: Path
+) -> None:
+    imports = make_module("lazy_broken")
+    (tmp_path / "lazy_broken.py").write_text(
+        "imports.append(__name__)\nraise RuntimeError('Broken')\n"
+    )
+    methods = LazyMethods()
+    methods.add_lazy("lazy_broken:ping")
+    methods.add_namespace("broken", "lazy_broken")
+    for name in ("ping", "ping", "broken.ping", "broken.other"):
+        assert isinstance(methods[name](), Left)
+    assert imports == ["lazy_broken", "lazy_broken"]  # Once for each registration
+    # Tried again, and raised, by load
+    with pytest.raises(ImportError, match="lazy_broken:ping, lazy_broken"):
+        methods.load()
+    assert len(imports) == 4
+
+
+def test_lazy_methods_contains_and_keys(
+    make_module: Callable[[str], List[str]]
+) -> None:
+    imports = make_module("lazy_keys")
+    methods = LazyMethods({"eager": lambda: None})
+    methods.add_lazy("lazy_keys:ping")
+    methods.add_namespace("keys", "lazy_keys")
+    assert "ping" in methods
+    assert "eager" in methods
+    assert "other" not in methods
+    assert list(methods.keys()) == list(methods) == ["ping", "eager"]
+    assert len(methods) == 2
+    assert imports == []
+    # Namespaces are imported to find out
+    assert "keys.ping" in methods
+    assert "keys.missing" not in methods
+    assert imports == ["lazy_keys"]
+    assert set(methods) == {"ping", "eager", "keys.ping"}
+
+
+def test_lazy_namespace(make_module: Callable[[str], List[str]]) -> None:
+    imports = make_module("lazy_three")
+    methods = LazyMethods()
+    methods.add_namespace("three", "lazy_three")
+    assert imports == []
+    assert methods["three.ping"]() == Success("pong")
+    assert imports == ["lazy_three"]
+    # Only public functions defined in the module
+    for name in ("three._private", "three.getcwd", "three.missing", "other.ping"):
+        with pytest.raises(KeyError):
+            methods[name]  # pylint: disable=pointless-statement
+
+
+def test_lazy_namespace_registered_with_decorator(
+    make_module: Callable[[str], List[str]]
+) -> None:
+    make_module("lazy_four")
+    global_methods.add_namespace("lazy_four", "lazy_four")
+    try:
+        assert global_methods["lazy_four.registered"]() == Success("registered")
+    finally:
+        del global_methods.namespaces["lazy_four"]
+
+
+def test_lazy_import_once(make_module: Callable[[str], List[str]]) -> None:
+    imports = make_module("lazy_five")
+    methods = LazyMethods()
+    methods.add_lazy("lazy_five:ping")
+    barrier = Barrier(8)
+    found = []
+
+    def call() -> None:
+        barrier.wait()
+        found.append(methods["ping"])
+
+    threads = [Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert imports == ["lazy_five"]
+    assert len(set(found)) == 1
+
+
+def test_load(make_module: Callable[[str], List[str]]) -> None:
+    imports = make_module("lazy_six")
+    make_module("lazy_seven")
+    methods = LazyMethods()
+    methods.add_lazy("lazy_six:ping")
+    methods.add_namespace("seven", "lazy_seven")
+    methods.load()
+    assert imports == ["lazy_six", "lazy_seven"]
+    assert set(dict(methods)) == {"ping", "seven.ping", "seven.registered"}
@@ -0,0 +1,170 @@
+"""Test metrics.py"""
+from pathlib import Path
+from threading import Thread
+from typing import List
+from unittest.mock import patch
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from jsonrpcserver.metrics import Metrics, escape
+from jsonrpcserver.request import Request
+from jsonrpcserver.result import Error, Result, Success
+
+# pylint: disable=missing-function-docstring
+
+REQUEST = Request("ping", [], 1)
+
+
+def success(_: Request) -> Result:
+    return Success("pong")
+
+
+def error(_: Request) -> Result:
+    return Error(-32602, "Invalid params")
+
+
+def test_observe() -> None:
+    metrics = Metrics(buckets=[0.5, 1.0])
+    assert metrics.observe("ping", success, REQUEST) == Success("pong")
+    metrics.observe("ping", error, REQUEST)
+    metrics.observe("ping", error, REQUEST)
+    snapshot = metrics.snapshot()["ping"]
+    assert snapshot["requests"] == 3
+    assert snapshot["errors"] == {-32602: 2}
+    assert snapshot["in_flight"] == 0
+    assert snapshot["latency"]["buckets"] == {0.5: 3, 1.0: 3, float("inf"): 3}
+    assert snapshot["latency"]["count"] == 3
+    assert snapshot["latency"]["sum"] >= 0
+
+
+def test_observe_latency_buckets() -> None:
+    metrics = Metrics(buckets=[0.5, 1.0])
+    stats = metrics.start("ping")
+    metrics.finish(stats, 0.5, Success())
+    stats = metrics.start("ping")
+    metrics.finish(stats, 0.75, Success())
+    stats = metrics.start("ping")
+    metrics.finish(stats, 2.0, Success())
+    latency = metrics.snapshot()["ping"]["latency"]
+    assert latency["buckets"] == {0.5: 1, 1.0: 2, float("inf"): 3}
+    assert latency["sum"] == 3.25
+
+
+def test_observe_in_flight() -> None:
+    metrics = Metrics()
+    in_flight: List[int] = []
+
+    def call(_: Request) -> Result:
+        in_flight.append(metrics.snapshot()["ping"]["in_flight"])
+        return Success()
+
+    metrics.observe("ping", call, REQUEST)
+    assert in_flight == [1]
+    assert metrics.snapshot()["ping"]["in_flight"] == 0
+
+
+def test_observe_exception() -> None:
+    metrics = Metrics()
+
+    def call(_: Request) -> Result:
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        metrics.observe("ping", call, REQUEST)
+    assert metrics.snapshot()["ping"]["in_flight"] == 0
+    assert metrics.snapshot()["ping"]["requests"] == 0
+
+
+def test_observe_async() -> None:
+    metrics = Metrics()
+
+    async def call(_: Request) -> Result:
+        await asyncio.sleep(0)
+        return Success()
+
+    async def main() -> None:
+        await asyncio.gather(
+            *[metrics.observe_async("ping", call, REQUEST) for _ in range(3)]
+        )
+
+    asyncio.run(main())
+    assert metrics.snapshot()["ping"]["requests"] == 3
+
+
+def test_threads() -> None:
+    metrics = Metrics()
+
+    def observe() -> None:
+        for _ in range(1000):
+            metrics.observe("ping", success, REQUEST)
+
+    threads = [Thread(target=observe) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(metrics.shards) == 4
+    assert metrics.snapshot()["ping"]["requests"] == 4000
+
+
+def test_share(tmp_path: Path) -> None:
+    metrics, other = Metrics(buckets=[0.5, 1.0]), Metrics(buckets=[0.5, 1.0])
+    metrics.directory = other.directory = str(tmp_path)
+    metrics.observe("ping", success, REQUEST)
+    metrics.start("ping")  # In flight
+    other.observe("ping", error, REQUEST)
+    other.observe("ping", error, REQUEST)
+    other.start("ping")  # In flight, but in a process that's exited
+    with patch("os.getpid", return_value=2**22 + 1):  # Not a valid pid
+        other.write()
+    snapshot = metrics.snapshot()["ping"]
+    assert snapshot["requests"] == 3
+    assert snapshot["errors"] == {-32602: 2}
+    assert snapshot["in_flight"] == 1
+    assert snapshot["latency"]["count"] == 3
+    assert set(os.listdir(tmp_path)) == {f"{os.getpid()}.json", f"{2**22 + 1}.json"}
+
+
+def test_share_written(tmp_path: Path) -> None:
+    metrics = Metrics()
+    metrics.share(str(tmp_path), interval=0.01)
+    metrics.observe("ping", success, REQUEST)
+    time.sleep(0.1)
+    metrics.directory = None  # Stop writing
+    with open(tmp_path / f"{os.getpid()}.json", encoding="utf-8") as file:
+        assert json.load(file)["ping"]["requests"] == 1
+
+
+def test_snapshot_empty() -> None:
+    assert not Metrics().snapshot()
+
+
+def test_escape() -> None:
+    assert escape('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
+
+
+def test_to_prometheus() -> None:
+    metrics = Metrics(buckets=[1.0])
+    metrics.finish(metrics.start("ping"), 0.25, Success())
+    metrics.finish(metrics.start("ping"), 0.25, Error(-32602, "Invalid params"))
+    assert metrics.to_prometheus() == (
+        "# HELP jsonrpc_requests_total Requests to each method.\n"
+        "# TYPE jsonrpc_requests_total counter\n"
+        'jsonrpc_requests_total{method="ping"} 2\n'
+        "# HELP jsonrpc_errors_total Error responses, by method and code.\n"
+        "# TYPE jsonrpc_errors_total counter\n"
+        'jsonrpc_errors_total{method="ping",code="-32602"} 1\n'
+        "# HELP jsonrpc_in_flight Calls to each method in progress.\n"
+        "# TYPE jsonrpc_in_flight gauge\n"
+        'jsonrpc_in_flight{method="ping"} 0\n'
+        "# HELP jsonrpc_request_duration_seconds Time taken by calls to each method.\n"
+        "# TYPE jsonrpc_request_duration_seconds histogram\n"
+        'jsonrpc_request_duration_seconds_bucket{method="ping",le="1.0"} 2\n'
+        'jsonrpc_request_duration_seconds_bucket{method="ping",le="+Inf"} 2\n'
+        'jsonrpc_request_duration_seconds_sum{method="ping"} 0.5\n'
+        'jsonrpc_request_duration_seconds_count{method="ping"} 2\n'
+    )
@@ -5,11 +5,13 @@ from oslash.either import Left, Right  # type: ignore
 
 from jsonrpcserver.response import (
     ErrorResponse,
+    ErrorResponseLeft,
     InvalidRequestResponse,
     MethodNotFoundResponse,
     ParseErrorResponse,
     ServerErrorResponse,
     SuccessResponse,
+    SuccessResponseRight,
     to_serializable,
 )
 
@@ -32,6 +34,24 @@ def test_ErrorResponse() -> None:
     assert response.id is sentinel.id
 
 
+def test_SuccessResponseRight() -> None:
+    response = SuccessResponseRight("foo", 1)
+    assert isinstance(response, Right)
+    assert isinstance(response, SuccessResponse)
+    assert response == Right(SuccessResponse("foo", 1))
+    assert response != Right(SuccessResponse("foo", 2))
+
+
+def test_ErrorResponseLeft() -> None:
+    response = ErrorResponseLeft(1, "foo", "bar", 1)
+    assert isinstance(response, Left)
+    assert isinstance(response, ErrorResponse)
+    assert response == Left(ErrorResponse(1, "foo", "bar", 1))
+    assert to_serializable(response) == to_serializable(
+        Left(ErrorResponse(1, "foo", "bar", 1))
+    )
+
+
 def test_ParseErrorResponse() -> None:
     response = ParseErrorResponse(sentinel.data)
     assert response.code == -32700
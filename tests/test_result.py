@@ -1,14 +1,18 @@
 """Test result.py"""
 from unittest.mock import sentinel
+import pickle
 
 from oslash.either import Left, Right  # type: ignore
 
 from jsonrpcserver.result import (
     Error,
     ErrorResult,
+    InvalidParams,
     InvalidParamsResult,
     Success,
     SuccessResult,
+    from_dict,
+    to_dict,
 )
 from jsonrpcserver.sentinels import NODATA
 
@@ -64,3 +68,60 @@ def test_Success() -> None:
 
 def test_Error() -> None:
     assert Error(1, "foo", None) == Left(ErrorResult(1, "foo", None))
+
+
+def test_Success_is_compact() -> None:
+    result = Success("foo")
+    assert result._value is result  # pylint: disable=protected-access
+    assert isinstance(result, Right)
+    assert isinstance(result, SuccessResult)
+    assert result.result == "foo"
+
+
+def test_Error_is_compact() -> None:
+    result = Error(1, "foo")
+    assert result._error is result  # pylint: disable=protected-access
+    assert isinstance(result, Left)
+    assert isinstance(result, ErrorResult)
+    assert result == Left(ErrorResult(1, "foo"))
+
+
+def test_InvalidParams() -> None:
+    assert InvalidParams("foo") == Left(InvalidParamsResult("foo"))
+
+
+def test_compact_equality() -> None:
+    assert Right(SuccessResult("foo")) == Success("foo")
+    assert Success("foo") != Success("bar")
+    assert Success("foo") != Right(SuccessResult("bar"))
+    assert Success(1) != Left(ErrorResult(1, NODATA, NODATA))  # type: ignore
+    assert Error(1, "foo") != Right(ErrorResult(1, "foo", NODATA))
+
+
+def test_compact_repr() -> None:
+    assert repr(Success("foo")) == "Right(SuccessResult('foo'))"
+    assert str(Error(1, "foo")) == f"Left({ErrorResult(1, 'foo')!r})"
+
+
+def test_compact_pickle() -> None:
+    result = Success("foo")
+    assert pickle.loads(pickle.dumps(result)) == result
+
+
+def test_to_dict_success() -> None:
+    assert to_dict(Success("foo")) == {"result": "foo"}
+
+
+def test_to_dict_error() -> None:
+    assert to_dict(Error(1, "foo", "bar")) == {
+        "error": {"code": 1, "message": "foo", "data": "bar"}
+    }
+
+
+def test_to_dict_error_no_data() -> None:
+    assert to_dict(Error(1, "foo")) == {"error": {"code": 1, "message": "foo"}}
+
+
+def test_from_dict() -> None:
+    for result in (Success("foo"), Error(1, "foo", "bar"), Error(1, "foo")):
+        assert from_dict(to_dict(result)) == result
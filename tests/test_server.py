@@ -1,11 +1,185 @@
 """Test server.py"""
+from http.client import HTTPConnection
+from threading import Barrier, Thread
+from typing import Iterator
 from unittest.mock import Mock, patch
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import json
+import socket
 
-from jsonrpcserver.server import serve
+import pytest
+
+from jsonrpcserver.methods import method
+from jsonrpcserver.metrics import Metrics
+from jsonrpcserver.result import Result, Success
+from jsonrpcserver.server import Server, serve
 
 # pylint: disable=missing-function-docstring
 
 
-@patch("jsonrpcserver.server.HTTPServer")
+@patch("jsonrpcserver.server.Server")
 def test_serve(*_: Mock) -> None:
     serve()
+
+
+@method(name="server_ping")
+def ping() -> Result:
+    return Success("pong")
+
+
+barrier = Barrier(2, timeout=5)
+
+
+@method(name="server_wait")
+def wait() -> Result:
+    barrier.wait()
+    return Success("done")
+
+
+@pytest.fixture(name="server")
+def fixture_server() -> Iterator[Server]:
+    server = Server(
+        ("127.0.0.1", 0),
+        metrics=Metrics(),
+        max_request_size=1000,
+        keep_alive_timeout=0.5,
+    )
+    thread = Thread(target=server.serve_forever, args=(0.01,))
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_metrics(server: Server) -> None:
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    body = json.dumps({"jsonrpc": "2.0", "method": "server_ping", "id": 1}).encode()
+    with urlopen(url, body) as response:
+        assert json.loads(response.read())["result"] == "pong"
+    with urlopen(url + "/metrics") as response:
+        assert response.headers["Content-Type"].startswith("text/plain")
+        assert 'jsonrpc_requests_total{method="server_ping"} 1' in (
+            response.read().decode()
+        )
+    with pytest.raises(HTTPError):
+        urlopen(url + "/other")  # pylint: disable=consider-using-with
+
+
+REQUEST = json.dumps({"jsonrpc": "2.0", "method": "server_ping", "id": 1})
+
+
+@method(name="server_unusual")
+def unusual() -> Result:
+    return Success({1: "a", "big": 2**70})
+
+
+def test_result_only_stdlib_serializes(server: Server) -> None:
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    body = json.dumps({"jsonrpc": "2.0", "method": "server_unusual", "id": 1})
+    with urlopen(url, body.encode()) as response:
+        assert json.loads(response.read())["result"] == {"1": "a", "big": 2**70}
+
+
+def test_keep_alive(server: Server) -> None:
+    connection = HTTPConnection("127.0.0.1", server.server_address[1])
+    connection.request("POST", "/", REQUEST)
+    response = connection.getresponse()
+    assert response.version == 11
+    assert response.status == 200
+    assert response.headers["Content-Type"] == "application/json"
+    assert json.loads(response.read())["result"] == "pong"
+    sock = connection.sock
+    connection.request("POST", "/", REQUEST)
+    assert json.loads(connection.getresponse().read())["result"] == "pong"
+    # The same connection was used for both requests
+    assert connection.sock is sock
+    connection.close()
+
+
+def test_notification(server: Server) -> None:
+    connection = HTTPConnection("127.0.0.1", server.server_address[1])
+    connection.request("POST", "/", json.dumps({"jsonrpc": "2.0", "method": "ping"}))
+    response = connection.getresponse()
+    assert response.status == 204
+    assert response.read() == b""
+    connection.request("POST", "/", REQUEST)
+    assert connection.getresponse().status == 200
+    connection.close()
+
+
+def test_request_too_large(server: Server) -> None:
+    connection = HTTPConnection("127.0.0.1", server.server_address[1])
+    connection.request("POST", "/", " " * 1001)
+    assert connection.getresponse().status == 413
+    connection.close()
+
+
+def test_request_too_large_expect_100(server: Server) -> None:
+    with socket.create_connection(server.server_address) as sock:
+        sock.sendall(
+            b"POST / HTTP/1.1\r\nHost: x\r\nContent-Length: 1001\r\n"
+            b"Expect: 100-continue\r\n\r\n"
+        )
+        assert sock.recv(1000).startswith(b"HTTP/1.1 413")
+
+
+@pytest.mark.parametrize(
+    "headers,status",
+    [
+        (b"", b"411"),
+        (b"Transfer-Encoding: chunked\r\n", b"411"),
+        (b"Content-Length: foo\r\n", b"400"),
+        (b"Content-Length: -1\r\n", b"400"),
+    ],
+)
+def test_invalid_length(server: Server, headers: bytes, status: bytes) -> None:
+    with socket.create_connection(server.server_address) as sock:
+        sock.sendall(b"POST / HTTP/1.1\r\nHost: x\r\n" + headers + b"\r\n")
+        assert sock.recv(1000).startswith(b"HTTP/1.1 " + status)
+
+
+def test_concurrent_connections(server: Server) -> None:
+    """Two calls that wait for each other both finish, so they're handled at once."""
+    body = json.dumps({"jsonrpc": "2.0", "method": "server_wait", "id": 1})
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    results = []
+
+    def request() -> None:
+        with urlopen(url, body.encode()) as response:
+            results.append(json.loads(response.read())["result"])
+
+    threads = [Thread(target=request) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["done", "done"]
+
+
+def test_keep_alive_timeout(server: Server) -> None:
+    with socket.create_connection(server.server_address) as sock:
+        sock.settimeout(5)
+        # The server closes the idle connection
+        assert sock.recv(1000) == b""
+
+
+def test_idle_connections_dont_take_the_pool() -> None:
+    """More idle keep-alive connections than the pool's threads don't stop another
+    connection being answered.
+    """
+    server = Server(("127.0.0.1", 0), max_workers=2, keep_alive_timeout=5)
+    thread = Thread(target=server.serve_forever, args=(0.01,))
+    thread.start()
+    idle = [socket.create_connection(server.server_address) for _ in range(4)]
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urlopen(url, REQUEST.encode(), timeout=2) as response:
+            assert json.loads(response.read())["result"] == "pong"
+    finally:
+        for sock in idle:
+            sock.close()
+        server.shutdown()
+        server.server_close()
+        thread.join()
@@ -0,0 +1,240 @@
+"""Test socket_server.py"""
+from io import BytesIO
+from threading import Thread
+from typing import Any, Dict, Iterator, List, Optional
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import time
+
+import pytest
+
+from jsonrpcserver.methods import method
+from jsonrpcserver.result import Result, Success
+from jsonrpcserver.socket_server import (
+    LENGTH_PREFIXED,
+    NDJSON,
+    Address,
+    Framing,
+    FramingError,
+    make_server,
+    start_stream_server,
+)
+
+# pylint: disable=missing-function-docstring
+
+
+@method(name="socket_sleep")
+def sleep(seconds: float) -> Result:
+    time.sleep(seconds)
+    return Success(seconds)
+
+
+@method(name="socket_async_sleep")
+async def async_sleep(seconds: float) -> Result:
+    await asyncio.sleep(seconds)
+    return Success(seconds)
+
+
+@method(name="socket_large")
+def large(size: int) -> Result:
+    return Success("x" * size)
+
+
+def call(name: str, seconds: float, id_: Optional[int] = None) -> bytes:
+    request: Dict[str, Any] = {"jsonrpc": "2.0", "method": name, "params": [seconds]}
+    if id_ is not None:
+        request["id"] = id_
+    return json.dumps(request).encode()
+
+
+def test_ndjson_read() -> None:
+    stream = BytesIO(b'{"a": 1}\n\n  \n{"b": 2}')
+    assert NDJSON.read(stream, 100) == b'{"a": 1}\n'
+    assert NDJSON.read(stream, 100) == b'{"b": 2}'
+    assert NDJSON.read(stream, 100) is None
+
+
+def test_ndjson_read_too_large() -> None:
+    assert NDJSON.read(BytesIO(b"1234\n"), 4) == b"1234\n"
+    with pytest.raises(FramingError):
+        NDJSON.read(BytesIO(b"12345\n"), 4)
+
+
+def test_ndjson_frame() -> None:
+    assert NDJSON.frame(b"{}") == b"{}\n"
+
+
+def test_length_prefixed() -> None:
+    stream = BytesIO(LENGTH_PREFIXED.frame(b"{}") + LENGTH_PREFIXED.frame(b"[1]"))
+    assert LENGTH_PREFIXED.frame(b"{}") == b"\x00\x00\x00\x02{}"
+    assert LENGTH_PREFIXED.read(stream, 100) == b"{}"
+    assert LENGTH_PREFIXED.read(stream, 100) == b"[1]"
+    assert LENGTH_PREFIXED.read(stream, 100) is None
+
+
+@pytest.mark.parametrize(
+    "data", [b"\x00\x00", b"\x00\x00\x00\x05{}", b"\x00\x00\x00\x65{}"]
+)
+def test_length_prefixed_invalid(data: bytes) -> None:
+    with pytest.raises(FramingError):
+        LENGTH_PREFIXED.read(BytesIO(data), 100)
+
+
+def stream_reader(data: bytes, limit: int = 100) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader(limit=limit)
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+@pytest.mark.asyncio
+async def test_ndjson_read_async() -> None:
+    reader = stream_reader(b'{"a": 1}\n\n{"b": 2}')
+    assert await NDJSON.read_async(reader, 100) == b'{"a": 1}\n'
+    assert await NDJSON.read_async(reader, 100) == b'{"b": 2}'
+    assert await NDJSON.read_async(reader, 100) is None
+
+
+@pytest.mark.asyncio
+async def test_ndjson_read_async_too_large() -> None:
+    with pytest.raises(FramingError):
+        await NDJSON.read_async(stream_reader(b"12345\n", 4), 4)
+
+
+@pytest.mark.asyncio
+async def test_length_prefixed_read_async() -> None:
+    reader = stream_reader(LENGTH_PREFIXED.frame(b"{}"))
+    assert await LENGTH_PREFIXED.read_async(reader, 100) == b"{}"
+    assert await LENGTH_PREFIXED.read_async(reader, 100) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "data", [b"\x00\x00", b"\x00\x00\x00\x05{}", b"\x00\x00\x00\x65{}"]
+)
+async def test_length_prefixed_read_async_invalid(data: bytes) -> None:
+    with pytest.raises(FramingError):
+        await LENGTH_PREFIXED.read_async(stream_reader(data), 100)
+
+
+@pytest.fixture(name="unix_path")
+def fixture_unix_path() -> Iterator[str]:
+    with tempfile.TemporaryDirectory() as directory:
+        yield os.path.join(directory, "jsonrpc.sock")
+
+
+def connect(address: Any) -> socket.socket:
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX)
+        sock.connect(address)
+        return sock
+    return socket.create_connection(address)
+
+
+def exchange(address: Any, framing: Framing, name: str) -> List[Any]:
+    """Send a slow request, a notification and a fast request, and give the ids of
+    the responses in the order they're received.
+    """
+    with connect(address) as sock:
+        sock.sendall(
+            framing.frame(call(name, 0.2, 1))
+            + framing.frame(call(name, 0))
+            + framing.frame(call(name, 0, 2))
+        )
+        sock.shutdown(socket.SHUT_WR)
+        stream = sock.makefile("rb")
+        ids = []
+        while (response := framing.read(stream, 1000)) is not None:
+            ids.append(json.loads(response)["id"])
+        return ids
+
+
+@pytest.mark.parametrize("framing", [NDJSON, LENGTH_PREFIXED])
+@pytest.mark.parametrize("unix", [False, True])
+def test_threaded(framing: Framing, unix: bool, unix_path: str) -> None:
+    address: Address = unix_path if unix else ("127.0.0.1", 0)
+    with make_server(address, framing=framing) as server:
+        thread = Thread(target=server.serve_forever, args=(0.01,))
+        thread.start()
+        try:
+            # The fast request is answered first
+            assert exchange(server.server_address, framing, "socket_sleep") == [2, 1]
+        finally:
+            server.shutdown()
+            thread.join()
+    assert not os.path.exists(unix_path)
+
+
+def test_threaded_too_large() -> None:
+    with make_server(("127.0.0.1", 0), max_message_size=10) as server:
+        thread = Thread(target=server.serve_forever, args=(0.01,))
+        thread.start()
+        try:
+            with connect(server.server_address) as sock:
+                sock.sendall(call("socket_sleep", 0, 1) + b"\n")
+                assert sock.recv(1000) == b""
+        finally:
+            server.shutdown()
+            thread.join()
+
+
+def test_threaded_max_concurrency() -> None:
+    with make_server(("127.0.0.1", 0), max_workers=4) as server:
+        assert server.max_concurrency == 2
+
+
+def test_threaded_send_timeout() -> None:
+    with make_server(("127.0.0.1", 0), max_workers=1, send_timeout=0.2) as server:
+        thread = Thread(target=server.serve_forever, args=(0.01,))
+        thread.start()
+        try:
+            with connect(server.server_address) as slow:
+                # Larger responses than the socket buffers hold, that aren't read
+                slow.sendall(b"".join([call("socket_large", 1000000, 1) + b"\n"] * 20))
+                time.sleep(0.5)
+                # The other connections are still answered, by the one thread
+                ids = exchange(server.server_address, NDJSON, "socket_sleep")
+                assert sorted(ids) == [1, 2]
+                # And the slow one is disconnected
+                slow.settimeout(5)
+                while slow.recv(1000000):
+                    pass
+        finally:
+            server.shutdown()
+            thread.join()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("framing", [NDJSON, LENGTH_PREFIXED])
+@pytest.mark.parametrize("unix", [False, True])
+async def test_async(framing: Framing, unix: bool, unix_path: str) -> None:
+    server = await start_stream_server(
+        unix_path if unix else ("127.0.0.1", 0), framing=framing
+    )
+    address = server.sockets[0].getsockname()  # type: ignore
+    try:
+        ids = await asyncio.get_running_loop().run_in_executor(
+            None, exchange, address, framing, "socket_async_sleep"
+        )
+        assert ids == [2, 1]
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_async_too_large() -> None:
+    server = await start_stream_server(("127.0.0.1", 0), max_message_size=10)
+    reader, writer = await asyncio.open_connection(
+        *server.sockets[0].getsockname()  # type: ignore
+    )
+    try:
+        writer.write(call("socket_async_sleep", 0, 1) + b"\n")
+        assert await reader.read() == b""
+    finally:
+        writer.close()
+        server.close()
+        await server.wait_closed()
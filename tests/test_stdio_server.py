@@ -0,0 +1,143 @@
+"""Test stdio_server.py"""
+from io import BytesIO
+from typing import List
+import asyncio
+import json
+import os
+
+import pytest
+
+from jsonrpcserver.methods import method
+from jsonrpcserver.result import Result, Success
+from jsonrpcserver.socket_server import (
+    CONTENT_LENGTH,
+    NDJSON,
+    Framing,
+    FramingError,
+)
+from jsonrpcserver.stdio_server import serve_stdio_async
+
+# pylint: disable=missing-function-docstring
+
+
+@method(name="stdio_sleep")
+async def sleep(seconds: float) -> Result:
+    await asyncio.sleep(seconds)
+    return Success(seconds)
+
+
+def call(seconds: float, id_: int) -> bytes:
+    return json.dumps(
+        {"jsonrpc": "2.0", "method": "stdio_sleep", "params": [seconds], "id": id_}
+    ).encode()
+
+
+CONTENT_LENGTH_MESSAGES = (
+    b"Content-Length: 2\r\n\r\n{}"
+    b"Content-Type: application/vscode-jsonrpc; charset=utf-8\r\n"
+    b"content-length: 3\r\n\r\n[1]"
+    b"Content-Length: 1\n\n2"  # Bare newlines
+)
+
+CONTENT_LENGTH_INVALID = [
+    b"Content-Length: 2\r\n",
+    b"Content-Length: 2",
+    b"Content-Length: 5\r\n\r\n{}",
+    b"Content-Length: 101\r\n\r\n{}",
+    b"Content-Length: x\r\n\r\n{}",
+    b"Content-Type: foo\r\n\r\n{}",
+    b"Foo: " + b"a" * 5000 + b"\r\n\r\n",
+    b"Foo: a\r\n" * 1000 + b"Content-Length: 2\r\n\r\n{}",
+]
+
+
+def test_content_length_read() -> None:
+    stream = BytesIO(CONTENT_LENGTH_MESSAGES)
+    assert CONTENT_LENGTH.read(stream, 100) == b"{}"
+    assert CONTENT_LENGTH.read(stream, 100) == b"[1]"
+    assert CONTENT_LENGTH.read(stream, 100) == b"2"
+    assert CONTENT_LENGTH.read(stream, 100) is None
+
+
+@pytest.mark.parametrize("data", CONTENT_LENGTH_INVALID)
+def test_content_length_read_invalid(data: bytes) -> None:
+    with pytest.raises(FramingError):
+        CONTENT_LENGTH.read(BytesIO(data), 100)
+
+
+def test_content_length_frame() -> None:
+    assert CONTENT_LENGTH.frame(b"{}") == b"Content-Length: 2\r\n\r\n{}"
+
+
+@pytest.mark.asyncio
+async def test_content_length_read_async() -> None:
+    reader = asyncio.StreamReader()
+    reader.feed_data(CONTENT_LENGTH_MESSAGES)
+    reader.feed_eof()
+    assert await CONTENT_LENGTH.read_async(reader, 100) == b"{}"
+    assert await CONTENT_LENGTH.read_async(reader, 100) == b"[1]"
+    assert await CONTENT_LENGTH.read_async(reader, 100) == b"2"
+    assert await CONTENT_LENGTH.read_async(reader, 100) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data", CONTENT_LENGTH_INVALID)
+async def test_content_length_read_async_invalid(data: bytes) -> None:
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    with pytest.raises(FramingError):
+        await CONTENT_LENGTH.read_async(reader, 100)
+
+
+async def serve(requests: bytes, framing: Framing = CONTENT_LENGTH) -> List[int]:
+    """Serve the requests from a pipe, and give the ids of the responses, in the
+    order they were written.
+    """
+    stdin_read, stdin_write = os.pipe()
+    stdout_read, stdout_write = os.pipe()
+    with open(stdin_read, "rb", buffering=0) as stdin, open(
+        stdout_write, "wb", buffering=0
+    ) as stdout, open(stdout_read, "rb") as responses:
+        os.write(stdin_write, requests)
+        os.close(stdin_write)
+        await serve_stdio_async(framing=framing, stdin=stdin, stdout=stdout)
+        ids = []
+        while (response := framing.read(responses, 1000)) is not None:
+            ids.append(json.loads(response)["id"])
+        return ids
+
+
+@pytest.mark.asyncio
+async def test_serve_stdio() -> None:
+    """Requests are handled concurrently, and answered as they finish."""
+    requests = b"".join(
+        CONTENT_LENGTH.frame(call(seconds, id_))
+        for seconds, id_ in ((0.1, 1), (0, 2), (0.05, 3))
+    )
+    assert await serve(requests) == [2, 3, 1]
+
+
+@pytest.mark.asyncio
+async def test_serve_stdio_ndjson() -> None:
+    assert await serve(call(0, 1) + b"\n", NDJSON) == [1]
+
+
+@pytest.mark.asyncio
+async def test_serve_stdio_invalid() -> None:
+    """The responses to requests before an invalid message are still written."""
+    assert await serve(CONTENT_LENGTH.frame(call(0.05, 1)) + b"foo\r\n\r\n") == [1]
+
+
+@pytest.mark.asyncio
+async def test_serve_stdio_stdout_closed() -> None:
+    """The other process closing its end of stdout first isn't an error."""
+    stdin_read, stdin_write = os.pipe()
+    stdout_read, stdout_write = os.pipe()
+    os.close(stdout_read)
+    with open(stdin_read, "rb", buffering=0) as stdin, open(
+        stdout_write, "wb", buffering=0
+    ) as stdout:
+        os.write(stdin_write, CONTENT_LENGTH.frame(call(0, 1)))
+        os.close(stdin_write)
+        await serve_stdio_async(stdin=stdin, stdout=stdout)
@@ -0,0 +1,204 @@
+"""Test streaming.py"""
+from io import BytesIO
+from json import JSONDecodeError, loads
+from typing import Any, AsyncIterator, Callable, List
+from unittest.mock import patch
+import asyncio
+
+import pytest
+
+from jsonrpcserver import streaming
+from jsonrpcserver.streaming import StreamParser, async_parse_stream, parse_stream
+
+# pylint: disable=missing-function-docstring
+
+
+def decode_error(func: Callable[..., Any], *args: Any) -> JSONDecodeError:
+    """The JSONDecodeError raised by the function."""
+    try:
+        func(*args)
+    except JSONDecodeError as exc:
+        return exc
+    raise AssertionError("JSONDecodeError not raised")
+
+
+def feed_all(body: bytes, chunk_size: int) -> List[Any]:
+    parser = StreamParser()
+    values = []
+    for i in range(0, len(body), chunk_size):
+        values.extend(parser.feed(body[i : i + chunk_size]))
+    return values + parser.close()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1000])
+@pytest.mark.parametrize(
+    "body",
+    [
+        b'[{"id": 1}, {"id": 2}]',
+        b' [ 1 , 23.5e1 , true , null , "\xc3\xa9\xe2\x82\xac" , [1, [2]] ] ',
+        b"[12345678901234567890]",
+        b'{"id": 1}',
+        b"  123  ",
+    ],
+)
+def test_parser_chunk_boundaries(body: bytes, chunk_size: int) -> None:
+    expected = loads(body)
+    assert feed_all(body, chunk_size) == (
+        expected if isinstance(expected, list) else [expected]
+    )
+
+
+def test_parser_gives_values_as_they_complete() -> None:
+    parser = StreamParser()
+    assert parser.feed(b'[{"id": 1}, {"id"') == [{"id": 1}]
+    assert parser.is_batch is True
+    assert parser.feed(b": 2}") == [{"id": 2}]
+    assert not parser.feed(b"]")
+    assert not parser.close()
+
+
+def test_parser_holds_only_the_unparsed_part() -> None:
+    parser = StreamParser()
+    parser.feed(b'[{"id": 1}, {"id"')
+    assert parser.buffer == '{"id"'
+
+
+def test_parser_number_at_chunk_boundary() -> None:
+    parser = StreamParser()
+    assert not parser.feed(b"[1")
+    assert parser.feed(b"2, 3]") == [12, 3]
+
+
+def test_parser_not_batch() -> None:
+    parser = StreamParser()
+    assert not parser.feed(b'{"id": 1}')
+    assert parser.is_batch is False
+    assert parser.close() == [{"id": 1}]
+
+
+def test_parser_empty_batch() -> None:
+    parser = StreamParser()
+    assert not parser.feed(b"[ ]")
+    assert not parser.close()
+    assert parser.count == 0
+
+
+@pytest.mark.parametrize(
+    "body,message",
+    [
+        (b"", "Expecting value"),
+        (b"   ", "Expecting value"),
+        (b"[", "Expecting value"),
+        (b"[1", "Expecting ',' delimiter"),
+        (b"[1,", "Expecting value"),
+        (b"[1,]", "Expecting value"),
+        (b"[1 2]", "Expecting ',' delimiter"),
+        (b"[1] 2", "Extra data"),
+        (b"[1, {]", "Expecting property name"),
+        (b'{"id": 1} 2', "Extra data"),
+        (b'{"id": ', "Expecting value"),
+    ],
+)
+def test_parser_malformed(body: bytes, message: str) -> None:
+    with pytest.raises(JSONDecodeError, match=message):
+        feed_all(body, 1)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 1000])
+@pytest.mark.parametrize(
+    "body,values",
+    [
+        (b"[1, 2 3]", [1, 2]),
+        (b'[{"a": 1}, {"b": 2},]', [{"a": 1}, {"b": 2}]),
+        (b'[{"a": 1}] x', [{"a": 1}]),
+        (b'[{"a": 1}, {"b": 2]', [{"a": 1}]),
+        (b'[{"a": 1}, "b', [{"a": 1}]),
+    ],
+)
+def test_parser_values_before_error(
+    body: bytes, values: List[Any], chunk_size: int
+) -> None:
+    """The values before an error are given, then the error is raised."""
+    parser = StreamParser()
+    given: List[Any] = []
+    with pytest.raises(JSONDecodeError):
+        for i in range(0, len(body), chunk_size):
+            given.extend(parser.feed(body[i : i + chunk_size]))
+        given.extend(parser.close())
+    assert given == values
+
+
+def test_parser_error_raised_next_time() -> None:
+    parser = StreamParser()
+    assert parser.feed(b"[1, 2 3]") == [1, 2]
+    with pytest.raises(JSONDecodeError, match="Expecting ',' delimiter"):
+        parser.close()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+def test_parser_error_position(chunk_size: int) -> None:
+    body = b'[1,\n {"a": 1},\n  2 3]'
+    # The same as parsing the whole body in one go
+    error, expected = decode_error(feed_all, body, chunk_size), decode_error(
+        loads, body
+    )
+    assert (error.pos, error.lineno, error.colno) == (
+        expected.pos,
+        expected.lineno,
+        expected.colno,
+    )
+
+
+def test_parser_large_value_scanned_once() -> None:
+    """A value received in many chunks isn't parsed again with each chunk."""
+    parser = StreamParser()
+    with patch.object(
+        streaming.decoder, "raw_decode", wraps=streaming.decoder.raw_decode
+    ) as raw_decode:
+        assert not parser.feed(b'[{"a": "x\\"", "b": [')
+        for _ in range(100):
+            assert not parser.feed(b'{"c": "]}"}, ')
+        assert parser.feed(b"1]}]") == [{"a": 'x"', "b": [{"c": "]}"}] * 100 + [1]}]
+    # Tried in the first two chunks, then only once it's complete
+    assert raw_decode.call_count == 3
+    assert not parser.close()
+
+
+def test_parser_invalid_utf8() -> None:
+    parser = StreamParser()
+    with pytest.raises(UnicodeDecodeError):
+        parser.feed(b'["\xff"]')
+
+
+def test_parser_str() -> None:
+    parser = StreamParser()
+    assert parser.feed('["é"]') == ["é"]
+
+
+def test_parse_stream() -> None:
+    assert list(parse_stream(StreamParser(), BytesIO(b"[1, 2, 3]"), 2)) == [1, 2, 3]
+
+
+def test_parse_stream_is_lazy() -> None:
+    stream = BytesIO(b"[1, 2, 3" + b" " * 100 + b"]")
+    values = parse_stream(StreamParser(), stream, 4)
+    assert next(values) == 1
+    assert stream.tell() == 4
+
+
+@pytest.mark.asyncio
+async def test_async_parse_stream_reader() -> None:
+    reader = asyncio.StreamReader()
+    reader.feed_data(b"[1, 2,")
+    reader.feed_data(b" 3]")
+    reader.feed_eof()
+    assert [x async for x in async_parse_stream(StreamParser(), reader, 2)] == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_async_parse_stream_iterable() -> None:
+    async def chunks() -> AsyncIterator[bytes]:
+        yield b"[1, "
+        yield b"2]"
+
+    assert [x async for x in async_parse_stream(StreamParser(), chunks(), 2)] == [1, 2]
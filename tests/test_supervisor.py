@@ -0,0 +1,118 @@
+"""Test supervisor.py, by serving with workers in a subprocess."""
+from typing import Iterator, Set
+from urllib.request import urlopen
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from jsonrpcserver.supervisor import Supervisor
+
+# pylint: disable=missing-function-docstring
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="Needs os.fork")
+
+SERVER = """
+import logging, os, socket, sys
+from jsonrpcserver import Success, method, serve
+from jsonrpcserver.metrics import Metrics
+
+if sys.argv[1] == "inherit":
+    del socket.SO_REUSEPORT
+
+@method
+def pid():
+    return Success(os.getpid())
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout, format="%(message)s")
+serve("127.0.0.1", 0, workers=2, keep_alive_timeout=0.1, metrics=Metrics())
+"""
+
+
+def test_supervisor_workers() -> None:
+    with pytest.raises(ValueError):
+        Supervisor(0, lambda: None)
+
+
+@pytest.fixture(name="server", params=["reuse_port", "inherit"])
+def fixture_server(request: pytest.FixtureRequest) -> Iterator["subprocess.Popen[str]"]:
+    with subprocess.Popen(
+        [sys.executable, "-c", SERVER, request.param],
+        stdout=subprocess.PIPE,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ) as process:
+        try:
+            yield process
+        finally:
+            if process.poll() is None:
+                process.kill()
+
+
+def port_of(server: "subprocess.Popen[str]") -> int:
+    assert server.stdout is not None
+    line = server.stdout.readline()
+    assert "Listening on port" in line
+    return int(line.split()[-1])
+
+
+def pid(port: int) -> int:
+    body = json.dumps({"jsonrpc": "2.0", "method": "pid", "id": 1}).encode()
+    for _ in range(100):
+        try:
+            with urlopen(f"http://127.0.0.1:{port}", body, timeout=5) as response:
+                return int(json.loads(response.read())["result"])
+        except OSError:  # The workers haven't started listening yet
+            time.sleep(0.05)
+    raise AssertionError("No response")
+
+
+def pids(port: int, count: int = 40) -> Set[int]:
+    return {pid(port) for _ in range(count)}
+
+
+def wait_for_new(port: int, old: Set[int]) -> Set[int]:
+    for _ in range(100):
+        new = pids(port, 10) - old
+        if new:
+            return new
+        time.sleep(0.05)
+    raise AssertionError("No new worker")
+
+
+def test_serve_workers(server: "subprocess.Popen[str]") -> None:
+    port = port_of(server)
+    workers = pids(port)
+    assert 1 <= len(workers) <= 2
+    assert server.pid not in workers
+    # A worker that dies is restarted
+    os.kill(workers.pop(), signal.SIGKILL)
+    wait_for_new(port, workers)
+    # A reload replaces the workers
+    old = pids(port)
+    server.send_signal(signal.SIGHUP)
+    wait_for_new(port, old)
+    server.send_signal(signal.SIGTERM)
+    assert server.wait(10) == 0
+
+
+def requests_total(port: int) -> int:
+    with urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        for line in response.read().decode().splitlines():
+            if line.startswith('jsonrpc_requests_total{method="pid"}'):
+                return int(line.split()[-1])
+    return 0
+
+
+def test_serve_workers_metrics(server: "subprocess.Popen[str]") -> None:
+    port = port_of(server)
+    count = len([pid(port) for _ in range(40)])
+    time.sleep(1.5)  # For every worker to have written its counters
+    # Whichever worker answers, the metrics are those of both
+    assert {requests_total(port) for _ in range(10)} == {count}
+    server.send_signal(signal.SIGTERM)
+    assert server.wait(10) == 0
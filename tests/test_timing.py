@@ -0,0 +1,57 @@
+"""Test timing.py"""
+from typing import List, Optional, Tuple
+
+from oslash.either import Left, Right  # type: ignore
+
+from jsonrpcserver.result import ErrorResult, SuccessResult
+from jsonrpcserver.timing import (
+    error_code,
+    get_timing_hook,
+    set_timing_hook,
+    timed,
+)
+
+# pylint: disable=missing-function-docstring
+
+
+class Recorder:  # pylint: disable=too-few-public-methods
+    """A timing hook that records the stages, leaving out the times."""
+
+    def __init__(self) -> None:
+        self.stages: List[Tuple[str, Optional[str], Optional[int]]] = []
+
+    def __call__(
+        self, stage: str, seconds: float, method: Optional[str], code: Optional[int]
+    ) -> None:
+        assert seconds >= 0
+        self.stages.append((stage, method, code))
+
+
+def test_error_code() -> None:
+    assert error_code(Left(ErrorResult(1, "foo"))) == 1
+    assert error_code(Right(SuccessResult("foo"))) is None
+    assert error_code("foo") is None
+
+
+def test_timed() -> None:
+    hook = Recorder()
+    assert timed(hook, "call", "foo", abs, -1) == 1
+    assert hook.stages == [("call", "foo", None)]
+
+
+def test_timed_error() -> None:
+    hook = Recorder()
+    timed(hook, "call", "foo", Left, ErrorResult(1, "foo"))
+    assert hook.stages == [("call", "foo", 1)]
+
+
+def test_set_timing_hook() -> None:
+    hook, other = Recorder(), Recorder()
+    assert get_timing_hook() is None
+    set_timing_hook(hook)
+    try:
+        assert get_timing_hook() is hook
+        assert get_timing_hook(other) is other
+    finally:
+        set_timing_hook(None)
+    assert get_timing_hook() is None
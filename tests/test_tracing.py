@@ -0,0 +1,97 @@
+"""Test tracing.py"""
+from oslash.either import Left, Right  # type: ignore
+
+from jsonrpcserver.request import Request
+from jsonrpcserver.result import ErrorResult, SuccessResult
+from jsonrpcserver.sentinels import NOID
+from jsonrpcserver.tracing import (
+    ATTRIBUTE_BATCH_INDEX,
+    ATTRIBUTE_BATCH_SIZE,
+    ATTRIBUTE_ERROR_CODE,
+    ATTRIBUTE_METHOD,
+    ATTRIBUTE_REQUEST_ID,
+    ATTRIBUTE_SYSTEM,
+    BATCH_SPAN,
+    MemoryTracer,
+    extract_context,
+    set_result,
+    start_batch_span,
+    start_call_span,
+)
+
+# pylint: disable=missing-function-docstring
+
+
+def test_extract_context() -> None:
+    request = Request("foo", {"a": 1, "_trace": "ctx"}, 1)
+    assert extract_context(MemoryTracer(), "_trace", request) == (
+        Request("foo", {"a": 1}, 1),
+        "ctx",
+    )
+    # The request's params aren't changed
+    assert request.params == {"a": 1, "_trace": "ctx"}
+
+
+def test_extract_context_no_field() -> None:
+    request = Request("foo", {"_trace": "ctx"}, 1)
+    assert extract_context(MemoryTracer(), None, request) == (request, None)
+
+
+def test_extract_context_not_in_params() -> None:
+    request = Request("foo", {"a": 1}, 1)
+    assert extract_context(MemoryTracer(), "_trace", request) == (request, None)
+
+
+def test_extract_context_positional_params() -> None:
+    request = Request("foo", ["_trace"], 1)
+    assert extract_context(MemoryTracer(), "_trace", request) == (request, None)
+
+
+def test_start_call_span() -> None:
+    tracer = MemoryTracer()
+    start_call_span(tracer, Request("foo", [], 1), "parent", None)
+    span = tracer.spans[0]
+    assert span.name == "foo"
+    assert span.parent == "parent"
+    assert span.attributes == {
+        ATTRIBUTE_SYSTEM: "jsonrpc",
+        ATTRIBUTE_METHOD: "foo",
+        ATTRIBUTE_REQUEST_ID: 1,
+    }
+    assert span.ended is False
+
+
+def test_start_call_span_notification_in_batch() -> None:
+    tracer = MemoryTracer()
+    start_call_span(tracer, Request("foo", [], NOID), None, 2)
+    span = tracer.spans[0]
+    assert span.attributes == {
+        ATTRIBUTE_SYSTEM: "jsonrpc",
+        ATTRIBUTE_METHOD: "foo",
+        ATTRIBUTE_BATCH_INDEX: 2,
+    }
+
+
+def test_start_batch_span() -> None:
+    tracer = MemoryTracer()
+    start_batch_span(tracer, 3)
+    span = tracer.spans[0]
+    assert span.name == BATCH_SPAN
+    assert span.parent is None
+    assert span.attributes == {ATTRIBUTE_SYSTEM: "jsonrpc", ATTRIBUTE_BATCH_SIZE: 3}
+
+
+def test_set_result() -> None:
+    tracer = MemoryTracer()
+    success = tracer.start_span("foo", None, {})
+    error = tracer.start_span("foo", None, {})
+    set_result(success, Right(SuccessResult("foo")))
+    set_result(error, Left(ErrorResult(-1, "foo")))
+    assert not success.attributes
+    assert error.attributes == {ATTRIBUTE_ERROR_CODE: -1}
+
+
+def test_memory_span_end() -> None:
+    span = MemoryTracer().start_span("foo", None, {})
+    span.end()
+    assert span.ended is True
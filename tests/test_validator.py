@@ -0,0 +1,86 @@
+"""Test validator.py
+
+The conformance tests run the same corpus through the fast validator and the jsonschema
+validator, and expect them to agree.
+"""
+from decimal import Decimal
+from typing import Any, Callable, List
+import pytest
+
+from jsonrpcserver.main import strict_validator
+from jsonrpcserver.validator import validate
+
+# pylint: disable=missing-function-docstring
+
+VALUES: List[Any] = [None, True, False, 0, 1, -1.5, Decimal("1.5"), "", "2.0", "foo"]
+VALUES += [[], [1], {}, {"foo": "bar"}]
+
+VALID: List[Any] = [
+    {"jsonrpc": "2.0", "method": "ping"},
+    {"jsonrpc": "2.0", "method": "ping", "id": 1},
+    {"jsonrpc": "2.0", "method": "ping", "id": "abc"},
+    {"jsonrpc": "2.0", "method": "ping", "id": None},
+    {"jsonrpc": "2.0", "method": "ping", "id": 1.5},
+    {"jsonrpc": "2.0", "method": "ping", "params": []},
+    {"jsonrpc": "2.0", "method": "ping", "params": {}},
+    {"jsonrpc": "2.0", "method": "ping", "params": [1, 2], "id": 1},
+    {"jsonrpc": "2.0", "method": "ping", "params": {"foo": "bar"}, "id": 1},
+    [{"jsonrpc": "2.0", "method": "ping"}],
+    [{"jsonrpc": "2.0", "method": "ping", "id": 1}, {"jsonrpc": "2.0", "method": "a"}],
+]
+
+INVALID: List[Any] = [
+    {},
+    [],
+    [[]],
+    "",
+    1,
+    None,
+    {"jsonrpc": "2.0"},
+    {"method": "ping"},
+    {"jsonrpc": "1.0", "method": "ping"},
+    {"jsonrpc": 2.0, "method": "ping"},
+    {"jsonrpc": "2.0", "method": 1},
+    {"jsonrpc": "2.0", "method": "ping", "id": True},
+    {"jsonrpc": "2.0", "method": "ping", "id": []},
+    {"jsonrpc": "2.0", "method": "ping", "id": {}},
+    {"jsonrpc": "2.0", "method": "ping", "params": "foo"},
+    {"jsonrpc": "2.0", "method": "ping", "params": None},
+    {"jsonrpc": "2.0", "method": "ping", "foo": "bar"},
+    [{"jsonrpc": "2.0", "method": "ping"}, {"jsonrpc": "2.0"}],
+    [{"jsonrpc": "2.0", "method": "ping"}, 1],
+    [[{"jsonrpc": "2.0", "method": "ping"}]],
+]
+
+# Every value in every member of a request
+GENERATED: List[Any] = [
+    {"jsonrpc": "2.0", "method": "ping", key: value}
+    for key in ("jsonrpc", "method", "params", "id")
+    for value in VALUES
+]
+
+CORPUS = VALID + INVALID + GENERATED + [[request] for request in GENERATED]
+
+
+def is_valid(validator: Callable[[Any], Any], request: Any) -> bool:
+    try:
+        validator(request)
+    except Exception:  # pylint: disable=broad-except
+        return False
+    return True
+
+
+@pytest.mark.parametrize("request_", VALID)
+def test_validate_valid(request_: Any) -> None:
+    assert validate(request_) is request_
+
+
+@pytest.mark.parametrize("request_", INVALID)
+def test_validate_invalid(request_: Any) -> None:
+    with pytest.raises(ValueError):
+        validate(request_)
+
+
+@pytest.mark.parametrize("request_", CORPUS)
+def test_conformance(request_: Any) -> None:
+    assert is_valid(validate, request_) == is_valid(strict_validator, request_)